@@ -0,0 +1,148 @@
+"""
+Async micro-batching for DentalChat AI Automation
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Generic, List, Optional, Set, Tuple, TypeVar
+
+from utils import performance_monitor
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+class _LoopState:
+    """Waiting items and dispatch bookkeeping for one event loop"""
+    __slots__ = ('pending', 'in_flight', 'flush_handle', 'tasks')
+    
+    def __init__(self):
+        self.pending: List[Tuple[object, asyncio.Future]] = []
+        self.in_flight = 0
+        self.flush_handle: Optional[asyncio.Handle] = None
+        # The loop only keeps weak references to tasks, so running batches are held here
+        self.tasks: Set[asyncio.Task] = set()
+    
+    def is_idle(self) -> bool:
+        return not self.pending and not self.in_flight and self.flush_handle is None
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Coalesce requests from many sessions into batch calls
+    
+    Callers await submit(item) and get back their own result. A batch is
+    dispatched as soon as max_batch_size items are waiting. Otherwise:
+    
+    - With max_in_flight > 0 (adaptive), waiting items are spread over the
+      free slots on the next loop iteration while fewer than max_in_flight
+      batches are running, so under light load every request goes out on
+      its own without delay. Once that many are running, new items queue up
+      and go out together when a batch finishes. Batches grow only when the
+      backend is saturated.
+    - With max_in_flight = 0, the first waiting item starts a
+      max_wait_seconds timer and everything that arrives before it fires
+      shares one batch.
+    
+    Batches are kept per event loop, since futures cannot be shared across
+    loops (the Streamlit AsyncRunner loop and an ASGI server loop may both
+    use the same batcher). A loop's state is dropped once it has nothing
+    waiting or running, so closed loops are not kept alive.
+    """
+    
+    def __init__(self, process_batch: Callable[[List[T]], Awaitable[List[R]]],
+                 max_batch_size: int, max_wait_seconds: float, max_in_flight: int = 0,
+                 name: str = "batch"):
+        """
+        Args:
+            process_batch: Coroutine that takes a list of items and returns one
+                result per item, in the same order
+            max_batch_size: Dispatch as soon as this many items are waiting
+            max_wait_seconds: Batching window when max_in_flight is 0
+            max_in_flight: Batches allowed to run at once before items queue up
+            name: Prefix for the recorded metrics
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_seconds = max_wait_seconds
+        self.max_in_flight = max(0, max_in_flight)
+        self.name = name
+        
+        self._states: Dict[asyncio.AbstractEventLoop, _LoopState] = {}
+    
+    async def submit(self, item: T) -> R:
+        """
+        Queue one item and wait for its result
+        
+        Raises:
+            Whatever process_batch raised for the batch this item was in
+        """
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None:
+            state = self._states.setdefault(loop, _LoopState())
+        
+        future = loop.create_future()
+        state.pending.append((item, future))
+        
+        if len(state.pending) >= self.max_batch_size:
+            self._dispatch(loop, state)
+        elif state.flush_handle is None:
+            if not self.max_in_flight:
+                state.flush_handle = loop.call_later(self.max_wait_seconds, self._dispatch, loop, state)
+            elif state.in_flight < self.max_in_flight:
+                # Items submitted in the same loop iteration still share a batch
+                state.flush_handle = loop.call_soon(self._dispatch, loop, state)
+        
+        return await future
+    
+    def _dispatch(self, loop: asyncio.AbstractEventLoop, state: _LoopState):
+        """Send waiting items out in batches of at most max_batch_size"""
+        if state.flush_handle is not None:
+            state.flush_handle.cancel()
+            state.flush_handle = None
+        
+        while state.pending:
+            size = self.max_batch_size
+            if self.max_in_flight:
+                # Spread waiting items over the free slots so only the excess is
+                # batched; a full batch always goes out, a partial one waits
+                free_slots = self.max_in_flight - state.in_flight
+                if free_slots <= 0 and len(state.pending) < self.max_batch_size:
+                    break
+                size = min(self.max_batch_size, -(-len(state.pending) // max(free_slots, 1)))
+            
+            batch = state.pending[:size]
+            del state.pending[:size]
+            state.in_flight += 1
+            task = loop.create_task(self._run_batch(loop, state, batch))
+            state.tasks.add(task)
+            task.add_done_callback(state.tasks.discard)
+    
+    async def _run_batch(self, loop: asyncio.AbstractEventLoop, state: _LoopState,
+                         batch: List[Tuple[T, asyncio.Future]]):
+        items = [item for item, _ in batch]
+        performance_monitor.observe(f"{self.name}_size", len(items))
+        
+        try:
+            results = await self.process_batch(items)
+            if len(results) != len(items):
+                raise ValueError(f"{self.name}: expected {len(items)} results, got {len(results)}")
+        except Exception as e:
+            logger.warning(f"{self.name} of {len(items)} failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            state.in_flight -= 1
+            if self.max_in_flight and state.pending and state.flush_handle is None:
+                self._dispatch(loop, state)
+            if state.is_idle() and self._states.get(loop) is state:
+                del self._states[loop]
+    
+    def pending_count(self) -> int:
+        """Number of items waiting to be dispatched, across all loops"""
+        return sum(len(state.pending) for state in self._states.values())
@@ -0,0 +1,133 @@
+"""
+Exercise DentalChatAPI against the local stub server
+
+Scenarios: a healthy backend under concurrency, a flaky backend (retries),
+a slow backend (read timeout) and a backend that goes away (circuit breaker).
+
+Run from the repository root:
+    python -m benchmarks.bench_dentalchat_client
+"""
+import asyncio
+import socket
+import statistics
+import threading
+import time
+from typing import List, Tuple
+
+import uvicorn
+
+from benchmarks.stub_dentalchat import StubSettings, create_stub_app
+from config import Config
+from dentalchat_api import DentalChatAPI
+from models import APIResponse
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class StubServer:
+    """Run the stub app in a background thread"""
+    
+    def __init__(self, port: int):
+        self.app = create_stub_app(StubSettings())
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=port, log_level="error"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+    
+    @property
+    def settings(self) -> StubSettings:
+        return self.app.state.settings
+    
+    def start(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+    
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join()
+
+def build_client(port: int, **overrides) -> DentalChatAPI:
+    Config.DENTALCHAT_BASE_URL = f"http://127.0.0.1:{port}"
+    # Every call should reach the stub
+    Config.DENTIST_CACHE_ENABLED = False
+    for name, value in overrides.items():
+        setattr(Config, name, value)
+    return DentalChatAPI()
+
+async def timed_calls(client: DentalChatAPI, count: int, concurrency: int) -> Tuple[List[APIResponse], List[float]]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    
+    async def one() -> APIResponse:
+        async with semaphore:
+            start = time.perf_counter()
+            result = await client.aget_nearby_dentists("75201")
+            latencies.append(time.perf_counter() - start)
+            return result
+    
+    results = await asyncio.gather(*(one() for _ in range(count)))
+    return results, latencies
+
+def report(name: str, results: List[APIResponse], latencies: List[float]):
+    ok = sum(result.success for result in results)
+    circuit_open = sum(result.error == "CIRCUIT_OPEN" for result in results)
+    ordered = sorted(latencies)
+    p95 = ordered[int(0.95 * (len(ordered) - 1))]
+    print(f"  {name:<34} ok {ok:>4}/{len(results):<4} fast-failed {circuit_open:>4}  "
+          f"p50 {statistics.median(latencies) * 1e3:7.1f} ms  p95 {p95 * 1e3:7.1f} ms")
+
+async def main_async():
+    port = free_port()
+    stub = StubServer(port)
+    stub.start()
+    
+    try:
+        print("Healthy backend, 20 ms latency, 500 calls")
+        stub.settings.latency = 0.02
+        for concurrency in (1, 20, 100):
+            client = build_client(port, DENTALCHAT_MAX_RETRIES=2)
+            start = time.perf_counter()
+            results, latencies = await timed_calls(client, 500 if concurrency > 1 else 50, concurrency)
+            report(f"concurrency {concurrency} ({len(results) / (time.perf_counter() - start):.0f} req/s)",
+                   results, latencies)
+            await client.aclose()
+        
+        print("\nFlaky backend, 30% of responses are 503")
+        stub.settings.failure_rate = 0.3
+        for retries in (0, 2):
+            client = build_client(port, DENTALCHAT_MAX_RETRIES=retries, DENTALCHAT_CIRCUIT_FAILURE_THRESHOLD=50)
+            results, latencies = await timed_calls(client, 300, 20)
+            report(f"max_retries={retries}", results, latencies)
+            await client.aclose()
+        stub.settings.failure_rate = 0.0
+        
+        print("\nSlow backend, 2 s per response, 0.3 s read timeout")
+        stub.settings.latency = 2.0
+        client = build_client(port, DENTALCHAT_READ_TIMEOUT=0.3, DENTALCHAT_MAX_RETRIES=1,
+                              DENTALCHAT_CIRCUIT_FAILURE_THRESHOLD=1000)
+        results, latencies = await timed_calls(client, 20, 20)
+        report("read timeout with one retry", results, latencies)
+        await client.aclose()
+        stub.settings.latency = 0.02
+        
+        print("\nBackend down (every response is 503)")
+        stub.settings.down = True
+        client = build_client(port, DENTALCHAT_READ_TIMEOUT=10, DENTALCHAT_MAX_RETRIES=2,
+                              DENTALCHAT_CIRCUIT_FAILURE_THRESHOLD=5)
+        results, latencies = await timed_calls(client, 200, 1)
+        report("circuit breaker, threshold 5", results, latencies)
+        
+        stub.settings.down = False
+        client.circuit_breaker.reset_timeout = 0
+        results, latencies = await timed_calls(client, 20, 1)
+        report("after recovery (half-open probe)", results, latencies)
+        await client.aclose()
+    finally:
+        stub.stop()
+
+def main():
+    asyncio.run(main_async())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark: nearby dentist search with and without the coalescing cache
+
+Patients are spread over ZIP codes with a Zipf-like skew (a few busy metro
+ZIPs, a long tail) and search concurrently against the stub server. Reports
+backend requests, latency percentiles and the cache counters, then checks
+that a hot ZIP past its TTL is served stale instead of waiting on a refresh.
+
+Run from the repository root:
+    python -m benchmarks.bench_dentist_cache
+"""
+import asyncio
+import random
+import statistics
+import time
+from typing import List
+
+from benchmarks.bench_dentalchat_client import StubServer, free_port
+from config import Config
+from dentalchat_api import DentalChatAPI
+
+ZIP_CODES = [f"{75000 + index:05d}" for index in range(500)]
+ZIP_WEIGHTS = [1 / (rank + 1) for rank in range(len(ZIP_CODES))]
+
+def build_client(port: int, cache_enabled: bool, ttl_seconds: float = 300.0) -> DentalChatAPI:
+    Config.DENTALCHAT_BASE_URL = f"http://127.0.0.1:{port}"
+    Config.DENTIST_CACHE_ENABLED = cache_enabled
+    Config.DENTIST_CACHE_TTL_SECONDS = ttl_seconds
+    return DentalChatAPI()
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+async def run(client: DentalChatAPI, zips: List[str], concurrency: int) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    
+    async def one(zip_code: str):
+        async with semaphore:
+            start = time.perf_counter()
+            result = await client.aget_nearby_dentists(zip_code)
+            assert result.success, result.error
+            latencies.append(time.perf_counter() - start)
+    
+    await asyncio.gather(*(one(zip_code) for zip_code in zips))
+    return latencies
+
+async def main_async():
+    port = free_port()
+    stub = StubServer(port)
+    stub.start()
+    stub.settings.latency = 0.05
+    
+    random.seed(7)
+    zips = random.choices(ZIP_CODES, weights=ZIP_WEIGHTS, k=5000)
+    concurrency = 200
+    
+    print(f"{len(zips)} searches over {len(set(zips))} ZIP codes, {concurrency} concurrent, "
+          f"backend latency {stub.settings.latency * 1e3:.0f} ms\n")
+    print(f"{'cache':>6} {'backend':>8} {'p50 ms':>8} {'p99 ms':>8}  counters")
+    
+    try:
+        for cache_enabled in (False, True):
+            client = build_client(port, cache_enabled)
+            before = stub.app.state.request_count
+            latencies = await run(client, zips, concurrency)
+            backend = stub.app.state.request_count - before
+            
+            counters = ""
+            if client.dentist_cache is not None:
+                stats = client.dentist_cache.get_stats()
+                counters = (f"hits {stats['hits']}, misses {stats['misses']}, "
+                            f"coalesced {stats['coalesced']}")
+            print(f"{'on' if cache_enabled else 'off':>6} {backend:>8} "
+                  f"{statistics.median(latencies) * 1e3:>8.1f} {percentile(latencies, 99) * 1e3:>8.1f}  {counters}")
+            await client.aclose()
+        
+        # Hot ZIP past its TTL: lookups return the stale value, one refresh goes out
+        client = build_client(port, cache_enabled=True, ttl_seconds=0.1)
+        await client.aget_nearby_dentists(ZIP_CODES[0])
+        await asyncio.sleep(0.2)
+        before = stub.app.state.request_count
+        latencies = await run(client, [ZIP_CODES[0]] * 500, concurrency)
+        await asyncio.sleep(stub.settings.latency * 2)
+        stats = client.dentist_cache.get_stats()
+        print(f"\nstale hot ZIP: 500 lookups, max {max(latencies) * 1e3:.1f} ms, "
+              f"backend requests {stub.app.state.request_count - before}, "
+              f"stale hits {stats['stale_hits']}, refreshes {stats['refreshes']}")
+        await client.aclose()
+    finally:
+        stub.stop()
+
+def main():
+    asyncio.run(main_async())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark: per-message extraction calls vs cross-session micro-batching
+
+Runs the LLM path of PatientDataExtractor.aextract_turn against FakeChatModel
+at increasing concurrency and reports throughput and latency percentiles.
+The fake model has a fixed time to first token, a per-token decode time and
+a cap on in-flight requests, which is what makes batching pay off.
+
+Run from the repository root:
+    python -m benchmarks.bench_extraction_batching
+"""
+import asyncio
+import os
+import statistics
+import time
+from typing import List
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from batching import MicroBatcher
+from config import Config
+from data_extractor import PatientDataExtractor
+from fake_llm import FakeChatModel
+from models import PatientInfo
+
+MESSAGES = [
+    "My name is Dana Smith and my back tooth has been throbbing all week",
+    "I chipped my front tooth biting into something hard last night",
+    "There's a dull ache in my lower jaw whenever I chew on that side",
+    "My gums keep bleeding when I brush and they look a bit swollen",
+    "I think I lost a filling, the tooth is really sensitive to cold now"
+]
+
+# Provider-side cap on concurrent requests
+FAKE_MAX_CONCURRENCY = 64
+
+def build_extractor(mode: str, max_batch_size: int, max_wait_ms: float, max_in_flight: int) -> PatientDataExtractor:
+    """Extractor whose extraction chains run on the fake model"""
+    Config.EXTRACTION_CACHE_ENABLED = False
+    extractor = PatientDataExtractor()
+    
+    fake = FakeChatModel(base_latency=0.35, per_token_latency=0.004, jitter=0.15,
+                         max_concurrency=FAKE_MAX_CONCURRENCY)
+    extractor.scoped_extraction_chain = extractor.scoped_extraction_prompt | fake
+    extractor.batch_extraction_chain = extractor.batch_extraction_prompt | fake
+    
+    extractor.batcher = None
+    if mode != "single":
+        extractor.batcher = MicroBatcher(
+            extractor._aextract_batch,
+            max_batch_size=max_batch_size,
+            max_wait_seconds=max_wait_ms / 1000,
+            max_in_flight=max_in_flight if mode == "adaptive" else 0,
+            name="extraction_batch"
+        )
+    return extractor
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def run(extractor: PatientDataExtractor, concurrency: int, turns_per_session: int):
+    """Each simulated session sends its messages one after another"""
+    latencies: List[float] = []
+    
+    async def session(session_index: int):
+        for turn in range(turns_per_session):
+            message = MESSAGES[(session_index + turn) % len(MESSAGES)]
+            start = time.perf_counter()
+            _, stats = await extractor.aextract_turn(message, PatientInfo(), None)
+            assert not stats["llm_skipped"]
+            latencies.append(time.perf_counter() - start)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(session(index) for index in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, latencies
+
+async def main_async():
+    max_batch_size = Config.EXTRACTION_BATCH_MAX_SIZE
+    max_wait_ms = Config.EXTRACTION_BATCH_MAX_WAIT_MS
+    # Adaptive batching works best with the cap set to what the provider allows
+    max_in_flight = FAKE_MAX_CONCURRENCY
+    turns_per_session = 3
+    
+    print(f"batch size <= {max_batch_size}; windowed waits {max_wait_ms:.0f} ms; "
+          f"adaptive batches past {max_in_flight} in-flight calls; "
+          f"fake model limited to {FAKE_MAX_CONCURRENCY} in-flight calls\n")
+    print(f"{'sessions':>8} {'mode':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    
+    for concurrency in (1, 16, 64, 256, 1024):
+        for mode in ("single", "windowed", "adaptive"):
+            extractor = build_extractor(mode, max_batch_size, max_wait_ms, max_in_flight)
+            throughput, latencies = await run(extractor, concurrency, turns_per_session)
+            print(f"{concurrency:>8} {mode:>9} {throughput:>8.1f} "
+                  f"{statistics.median(latencies) * 1e3:>8.0f} "
+                  f"{percentile(latencies, 95) * 1e3:>8.0f} "
+                  f"{percentile(latencies, 99) * 1e3:>8.0f}")
+
+def main():
+    asyncio.run(main_async())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Benchmark: scripted patient intakes through ConversationManager
+
+Runs complete intakes (greeting to posted) on the fake chat model and the
+mock DentalChat API at several concurrency levels, and reports turns per
+second, per-stage latency percentiles and memory per session. No API key
+or network is needed, and with a fixed seed the fake model's answers and
+latencies repeat from run to run, so the numbers can be compared across
+commits:
+    
+    python -m benchmarks.bench_intake
+    python -m benchmarks.bench_intake --pipeline combined --stream --output before.json
+
+Stages: extraction (aextract_turn, or aextract_and_reply in the combined
+pipeline, which also writes the reply), reply (the chat chain), question
+(the follow-up question generator) and post (post creation and the dentist
+lookup).
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Any, Dict, List
+
+# Settings the modules below read at import time
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("FAKE_LLM_SEED", "0")
+os.environ.setdefault("FAKE_LLM_BASE_LATENCY", "0.05")
+os.environ.setdefault("FAKE_LLM_PER_TOKEN_LATENCY", "0.001")
+os.environ.setdefault("FAKE_LLM_LATENCY_DISTRIBUTION", "lognormal")
+os.environ.setdefault("POST_OUTBOX_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench_outbox.db"))
+
+from chat_agent import ConversationManager
+from config import Config
+
+# Each script is one patient; messages are sent until the intake completes
+SCRIPTS = [
+    [
+        "Hi, my back tooth has been throbbing since yesterday and the pain is about 7 out of 10",
+        "My name is Dana Smith",
+        "75201",
+        "You can reach me at dana.smith@example.com or 214-555-0123"
+    ],
+    [
+        "I chipped my front tooth biting into something hard last night",
+        "It's maybe a 4, not too bad",
+        "My name is Luis Ortega",
+        "77002",
+        "luis.ortega@example.com"
+    ],
+    [
+        "My gums keep bleeding when I brush and they look swollen. It started a week ago",
+        "I am Grace Lee",
+        "My zip is 10001 and my phone is 212-555-0199"
+    ]
+]
+
+class TimedRunnable:
+    """Stand-in for a chain that records how long each call takes"""
+    
+    def __init__(self, runnable, timings: List[float]):
+        self.runnable = runnable
+        self.timings = timings
+    
+    async def ainvoke(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await self.runnable.ainvoke(*args, **kwargs)
+        finally:
+            self.timings.append(time.perf_counter() - start)
+    
+    async def astream(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            async for chunk in self.runnable.astream(*args, **kwargs):
+                yield chunk
+        finally:
+            self.timings.append(time.perf_counter() - start)
+
+def time_method(owner: Any, name: str, timings: List[float]):
+    """Replace an async method on one instance with a timed wrapper"""
+    method = getattr(owner, name)
+    
+    async def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            timings.append(time.perf_counter() - start)
+    
+    setattr(owner, name, timed)
+
+def instrument(manager: ConversationManager) -> Dict[str, List[float]]:
+    stages: Dict[str, List[float]] = defaultdict(list)
+    agent = manager.agent
+    time_method(agent.data_extractor, "aextract_turn", stages["extraction"])
+    time_method(agent.data_extractor, "aextract_and_reply", stages["extraction"])
+    time_method(agent.question_generator, "agenerate_follow_up_question", stages["question"])
+    time_method(agent, "_create_post_and_finish", stages["post"])
+    agent.chain = TimedRunnable(agent.chain, stages["reply"])
+    return stages
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+async def run_intake(manager: ConversationManager, script: List[str], stream: bool,
+                     turn_latencies: List[float]) -> bool:
+    session_id, _ = manager.create_session()
+    for message in script:
+        start = time.perf_counter()
+        if stream:
+            async for _ in manager.astream_message(session_id, message):
+                pass
+            complete = manager.is_session_complete(session_id)
+        else:
+            _, complete = await manager.asend_message(session_id, message)
+        turn_latencies.append(time.perf_counter() - start)
+        if complete:
+            return True
+    return False
+
+async def run_level(concurrency: int, intakes_per_session: int, stream: bool) -> Dict[str, Any]:
+    manager = ConversationManager()
+    stages = instrument(manager)
+    turn_latencies: List[float] = []
+    
+    # One untimed intake first, so imports and first-use caches are not
+    # counted against the sessions being measured
+    await run_intake(manager, SCRIPTS[0], stream, [])
+    for values in stages.values():
+        values.clear()
+    
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    
+    async def patient(index: int) -> int:
+        completed = 0
+        for round_index in range(intakes_per_session):
+            script = SCRIPTS[(index + round_index) % len(SCRIPTS)]
+            completed += await run_intake(manager, script, stream, turn_latencies)
+        return completed
+    
+    start = time.perf_counter()
+    completed = sum(await asyncio.gather(*(patient(index) for index in range(concurrency))))
+    elapsed = time.perf_counter() - start
+    
+    # Let late follow-ups land before measuring what the sessions hold on to
+    await asyncio.sleep(Config.COMPLETION_GRACE_SECONDS)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    
+    sessions = concurrency * intakes_per_session
+    outbox_worker = manager.agent.outbox_worker
+    if outbox_worker is not None:
+        await outbox_worker.stop()
+    
+    return {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "completed": completed,
+        "turns": len(turn_latencies),
+        "turns_per_second": len(turn_latencies) / elapsed,
+        "turn_ms": summarize(turn_latencies),
+        "stages_ms": {name: summarize(values) for name, values in stages.items() if values},
+        "memory_per_session_kb": retained / sessions / 1024
+    }
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "p50": statistics.median(values) * 1e3,
+        "p95": percentile(values, 95) * 1e3,
+        "p99": percentile(values, 99) * 1e3
+    }
+
+def report(result: Dict[str, Any]):
+    print(f"\nconcurrency {result['concurrency']}: {result['completed']}/{result['sessions']} intakes completed, "
+          f"{result['turns']} turns, {result['turns_per_second']:.1f} turns/s, "
+          f"{result['memory_per_session_kb']:.1f} KB retained per session")
+    print(f"  {'stage':<11} {'calls':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    rows = [("turn", result["turn_ms"])] + sorted(result["stages_ms"].items())
+    for name, stats in rows:
+        print(f"  {name:<11} {stats['count']:>6} {stats['p50']:>8.1f} {stats['p95']:>8.1f} {stats['p99']:>8.1f}")
+
+async def main_async(args):
+    Config.TURN_PIPELINE = args.pipeline
+    print(f"pipeline {args.pipeline}, {'streaming' if args.stream else 'non-streaming'}, "
+          f"fake model {Config.FAKE_LLM_LATENCY_DISTRIBUTION} latency around "
+          f"{Config.FAKE_LLM_BASE_LATENCY * 1e3:.0f} ms, seed {Config.FAKE_LLM_SEED}")
+    
+    results = []
+    for concurrency in args.concurrency:
+        result = await run_level(concurrency, args.intakes, args.stream)
+        report(result)
+        results.append(result)
+    
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump({"pipeline": args.pipeline, "stream": args.stream, "results": results}, handle, indent=2)
+        print(f"\nWrote {args.output}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Scripted intake throughput and latency benchmark")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--intakes", type=int, default=2, help="intakes run one after another by each patient")
+    parser.add_argument("--pipeline", choices=["legacy", "combined"], default=Config.TURN_PIPELINE)
+    parser.add_argument("--stream", action="store_true", help="use astream_message instead of asend_message")
+    parser.add_argument("--output", help="write the results as JSON for comparing runs")
+    args = parser.parse_args()
+    
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Benchmark: recording metrics from many threads and worker processes
+
+Threads hammer one counter, one observation and one stage histogram
+through three stores: a plain shared dict (the original PerformanceMonitor),
+the same dict behind a lock, and the per-thread shards in
+metrics.ShardedMetrics. Reports operations per second and how many
+increments went missing. Then several worker processes record into a
+shared directory and one reader checks that it sees the sum of all of them.
+
+Run from the repository root:
+    python -m benchmarks.bench_metrics
+    python -m benchmarks.bench_metrics --threads 1 8 32 --ops 100000
+"""
+import argparse
+import multiprocessing
+import sys
+import tempfile
+import threading
+import time
+
+from metrics import LatencyHistogram
+from utils import PerformanceMonitor
+
+class PlainMonitor:
+    """Unsynchronized shared dicts"""
+    
+    def __init__(self):
+        self.metrics = {'api_calls': 0}
+        self.observations = {}
+        self.histogram = LatencyHistogram(PerformanceMonitor.LATENCY_BUCKETS)
+    
+    def record(self, value: float):
+        self.metrics['api_calls'] += 1
+        stats = self.observations.setdefault('latency', {'count': 0, 'total': 0.0, 'max': 0.0})
+        stats['count'] += 1
+        stats['total'] += value
+        stats['max'] = max(stats['max'], value)
+        self.histogram.observe(value)
+    
+    def count(self) -> int:
+        return self.metrics['api_calls']
+
+class LockedMonitor(PlainMonitor):
+    """The same dicts behind one lock"""
+    
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+    
+    def record(self, value: float):
+        with self._lock:
+            super().record(value)
+
+class ShardedMonitor:
+    """PerformanceMonitor on per-thread shards"""
+    
+    def __init__(self):
+        self.monitor = PerformanceMonitor()
+    
+    def record(self, value: float):
+        self.monitor.increment_metric('api_calls')
+        self.monitor.observe('latency', value)
+        self.monitor.observe_latency('stage', value)
+    
+    def count(self) -> int:
+        return self.monitor.get_metrics()['api_calls']
+
+def run_threads(store, threads: int, ops: int) -> float:
+    barrier = threading.Barrier(threads + 1)
+    
+    def worker(seed: int):
+        value = 0.001 * (seed % 50 + 1)
+        barrier.wait()
+        for _ in range(ops):
+            store.record(value)
+    
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start
+
+def record_in_process(shared_dir: str, ops: int):
+    monitor = PerformanceMonitor(shared_dir=shared_dir, publish_interval=0.05)
+    for _ in range(ops):
+        monitor.increment_metric('api_calls')
+        monitor.observe_latency('stage', 0.02)
+    monitor.publish()
+
+def check_processes(processes: int, ops: int):
+    shared_dir = tempfile.mkdtemp(prefix="dentalchat-metrics-")
+    reader = PerformanceMonitor(shared_dir=shared_dir, publish_interval=0.05)
+    reader.increment_metric('api_calls')
+    
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=record_in_process, args=(shared_dir, ops)) for _ in range(processes)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+    
+    # Let the reader's cached view of the other processes expire
+    time.sleep(0.1)
+    expected = processes * ops + 1
+    seen = reader.get_metrics()['api_calls']
+    stage_count = reader.get_latency_summary()['stage']['count']
+    status = "ok" if seen == expected and stage_count == processes * ops else "MISMATCH"
+    print(f"\n{processes} processes x {ops} ops into {shared_dir}: "
+          f"reader sees {seen} of {expected} counts, {stage_count} stage timings ({status})")
+    return status == "ok"
+
+def main():
+    parser = argparse.ArgumentParser(description="Metrics recording throughput and correctness")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--ops", type=int, default=50000, help="records per thread")
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+    
+    # Switch threads often, as a busy server would, so unsynchronized updates collide
+    sys.setswitchinterval(1e-6)
+    
+    print(f"{'store':<10} {'threads':>7} {'ops/s':>12} {'lost':>8}")
+    for threads in args.threads:
+        for name, factory in (("plain", PlainMonitor), ("locked", LockedMonitor), ("sharded", ShardedMonitor)):
+            store = factory()
+            elapsed = run_threads(store, threads, args.ops)
+            total = threads * args.ops
+            print(f"{name:<10} {threads:>7} {total / elapsed:>12,.0f} {total - store.count():>8}")
+    
+    sys.setswitchinterval(0.005)
+    ok = check_processes(args.processes, args.ops)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
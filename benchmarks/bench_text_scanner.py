@@ -0,0 +1,122 @@
+"""
+Microbenchmark: TextScanner vs the previous per-pattern DataValidator scans
+
+Run from the repository root:
+    python -m benchmarks.bench_text_scanner
+"""
+import re
+import sys
+import time
+from typing import Callable, List, Optional, Tuple
+
+from text_scanner import (
+    COMPLETION_SIGNALS, EMERGENCY_KEYWORDS, PAIN_DESCRIPTIONS, text_scanner
+)
+
+# Previous implementations, kept here as the reference behaviour
+
+def legacy_pain_level(text: str) -> Optional[int]:
+    text_lower = text.lower()
+    for pattern in [r'pain.*?(\d{1,2})', r'(\d{1,2}).*?pain', r'(\d{1,2}).*?out.*?of.*?10',
+                    r'level.*?(\d{1,2})', r'scale.*?(\d{1,2})']:
+        match = re.search(pattern, text_lower)
+        if match:
+            level = int(match.group(1))
+            if 1 <= level <= 10:
+                return level
+    for description, level in PAIN_DESCRIPTIONS.items():
+        if description in text_lower:
+            return level
+    return None
+
+def legacy_emergency(text: str) -> bool:
+    text_lower = text.lower()
+    return any(keyword in text_lower for keyword in EMERGENCY_KEYWORDS)
+
+def legacy_time_frame(text: str) -> Optional[str]:
+    time_patterns = [
+        r'(\d+)\s*(day|week|month|year)s?\s*ago',
+        r'(yesterday|today|this morning|last night)',
+        r'since\s+(yesterday|today|this morning|last night)',
+        r'for\s+(\d+)\s*(day|week|month|year)s?',
+        r'started\s+(\d+)\s*(day|week|month|year)s?\s*ago'
+    ]
+    text_lower = text.lower()
+    for pattern in time_patterns:
+        match = re.search(pattern, text_lower)
+        if match:
+            return match.group(0)
+    return None
+
+def legacy_completion(text: str) -> bool:
+    text_lower = text.lower().strip()
+    return any(signal in text_lower for signal in COMPLETION_SIGNALS)
+
+def legacy_scan(text: str) -> Tuple:
+    return (legacy_pain_level(text), legacy_emergency(text),
+            legacy_time_frame(text), legacy_completion(text))
+
+def scanner_scan(text: str) -> Tuple:
+    return tuple(text_scanner.scan(text))
+
+TYPICAL_MESSAGES = [
+    "Hi, I have a really bad toothache on my lower left side",
+    "The pain is about an 8 out of 10",
+    "It started 3 days ago and it's getting worse",
+    "My gum is swollen and bleeding since yesterday",
+    "I'm in 94105",
+    "You can reach me at (415) 555-0123 or jane@example.com",
+    "I've had sensitivity for 2 weeks, maybe a mild 3",
+    "That's all, thanks!"
+]
+
+def pathological_messages(size: int) -> List[Tuple[str, str]]:
+    """Inputs that make the lazy .*? patterns backtrack"""
+    return [
+        ("digits without 'pain'", "1 " * size),
+        ("'1 out of' without 10", "1 out of " * (size // 4)),
+        ("'pain' without digits", "pain" + "a" * size),
+        ("'for' without a number", "for " * (size // 2)),
+        ("digits without a unit", "9 " * size + "ago")
+    ]
+
+def time_per_call(func: Callable[[str], Tuple], texts: List[str], repeat: int) -> float:
+    """Mean seconds per call over all texts"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            func(text)
+    return (time.perf_counter() - start) / (repeat * len(texts))
+
+def check_equivalence(texts: List[str]) -> int:
+    """Count texts where the scanner and the legacy functions disagree"""
+    mismatches = 0
+    for text in texts:
+        if legacy_scan(text) != scanner_scan(text):
+            mismatches += 1
+            print(f"  mismatch: {text[:60]!r}")
+    return mismatches
+
+def main():
+    print("Equivalence")
+    mismatches = check_equivalence(TYPICAL_MESSAGES + [text for _, text in pathological_messages(200)])
+    print(f"  {mismatches} mismatches")
+    
+    print("\nTypical messages (per message)")
+    legacy = time_per_call(legacy_scan, TYPICAL_MESSAGES, 2000)
+    scanner = time_per_call(scanner_scan, TYPICAL_MESSAGES, 2000)
+    print(f"  legacy  {legacy * 1e6:8.1f} us")
+    print(f"  scanner {scanner * 1e6:8.1f} us  ({legacy / scanner:.1f}x)")
+    
+    print("\nPathological inputs")
+    for size in (250, 500, 1000):
+        for name, text in pathological_messages(size):
+            legacy = time_per_call(legacy_scan, [text], 1)
+            scanner = time_per_call(scanner_scan, [text], 1)
+            print(f"  {name:<24} {len(text):>6} chars  legacy {legacy * 1e3:9.2f} ms"
+                  f"  scanner {scanner * 1e3:7.2f} ms")
+    
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+Local stand-in for the DentalChat REST API
+
+Serves the endpoints DentalChatAPI calls, with configurable latency and
+failure injection, so the client's pooling, retries and circuit breaker can
+be exercised without the real service:
+    
+    python -m benchmarks.stub_dentalchat --port 8765 --latency 0.05 --failure-rate 0.3
+
+Point the client at it with DENTALCHAT_BASE_URL=http://127.0.0.1:8765.
+"""
+import argparse
+import asyncio
+import random
+import uuid
+from dataclasses import dataclass
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+@dataclass
+class StubSettings:
+    """Behaviour knobs; change them on app.state.settings while the server runs"""
+    latency: float = 0.0
+    failure_rate: float = 0.0
+    failure_status: int = 503
+    down: bool = False
+    fail_next: int = 0  # Fail this many upcoming requests, then recover
+
+def create_stub_app(settings: StubSettings = None) -> FastAPI:
+    app = FastAPI(title="DentalChat stub")
+    app.state.settings = settings or StubSettings()
+    app.state.request_count = 0
+    
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        current: StubSettings = app.state.settings
+        app.state.request_count += 1
+        if current.latency:
+            await asyncio.sleep(current.latency)
+        if current.fail_next > 0:
+            current.fail_next -= 1
+            return JSONResponse({"error": "stub failure"}, status_code=current.failure_status)
+        if current.down or random.random() < current.failure_rate:
+            return JSONResponse({"error": "stub failure"}, status_code=current.failure_status)
+        return await call_next(request)
+    
+    @app.post("/patient/create-post", status_code=201)
+    async def create_post(payload: dict):
+        post_id = uuid.uuid4().hex[:8]
+        return {
+            "post_id": post_id,
+            "post_url": f"https://dentalchat.example/post/{post_id}",
+            "estimated_response_time": "1-2 hours"
+        }
+    
+    @app.get("/dentists/search")
+    async def search(zip_code: str, emergency: bool = False, radius: int = 25, limit: int = 10):
+        return {"dentists": [
+            {"name": f"Dr. Stub {index}", "distance": f"{index + 1}.0 miles", "emergency_hours": emergency}
+            for index in range(min(limit, 3))
+        ]}
+    
+    @app.get("/patient/post/{post_id}")
+    async def post_status(post_id: str):
+        return {"post_id": post_id, "status": "active", "responses": 0, "views": 0}
+    
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--failure-status", type=int, default=503)
+    args = parser.parse_args()
+    
+    settings = StubSettings(latency=args.latency, failure_rate=args.failure_rate,
+                            failure_status=args.failure_status)
+    uvicorn.run(create_stub_app(settings), host="127.0.0.1", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+In-process caches for DentalChat AI Automation
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+import logging
+
+logger = logging.getLogger(__name__)
+
+V = TypeVar("V")
+
+class LRUCache:
+    """
+    Thread-safe bounded cache with LRU eviction and an optional TTL
+    """
+    
+    _MISSING = object()
+    
+    def __init__(self, max_size: int, ttl_seconds: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        
+        # key -> (value, stored_at)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0
+        }
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a cached value, or default if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key, self._MISSING)
+            if entry is self._MISSING:
+                self._stats['misses'] += 1
+                return default
+            
+            value, stored_at = entry
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return default
+            
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+    
+    def set(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entries if full"""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+    
+    def delete(self, key: Hashable) -> bool:
+        """Remove a value, returning True if it was cached"""
+        with self._lock:
+            return self._entries.pop(key, self._MISSING) is not self._MISSING
+    
+    def clear(self):
+        """Remove all values"""
+        with self._lock:
+            self._entries.clear()
+    
+    def get_stats(self) -> Dict[str, float]:
+        """Get hit, miss and eviction counters plus the current size and hit rate"""
+        with self._lock:
+            stats = self._stats.copy()
+            stats['size'] = len(self._entries)
+        
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SingleFlightCache:
+    """
+    Async read-through cache with request coalescing and stale-while-revalidate
+    
+    A value is fresh for ttl_seconds. For stale_seconds after that, a lookup
+    returns the old value at once and starts one background refresh, so a
+    hot key never waits on its loader. Concurrent misses for a key share a
+    single load instead of each calling the backend. Failed loads, and
+    values rejected by `cacheable`, are not stored; a stale value is kept.
+    
+    Loads in flight are tracked per event loop, since a task cannot be
+    awaited from another loop.
+    """
+    
+    def __init__(self, max_size: int, ttl_seconds: float, stale_seconds: float = 0.0):
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        
+        # key -> (value, loaded_at); expires once it is too stale to serve
+        self._entries = LRUCache(max_size=max_size, ttl_seconds=ttl_seconds + stale_seconds)
+        self._in_flight: Dict[Tuple[asyncio.AbstractEventLoop, Hashable], asyncio.Task] = {}
+        self._lock = threading.Lock()
+        
+        self._stats = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'refreshes': 0,
+            'load_errors': 0
+        }
+    
+    def _count(self, metric_name: str):
+        with self._lock:
+            self._stats[metric_name] += 1
+    
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[V]],
+                          cacheable: Optional[Callable[[V], bool]] = None) -> V:
+        """
+        Get a cached value, loading it on a miss
+        
+        Args:
+            key: Cache key
+            loader: Coroutine function that fetches the value
+            cacheable: Whether a loaded value may be stored; defaults to always
+        
+        Raises:
+            Whatever loader raised, for every caller sharing that load
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, loaded_at = entry
+            if time.monotonic() - loaded_at <= self.ttl_seconds:
+                self._count('hits')
+                return value
+            
+            self._count('stale_hits')
+            task, started = self._start_load(key, loader, cacheable)
+            if started:
+                self._count('refreshes')
+                task.add_done_callback(self._log_refresh_error)
+            return value
+        
+        task, started = self._start_load(key, loader, cacheable)
+        self._count('misses' if started else 'coalesced')
+        # shield: a caller giving up must not cancel the load others share
+        return await asyncio.shield(task)
+    
+    def _start_load(self, key: Hashable, loader: Callable[[], Awaitable[V]],
+                    cacheable: Optional[Callable[[V], bool]]) -> Tuple[asyncio.Task, bool]:
+        """Get the load in flight for a key, starting one if there is none"""
+        loop = asyncio.get_running_loop()
+        flight_key = (loop, key)
+        with self._lock:
+            task = self._in_flight.get(flight_key)
+            if task is not None:
+                return task, False
+            task = loop.create_task(self._load(flight_key, loader, cacheable))
+            self._in_flight[flight_key] = task
+        return task, True
+    
+    @staticmethod
+    def _log_refresh_error(task: asyncio.Task):
+        # Nobody awaits a background refresh, so its error is reported here
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Background cache refresh failed: {task.exception()}")
+    
+    async def _load(self, flight_key: tuple, loader: Callable[[], Awaitable[V]],
+                    cacheable: Optional[Callable[[V], bool]]) -> V:
+        try:
+            value = await loader()
+            if cacheable is None or cacheable(value):
+                self._entries.set(flight_key[1], (value, time.monotonic()))
+            return value
+        except Exception:
+            self._count('load_errors')
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(flight_key, None)
+    
+    def clear(self):
+        """Remove all values; loads in flight still complete"""
+        self._entries.clear()
+    
+    def get_stats(self) -> Dict[str, float]:
+        """Get hit, stale hit, miss and coalescing counters plus size and hit rate"""
+        with self._lock:
+            stats = self._stats.copy()
+            stats['in_flight'] = len(self._in_flight)
+        
+        entry_stats = self._entries.get_stats()
+        stats['size'] = entry_stats['size']
+        stats['evictions'] = entry_stats['evictions']
+        
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses'] + stats['coalesced']
+        stats['hit_rate'] = (stats['hits'] + stats['stale_hits']) / lookups if lookups else 0.0
+        return stats
+    
+    def __len__(self) -> int:
+        return len(self._entries)
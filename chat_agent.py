@@ -2,35 +2,45 @@
 LangChain-powered chat agent for DentalChat automation
 """
 import uuid
-from typing import Dict, List, Tuple, Optional
+import time
+import asyncio
+from typing import AsyncIterator, Callable, Dict, Iterator, List, NamedTuple, Tuple, Optional
 from datetime import datetime
 
-from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.schema import HumanMessage, AIMessage, SystemMessage
 from langchain.memory import ConversationBufferWindowMemory
 
-from models import ConversationHistory, ConversationTurn, PatientInfo
+from models import APIResponse, ConversationHistory, ConversationTurn, PatientInfo
 from data_extractor import PatientDataExtractor, SmartQuestionGenerator
 from dentalchat_api import get_api_client
+from session_store import SessionStore, create_session_store
+from outbox import DELIVERED, OutboxEntry, OutboxWorker, PostOutbox
+from context_builder import ContextBuilder
+from text_scanner import text_scanner
 from config import Config
+from utils import async_runner, performance_monitor
+from tracing import llm_attributes, tracer
+from profiling import turn_profiler
+from structured_logging import log_pipeline
+from llm_registry import llm_registry
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class _FollowUps(NamedTuple):
+    """Delivery task for a session's late updates and the queue it reports them on"""
+    task: asyncio.Task
+    updates: asyncio.Queue
+
 class DentalChatAgent:
     """
     Main conversational agent for dental patient intake
     """
     
-    def __init__(self, use_mock_api: bool = True):
-        # Initialize LangChain components
-        self.llm = ChatOpenAI(
-            api_key=Config.OPENAI_API_KEY,
-            model=Config.OPENAI_MODEL,
-            temperature=0.7
-        )
+    def __init__(self, use_mock_api: bool = True, session_store: Optional[SessionStore] = None):
+        # Initialize LangChain components (shared across the process)
+        self.llm = llm_registry.get_chat_model(temperature=0.7)
         
         # Initialize memory for conversation context
         self.memory = ConversationBufferWindowMemory(
@@ -44,18 +54,32 @@ class DentalChatAgent:
         self.question_generator = SmartQuestionGenerator()
         self.api_client = get_api_client(use_mock=use_mock_api)
         
-        # Active conversations storage
-        self.conversations: Dict[str, ConversationHistory] = {}
+        # Active conversations storage (bounded, with idle expiry)
+        self.conversations: SessionStore = session_store if session_store is not None else create_session_store()
+        
+        # Durable queue for post submission, drained by a background worker pool
+        self.post_outbox: Optional[PostOutbox] = None
+        self.outbox_worker: Optional[OutboxWorker] = None
+        if Config.POST_OUTBOX_ENABLED:
+            self.post_outbox = PostOutbox()
+            self.outbox_worker = OutboxWorker(self.post_outbox, self.api_client)
+        
+        # Post and dentist results that arrived after the completion message, by session
+        self._follow_ups: Dict[str, _FollowUps] = {}
+        
+        # Fits recent turns, a summary of older ones and the patient info into a token budget
+        self.context_builder = ContextBuilder()
         
         # Create the main chat prompt
         self.chat_prompt = ChatPromptTemplate.from_messages([
-            ("system", Config.SYSTEM_PROMPT),
+            SystemMessage(content=self.context_builder.system_prompt),
+            ("system", "{patient_context}"),
             MessagesPlaceholder(variable_name="chat_history"),
             ("human", "{input}")
         ])
         
         # Create the conversation chain
-        self.chain = self.chat_prompt | self.llm
+        self.chain = llm_registry.get_runnable("chat", lambda: self.chat_prompt | self.llm)
         
         logger.info("DentalChatAgent initialized successfully")
     
@@ -64,7 +88,7 @@ class DentalChatAgent:
         Start a new conversation and return session ID and welcome message
         """
         session_id = str(uuid.uuid4())
-        self.conversations[session_id] = ConversationHistory(session_id=session_id)
+        conversation = ConversationHistory(session_id=session_id)
         
         # Add welcome message
         welcome_msg = """Hi! I'm Dr. Assistant, and I'm here to help you connect with local dentists. 
@@ -73,7 +97,8 @@ I'll ask you a few questions about your dental concern and then automatically cr
 
 What's going on with your teeth or mouth today?"""
         
-        self.conversations[session_id].add_turn("assistant", welcome_msg)
+        conversation.add_turn("assistant", welcome_msg)
+        self.conversations.save(conversation)
         
         logger.info(f"Started new conversation: {session_id}")
         return session_id, welcome_msg
@@ -89,52 +114,56 @@ What's going on with your teeth or mouth today?"""
         Returns:
             Tuple of (response_message, is_complete)
         """
-        # Debug logging
-        logger.info(f"Processing message for session {session_id[:8]}: {user_message[:50]}...")
-        logger.info(f"Active conversations: {list(self.conversations.keys())}")
+        return async_runner.run(self.aprocess_message(session_id, user_message))
+    
+    async def aprocess_message(self, session_id: str, user_message: str) -> Tuple[str, bool]:
+        """
+        Async version of process_message; every LLM and API call is awaited
+        so a single event loop can serve many concurrent intakes
+        """
+        log_pipeline.event(logger, "turn.received", session=session_id[:8], chars=len(user_message))
         
-        if session_id not in self.conversations:
+        conversation = await self.conversations.aget(session_id)
+        if conversation is None:
             logger.error(f"Session {session_id} not found in conversations")
             return "I'm sorry, but your session has expired. Please start a new conversation by clicking 'Start New Conversation'.", False
         
-        conversation = self.conversations[session_id]
-        
         try:
+            # Work out what the assistant last asked for so short answers can skip the LLM
+            target_field = self._get_target_field(conversation)
+            
             # Add user message to conversation
             conversation.add_turn("user", user_message)
             
-            # Extract information from the message
+            # Extract information from the message (and, in combined mode, write the reply)
             old_info = conversation.patient_info
-            conversation.patient_info = self.data_extractor.extract_from_message(
-                user_message, conversation.patient_info
-            )
-            
-            # Debug: Log what was extracted
-            logger.info(f"Patient info completeness: {conversation.patient_info.is_complete()}")
-            if not conversation.patient_info.is_complete():
-                logger.info(f"Missing fields: {conversation.patient_info.missing_fields()}")
-            
-            # Check for completion signals
-            completion_signals = [
-                "that's all", "thats all", "that's it", "thank you", 
-                "thanks", "nothing else", "no more questions",
-                "all set", "ready to proceed", "create the post"
-            ]
-            
-            user_message_lower = user_message.lower().strip()
-            is_completion_signal = any(signal in user_message_lower for signal in completion_signals)
+            if Config.TURN_PIPELINE == "combined":
+                context = self._build_conversation_context(conversation, user_message)
+                conversation.patient_info, extraction_stats = await self.data_extractor.aextract_and_reply(
+                    user_message, conversation.patient_info, context["messages"], target_field,
+                    conversation_context=context["system_context"]
+                )
+            else:
+                conversation.patient_info, extraction_stats = await self.data_extractor.aextract_turn(
+                    user_message, conversation.patient_info, target_field
+                )
+            self._record_extraction(conversation, target_field, extraction_stats)
             
             # Check if we have all required information OR user signals completion
-            if conversation.patient_info.is_complete() or (is_completion_signal and self._has_minimum_info(conversation.patient_info)):
+            if self._is_ready_to_post(conversation, user_message):
                 # Create the post and finish conversation
-                response = self._create_post_and_finish(conversation)
+                response = await self._create_post_and_finish(conversation)
                 conversation.is_complete = True
                 logger.info(f"Conversation {session_id[:8]} completed successfully")
                 return response, True
             else:
-                # Generate appropriate follow-up question
-                response = self._generate_follow_up_response(conversation, user_message)
-                conversation.add_turn("assistant", response)
+                # Use the combined-mode reply if there is one, otherwise generate a follow-up question
+                response = extraction_stats.get("reply")
+                if response:
+                    conversation.add_turn("assistant", response, {"next_missing_field": extraction_stats["next_missing_field"]})
+                else:
+                    response = await self._generate_follow_up_response(conversation, user_message)
+                    conversation.add_turn("assistant", response)
                 return response, False
                 
         except Exception as e:
@@ -142,6 +171,186 @@ What's going on with your teeth or mouth today?"""
             error_response = "I apologize, but I'm having trouble processing your message. Could you please try rephrasing your concern?"
             conversation.add_turn("assistant", error_response)
             return error_response, False
+        
+        finally:
+            await self.conversations.asave(conversation)
+    
+    def stream_message(self, session_id: str, user_message: str) -> Iterator[str]:
+        """
+        Process user message and yield the response as it is generated
+        
+        Check get_conversation_summary()["is_complete"] once the stream ends.
+        """
+        return async_runner.iterate(self.astream_message(session_id, user_message))
+    
+    async def astream_message(self, session_id: str, user_message: str) -> AsyncIterator[str]:
+        """
+        Async version of stream_message that yields reply tokens as they arrive
+        
+        Extraction runs alongside the reply. Completion detection and post creation
+        happen once the reply has streamed; their text is yielded at the end.
+        """
+        start_time = time.perf_counter()
+        first_chunk = True
+        
+        async for chunk in self._astream_turn(session_id, user_message):
+            if first_chunk:
+                performance_monitor.observe('reply_time_to_first_token_seconds', time.perf_counter() - start_time)
+                first_chunk = False
+            yield chunk
+    
+    async def _astream_turn(self, session_id: str, user_message: str) -> AsyncIterator[str]:
+        """
+        Run one turn, yielding response text in pieces
+        """
+        log_pipeline.event(logger, "turn.received", session=session_id[:8], chars=len(user_message), streaming=True)
+        
+        # The combined pipeline returns the reply inside a JSON object, so it is sent whole
+        if Config.TURN_PIPELINE == "combined":
+            response, _ = await self.aprocess_message(session_id, user_message)
+            yield response
+            return
+        
+        conversation = await self.conversations.aget(session_id)
+        if conversation is None:
+            logger.error(f"Session {session_id} not found in conversations")
+            yield "I'm sorry, but your session has expired. Please start a new conversation by clicking 'Start New Conversation'."
+            return
+        
+        extraction_task = None
+        try:
+            target_field = self._get_target_field(conversation)
+            conversation.add_turn("user", user_message)
+            
+            extraction_task = asyncio.create_task(self.data_extractor.aextract_turn(
+                user_message, conversation.patient_info, target_field
+            ))
+            
+            # Let the task start; the rule-based fast path finishes without awaiting,
+            # and if it completes the intake there is no reply to stream
+            await asyncio.sleep(0)
+            extraction_stats = None
+            if extraction_task.done():
+                conversation.patient_info, extraction_stats = extraction_task.result()
+                self._record_extraction(conversation, target_field, extraction_stats)
+                if self._is_ready_to_post(conversation, user_message):
+                    async for chunk in self._astream_finish(conversation):
+                        yield chunk
+                    return
+            
+            # Stream the reply while extraction finishes in the background
+            context = self._build_conversation_context(conversation, user_message)
+            reply_parts = []
+            prompt_tokens = completion_tokens = 0
+            with performance_monitor.timer("reply"), tracer.span("llm.reply", llm_attributes(self.llm)) as span:
+                async for chunk in self.chain.astream({
+                    "input": user_message,
+                    "patient_context": context["system_context"],
+                    "chat_history": context["messages"]
+                }):
+                    # Usage arrives on the last chunk, when the provider reports it
+                    if chunk.usage_metadata:
+                        prompt_tokens += chunk.usage_metadata.get("input_tokens", 0)
+                        completion_tokens += chunk.usage_metadata.get("output_tokens", 0)
+                    if chunk.content:
+                        reply_parts.append(chunk.content)
+                        yield chunk.content
+                span.set_attributes({"llm.prompt_tokens": prompt_tokens, "llm.completion_tokens": completion_tokens})
+            if prompt_tokens or completion_tokens:
+                performance_monitor.record_tokens("reply", prompt_tokens, completion_tokens)
+            
+            if extraction_stats is None:
+                conversation.patient_info, extraction_stats = await extraction_task
+                self._record_extraction(conversation, target_field, extraction_stats)
+            
+            if self._is_ready_to_post(conversation, user_message):
+                async for chunk in self._astream_finish(conversation, prefix="\n\n"):
+                    yield chunk
+                return
+            
+            response_text = "".join(reply_parts).strip()
+            if not self._contains_question(response_text):
+                follow_up = await self.question_generator.agenerate_follow_up_question(
+                    conversation.patient_info,
+                    conversation.get_transcript_tail(max_chars=SmartQuestionGenerator.HISTORY_WINDOW_CHARS)
+                )
+                response_text += f"\n\n{follow_up}"
+                yield f"\n\n{follow_up}"
+            
+            conversation.add_turn("assistant", response_text)
+            
+        except Exception as e:
+            logger.error(f"Error streaming message for session {session_id}: {e}")
+            error_response = "I apologize, but I'm having trouble processing your message. Could you please try rephrasing your concern?"
+            conversation.add_turn("assistant", error_response)
+            yield error_response
+        
+        finally:
+            # The reply stream failed or the client went away before extraction finished
+            if extraction_task is not None and not extraction_task.done():
+                extraction_task.cancel()
+            await self.conversations.asave(conversation)
+    
+    async def _astream_finish(self, conversation: ConversationHistory, prefix: str = "") -> AsyncIterator[str]:
+        """
+        Create the post, yield the completion message, then any updates that arrive in time
+        """
+        response = await self._create_post_and_finish(conversation)
+        conversation.is_complete = True
+        logger.info(f"Conversation {conversation.session_id[:8]} completed successfully")
+        yield f"{prefix}{response}"
+        
+        # The stream is still open, so late results can be appended to it
+        async for update in self.afollow_ups(conversation.session_id, Config.FOLLOW_UP_WAIT_SECONDS):
+            yield f"\n\n{update}"
+    
+    def _record_extraction(self, conversation: ConversationHistory, target_field: Optional[str], extraction_stats: Dict):
+        """
+        Attach per-turn extraction stats to the latest user turn
+        """
+        conversation.turns[-1].extracted_info = {
+            "target_field": target_field,
+            "llm_skipped": extraction_stats["llm_skipped"],
+            "cache_hit": extraction_stats.get("cache_hit", False),
+            "extraction_latency": round(extraction_stats["latency"], 4)
+        }
+        tracer.current_span().set_attributes({
+            "extraction.target_field": target_field,
+            "extraction.llm_skipped": extraction_stats["llm_skipped"],
+            "extraction.cache_hit": extraction_stats.get("cache_hit", False)
+        })
+        
+        if log_pipeline.should_log(logger, "extraction.progress"):
+            log_pipeline.log_sampled(
+                logger, "extraction.progress",
+                session=conversation.session_id[:8],
+                missing=conversation.patient_info.missing_fields()
+            )
+    
+    def _is_ready_to_post(self, conversation: ConversationHistory, user_message: str) -> bool:
+        """
+        Check if we have all required information OR the user signals completion
+        """
+        # Check for completion signals
+        is_completion_signal = text_scanner.scan(user_message).has_completion_signal
+        
+        return bool(
+            conversation.patient_info.is_complete() or
+            (is_completion_signal and self._has_minimum_info(conversation.patient_info))
+        )
+    
+    def _get_target_field(self, conversation: ConversationHistory) -> Optional[str]:
+        """
+        Get the PatientInfo field the last assistant message asked for, if any
+        """
+        if not conversation.turns or conversation.turns[-1].role != "assistant":
+            return None
+        
+        last_turn = conversation.turns[-1]
+        if last_turn.extracted_info and last_turn.extracted_info.get("next_missing_field"):
+            return last_turn.extracted_info["next_missing_field"]
+        
+        return self.data_extractor.detect_target_field(last_turn.message)
     
     def _has_minimum_info(self, patient_info: PatientInfo) -> bool:
         """
@@ -154,27 +363,32 @@ What's going on with your teeth or mouth today?"""
             patient_info.location
         )
     
-    def _generate_follow_up_response(self, conversation: ConversationHistory, user_message: str) -> str:
+    @tracer.traced("follow_up_response")
+    async def _generate_follow_up_response(self, conversation: ConversationHistory, user_message: str) -> str:
         """
         Generate contextual follow-up response
         """
         try:
             # Get conversation context for the LLM
-            context = self._build_conversation_context(conversation)
+            context = self._build_conversation_context(conversation, user_message)
             
             # Use LangChain to generate empathetic response with follow-up question
-            response = self.chain.invoke({
-                "input": user_message,
-                "chat_history": context["messages"]
-            })
+            with performance_monitor.timer("reply"), tracer.span("llm.reply", llm_attributes(self.llm)) as span:
+                response = await self.chain.ainvoke({
+                    "input": user_message,
+                    "patient_context": context["system_context"],
+                    "chat_history": context["messages"]
+                })
+                span.record_usage(response)
+            performance_monitor.record_usage("reply", response)
             
             # If the LLM response doesn't ask a specific question, add one
             response_text = response.content.strip()
             
             if not self._contains_question(response_text):
-                follow_up = self.question_generator.generate_follow_up_question(
+                follow_up = await self.question_generator.agenerate_follow_up_question(
                     conversation.patient_info,
-                    conversation.get_conversation_text()
+                    conversation.get_transcript_tail(max_chars=SmartQuestionGenerator.HISTORY_WINDOW_CHARS)
                 )
                 response_text += f"\n\n{follow_up}"
             
@@ -183,89 +397,227 @@ What's going on with your teeth or mouth today?"""
         except Exception as e:
             logger.error(f"Error generating follow-up: {e}")
             # Fallback to simple question generator
-            return self.question_generator.generate_follow_up_question(
+            return await self.question_generator.agenerate_follow_up_question(
                 conversation.patient_info,
-                conversation.get_conversation_text()
+                conversation.get_transcript_tail(max_chars=SmartQuestionGenerator.HISTORY_WINDOW_CHARS)
             )
     
-    def _create_post_and_finish(self, conversation: ConversationHistory) -> str:
+    @performance_monitor.timer("post")
+    @tracer.traced("post")
+    async def _create_post_and_finish(self, conversation: ConversationHistory) -> str:
         """
         Create DentalChat post and return completion message
+        
+        With the outbox enabled the post is saved to it and sent by the outbox
+        worker; otherwise it is sent inline. The dentist lookup runs alongside.
+        Whatever has not finished within Config.COMPLETION_GRACE_SECONDS is
+        left out of the message and recorded later as its own assistant turn
+        (see afollow_ups).
         """
+        patient_info = conversation.patient_info
+        dentist_task = asyncio.create_task(
+            self.api_client.aget_nearby_dentists(patient_info.location, patient_info.emergency_status)
+        )
+        reference = None
+        
         try:
-            # Create the post via API
-            api_response = self.api_client.create_patient_post(conversation.patient_info)
+            if self.post_outbox is not None:
+                # Persist first, so the post survives a failed call or a restart
+                entry = await asyncio.to_thread(self.post_outbox.enqueue, conversation.session_id, patient_info)
+                reference = entry.reference
+                self.outbox_worker.start()
+                outcome = self.outbox_worker.watch(entry.idempotency_key)
+                self.outbox_worker.wake()
+                post_task = asyncio.create_task(self._aoutbox_response(entry, outcome))
+            else:
+                # Create the post via API
+                post_task = asyncio.create_task(self.api_client.acreate_patient_post(patient_info))
+                await post_task
             
-            if api_response.success:
-                # Get nearby dentists info
-                dentist_response = self.api_client.get_nearby_dentists(
-                    conversation.patient_info.location,
-                    conversation.patient_info.emergency_status
-                )
-                
-                # Build success message
-                success_msg = f"""Perfect! I've created your dental post successfully. Here's what happens next:
-
-✅ **Your post is now live** and local dentists can see it
-📍 **Location**: {conversation.patient_info.location}
-⚡ **Priority**: {'Emergency' if conversation.patient_info.emergency_status else 'Standard'}
-📞 **Contact**: {conversation.patient_info.phone}
-
-"""
-                
-                if dentist_response.success:
-                    dentist_count = len(dentist_response.data.get('dentists', []))
-                    success_msg += f"🔍 **{dentist_count} dentists** found in your area\n"
-                
-                success_msg += f"""
-📧 **What's Next**:
-• You'll receive email notifications when dentists respond
-• Typical response time: {api_response.data.get('estimated_response_time', '1-2 hours')}
-• Check your email and phone for updates
-
-**Post ID**: {api_response.data.get('post_id', 'N/A')}
-
-Is there anything else I can help you with regarding your dental concern?"""
-                
-                return success_msg
+            # Give both a moment to make it into the same message
+            done, _ = await asyncio.wait({post_task, dentist_task}, timeout=Config.COMPLETION_GRACE_SECONDS)
+            
+            if post_task in done and not post_task.result().success:
+                dentist_task.cancel()
                 
-            else:
                 # Handle API error
+                api_response = post_task.result()
                 error_msg = f"""I apologize, but I encountered an issue creating your post: {api_response.message}
 
 Don't worry! I still have all your information:
-• **Problem**: {conversation.patient_info.problem_description}
-• **Pain Level**: {conversation.patient_info.pain_level}/10
-• **Contact**: {conversation.patient_info.patient_name} - {conversation.patient_info.phone}
+• **Problem**: {patient_info.problem_description}
+• **Pain Level**: {patient_info.pain_level}/10
+• **Contact**: {patient_info.patient_name} - {patient_info.phone}
 
 Would you like me to try creating the post again, or would you prefer to contact DentalChat support directly?"""
                 
+                conversation.add_turn("assistant", error_msg)
                 return error_msg
+            
+            api_response = post_task.result() if post_task in done else None
+            dentist_line = self._format_dentist_count(dentist_task.result()) if dentist_task in done else None
+            success_msg = self._completion_message(patient_info, api_response, reference, dentist_line)
+            
+            post_id = api_response.data.get('post_id') if api_response else None
+            conversation.add_turn("assistant", success_msg, {"post_id": post_id, "post_reference": reference})
+            
+            pending = {}
+            if post_task not in done:
+                pending[post_task] = ("post_status", lambda response: self._format_post_update(response, reference))
+            if dentist_task not in done:
+                pending[dentist_task] = ("nearby_dentists", self._format_dentist_update)
+            if pending:
+                updates = asyncio.Queue()
+                task = asyncio.create_task(self._deliver_follow_ups(conversation, pending, updates))
+                self._follow_ups[conversation.session_id] = _FollowUps(task, updates)
+            
+            return success_msg
                 
         except Exception as e:
+            dentist_task.cancel()
             logger.error(f"Error creating post: {e}")
             return "I apologize, but I'm having trouble creating your post right now. Please try again in a moment or contact support if the issue persists."
     
-    def _build_conversation_context(self, conversation: ConversationHistory) -> Dict:
+    async def _aoutbox_response(self, entry: OutboxEntry, outcome: asyncio.Future) -> APIResponse:
         """
-        Build context for LangChain conversation
+        Wait for the outbox to deliver or dead-letter a post, as an APIResponse
+        """
+        entry = await self.outbox_worker.wait_for(entry, outcome)
+        if entry.status == DELIVERED:
+            return APIResponse(success=True, message="Post created successfully", data=entry.result or {})
+        return APIResponse(success=False, message="Failed to create post", error=entry.last_error)
+    
+    def _completion_message(self, patient_info: PatientInfo, api_response: Optional[APIResponse],
+                            reference: Optional[str], dentist_line: Optional[str]) -> str:
+        """
+        Completion message, for a post that is live or still being submitted
         """
-        messages = []
+        if api_response is not None:
+            opening = "Perfect! I've created your dental post successfully. Here's what happens next:"
+            status_line = "✅ **Your post is now live** and local dentists can see it"
+            response_time = api_response.data.get('estimated_response_time', '1-2 hours')
+            id_line = f"**Post ID**: {api_response.data.get('post_id', 'N/A')}"
+        else:
+            opening = "Perfect! I've submitted your dental post. Here's what happens next:"
+            status_line = "⏳ **Your post is being published** and local dentists will see it shortly"
+            response_time = "1-2 hours"
+            id_line = f"**Reference**: {reference}"
         
-        # Add recent conversation turns
-        for turn in conversation.turns[-6:]:  # Last 6 turns
-            if turn.role == "user":
-                messages.append(HumanMessage(content=turn.message))
-            else:
-                messages.append(AIMessage(content=turn.message))
+        message = f"""{opening}
+
+{status_line}
+📍 **Location**: {patient_info.location}
+⚡ **Priority**: {'Emergency' if patient_info.emergency_status else 'Standard'}
+📞 **Contact**: {patient_info.phone}
+
+"""
+        
+        if dentist_line:
+            message += f"{dentist_line}\n"
         
+        message += f"""
+📧 **What's Next**:
+• You'll receive email notifications when dentists respond
+• Typical response time: {response_time}
+• Check your email and phone for updates
+
+{id_line}
+
+Is there anything else I can help you with regarding your dental concern?"""
+        return message
+    
+    def _format_dentist_count(self, dentist_response: APIResponse) -> Optional[str]:
+        """
+        Dentist count line for the completion message, or None if the lookup failed
+        """
+        if not dentist_response.success:
+            return None
+        dentist_count = len(dentist_response.data.get('dentists', []))
+        return f"🔍 **{dentist_count} dentists** found in your area"
+    
+    def _format_dentist_update(self, dentist_response: APIResponse) -> Optional[str]:
+        dentist_line = self._format_dentist_count(dentist_response)
+        return f"Update: {dentist_line}" if dentist_line else None
+    
+    def _format_post_update(self, api_response: APIResponse, reference: Optional[str]) -> str:
+        if api_response.success:
+            return (f"Update: ✅ **Your post is now live** and local dentists can see it.\n\n"
+                    f"**Post ID**: {api_response.data.get('post_id', 'N/A')}")
+        return (f"Update: I wasn't able to publish your post ({api_response.error}). "
+                f"Your information is saved; please contact DentalChat support and quote reference **{reference}**.")
+    
+    async def _deliver_follow_ups(self, conversation: ConversationHistory,
+                                  pending: Dict[asyncio.Task, Tuple[str, Callable[[APIResponse], Optional[str]]]],
+                                  updates: "asyncio.Queue[Optional[str]]"):
+        """
+        Record each late result as its own assistant turn as soon as it arrives
+        
+        Updates are also put on `updates`, followed by None when all are done.
+        """
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    kind, format_update = pending.pop(task)
+                    try:
+                        update = format_update(task.result())
+                    except Exception as e:
+                        logger.error(f"Error delivering {kind} update: {e}")
+                        continue
+                    
+                    if update:
+                        conversation.add_turn("assistant", update, {"follow_up": kind})
+                        await self.conversations.asave(conversation)
+                        updates.put_nowait(update)
+        finally:
+            for task in pending:
+                task.cancel()
+            updates.put_nowait(None)
+            self._follow_ups.pop(conversation.session_id, None)
+    
+    async def afollow_ups(self, session_id: str, timeout: float) -> AsyncIterator[str]:
+        """
+        Yield a session's pending updates as they are recorded, for up to timeout seconds
+        """
+        follow_ups = self._follow_ups.get(session_id)
+        if follow_ups is None:
+            return
+        
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            try:
+                update = await asyncio.wait_for(follow_ups.updates.get(), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                return
+            if update is None:
+                return
+            yield update
+    
+    def _build_conversation_context(self, conversation: ConversationHistory, user_message: str) -> Dict:
+        """
+        Build context for LangChain conversation
+        
+        The history excludes the patient's new message, which is sent as the
+        human input, and is trimmed to Config.CONTEXT_TOKEN_BUDGET.
+        """
         # Add current patient info context
         info_context = self._format_patient_info_context(conversation.patient_info)
+        built = self.context_builder.build(conversation, user_message, info_context)
+        
+        performance_monitor.observe('context_input_tokens', built.input_tokens)
+        performance_monitor.observe('context_baseline_tokens', built.baseline_tokens)
+        logger.debug(
+            f"Context for {conversation.session_id[:8]}: {built.input_tokens} tokens "
+            f"({built.recent_turns} recent turns, {built.summarized_turns} summarized)"
+        )
         
         return {
-            "messages": messages,
+            "messages": built.messages,
+            "system_context": built.system_context,
             "patient_info": info_context,
-            "missing_fields": conversation.patient_info.missing_fields()
+            "missing_fields": conversation.patient_info.missing_fields(),
+            "input_tokens": built.input_tokens
         }
     
     def _format_patient_info_context(self, patient_info: PatientInfo) -> str:
@@ -302,11 +654,10 @@ Would you like me to try creating the post again, or would you prefer to contact
         """
         Get summary of conversation and extracted information
         """
-        if session_id not in self.conversations:
+        conversation = self.conversations.get(session_id)
+        if conversation is None:
             return None
         
-        conversation = self.conversations[session_id]
-        
         return {
             "session_id": session_id,
             "created_at": conversation.created_at.isoformat(),
@@ -321,8 +672,11 @@ Would you like me to try creating the post again, or would you prefer to contact
         """
         Clean up completed conversation
         """
-        if session_id in self.conversations:
-            del self.conversations[session_id]
+        self.context_builder.forget(session_id)
+        follow_ups = self._follow_ups.pop(session_id, None)
+        if follow_ups is not None:
+            follow_ups.task.cancel()
+        if self.conversations.delete(session_id):
             logger.info(f"Cleaned up conversation: {session_id}")
 
 class ConversationManager:
@@ -330,40 +684,97 @@ class ConversationManager:
     Manages multiple conversation sessions
     """
     
-    def __init__(self):
-        self.agent = DentalChatAgent()
-        self.active_sessions = set()
+    def __init__(self, session_store: Optional[SessionStore] = None):
+        self.agent = DentalChatAgent(session_store=session_store)
+    
+    @property
+    def sessions(self) -> SessionStore:
+        """Session store shared with the agent"""
+        return self.agent.conversations
     
     def create_session(self) -> Tuple[str, str]:
         """Create new conversation session"""
         session_id, welcome_msg = self.agent.start_conversation()
-        self.active_sessions.add(session_id)
         
-        logger.info(f"Created session {session_id[:8]}, total active: {len(self.active_sessions)}")
+        logger.info(f"Created session {session_id[:8]}")
         
         return session_id, welcome_msg
     
-    def send_message(self, session_id: str, message: str) -> Tuple[str, bool]:
-        """Send message to specific session"""
-        # Check if session exists in active sessions
-        if session_id not in self.active_sessions:
-            logger.warning(f"Session {session_id[:8]} not in active sessions: {list(self.active_sessions)}")
-            
-            # Try to recover if session exists in agent but not in active_sessions
-            if session_id in self.agent.conversations:
-                logger.info(f"Recovering session {session_id[:8]} - adding back to active sessions")
-                self.active_sessions.add(session_id)
-            else:
-                return "I'm sorry, but your session has expired. Please start a new conversation by clicking 'Start New Conversation'.", False
+    def send_message(self, session_id: str, message: str, profile: bool = False) -> Tuple[str, bool]:
+        """
+        Send message to specific session
         
-        response, is_complete = self.agent.process_message(session_id, message)
+        With profile=True the turn is profiled (see profiling.TurnProfiler).
+        """
+        return async_runner.run(self.asend_message(session_id, message, profile))
+    
+    async def asend_message(self, session_id: str, message: str, profile: bool = False) -> Tuple[str, bool]:
+        """Async version of send_message"""
+        with tracer.span("intake.turn", self._turn_attributes(session_id, streaming=False)) as span:
+            with turn_profiler.profile_turn(session_id, force=profile) as profiled:
+                response, is_complete = await self.agent.aprocess_message(session_id, message)
+            span.set_attribute("intake.complete", is_complete)
+            if profiled:
+                span.set_attribute("profile.path", profiled["path"])
         
         if is_complete:
-            self.active_sessions.discard(session_id)
             logger.info(f"Completed session {session_id[:8]}")
         
         return response, is_complete
     
+    def stream_message(self, session_id: str, message: str, profile: bool = False) -> Iterator[str]:
+        """Send message to specific session and yield the response as it streams"""
+        return async_runner.iterate(self.astream_message(session_id, message, profile))
+    
+    async def astream_message(self, session_id: str, message: str, profile: bool = False) -> AsyncIterator[str]:
+        """
+        Async version of stream_message
+        
+        A profiled turn includes the time the consumer spends between chunks.
+        """
+        span = tracer.span("intake.turn", self._turn_attributes(session_id, streaming=True))
+        chunks = self.agent.astream_message(session_id, message)
+        profiled = None
+        try:
+            with turn_profiler.profile_turn(session_id, force=profile) as profiled:
+                while True:
+                    # Each step may run in its own task (see AsyncRunner.iterate), so
+                    # make the turn span current again for every chunk
+                    with tracer.activate(span):
+                        try:
+                            chunk = await chunks.__anext__()
+                        except StopAsyncIteration:
+                            break
+                    yield chunk
+        except BaseException as e:
+            if not isinstance(e, (GeneratorExit, asyncio.CancelledError)):
+                span.record_error(e)
+            raise
+        finally:
+            await chunks.aclose()
+            is_complete = await self.ais_session_complete(session_id)
+            span.set_attribute("intake.complete", is_complete)
+            if profiled:
+                span.set_attribute("profile.path", profiled["path"])
+            span.end()
+        
+        if is_complete:
+            logger.info(f"Completed session {session_id[:8]}")
+    
+    @staticmethod
+    def _turn_attributes(session_id: str, streaming: bool) -> Dict:
+        return {"session.id": session_id, "intake.pipeline": Config.TURN_PIPELINE, "intake.streaming": streaming}
+    
+    def is_session_complete(self, session_id: str) -> bool:
+        """Check whether a session's intake has finished"""
+        conversation = self.sessions.get(session_id)
+        return bool(conversation and conversation.is_complete)
+    
+    async def ais_session_complete(self, session_id: str) -> bool:
+        """Async version of is_session_complete"""
+        conversation = await self.sessions.aget(session_id)
+        return bool(conversation and conversation.is_complete)
+    
     def get_session_info(self, session_id: str) -> Optional[Dict]:
         """Get information about a session"""
         return self.agent.get_conversation_summary(session_id)
@@ -371,21 +782,23 @@ class ConversationManager:
     def debug_sessions(self) -> Dict:
         """Get debug information about active sessions"""
         return {
-            "active_sessions": list(self.active_sessions),
-            "agent_conversations": list(self.agent.conversations.keys()),
-            "total_active": len(self.active_sessions),
-            "total_conversations": len(self.agent.conversations)
+            "agent_conversations": self.sessions.keys(),
+            "total_conversations": len(self.sessions),
+            "store_metrics": self.sessions.get_metrics(),
+            "outbox_metrics": self.get_outbox_metrics(),
+            "dentist_cache": self.get_dentist_cache_stats()
         }
     
+    def get_dentist_cache_stats(self) -> Optional[Dict[str, float]]:
+        """Nearby dentist cache counters, or None if the cache is off"""
+        cache = self.agent.api_client.dentist_cache
+        return cache.get_stats() if cache is not None else None
+    
+    def get_outbox_metrics(self) -> Optional[Dict[str, float]]:
+        """Post outbox depth, drain rate and oldest entry age, or None if the outbox is off"""
+        worker = self.agent.outbox_worker
+        return worker.get_metrics() if worker is not None else None
+    
     def ensure_session_active(self, session_id: str) -> bool:
         """Ensure session is active and accessible"""
-        if session_id in self.active_sessions:
-            return True
-        
-        # If session exists in agent but not in active sessions, recover it
-        if session_id in self.agent.conversations:
-            logger.info(f"Recovering session {session_id[:8]}")
-            self.active_sessions.add(session_id)
-            return True
-        
-        return False
\ No newline at end of file
+        return self.sessions.get(session_id) is not None
@@ -10,15 +10,140 @@ class Config:
     # OpenAI Configuration
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     OPENAI_MODEL = "gpt-4-turbo-preview"
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    
+    # "openai", or "fake" for the offline stand-in in fake_llm.py (no API key needed)
+    LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+    FAKE_LLM_BASE_LATENCY = float(os.getenv("FAKE_LLM_BASE_LATENCY", "0.3"))
+    FAKE_LLM_PER_TOKEN_LATENCY = float(os.getenv("FAKE_LLM_PER_TOKEN_LATENCY", "0.01"))
+    FAKE_LLM_JITTER = float(os.getenv("FAKE_LLM_JITTER", "0.2"))
+    FAKE_LLM_LATENCY_DISTRIBUTION = os.getenv("FAKE_LLM_LATENCY_DISTRIBUTION", "uniform")  # "fixed", "uniform" or "lognormal"
+    FAKE_LLM_SEED = int(os.getenv("FAKE_LLM_SEED")) if os.getenv("FAKE_LLM_SEED") else None
+    FAKE_LLM_MAX_CONCURRENCY = int(os.getenv("FAKE_LLM_MAX_CONCURRENCY", "0"))
+    FAKE_LLM_SCRIPT_PATH = os.getenv("FAKE_LLM_SCRIPT_PATH", "")  # JSON canned extractions and replies (see fake_llm.py)
+    
+    # Shared LLM connection pool (see llm_registry.py)
+    LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+    LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+    LLM_PREWARM = os.getenv("LLM_PREWARM", "true").lower() == "true"
     
     # DentalChat API Configuration
     DENTALCHAT_BASE_URL = "https://dentalchat.com/api"
     DENTALCHAT_API_KEY = os.getenv("DENTALCHAT_API_KEY", "demo_key")
+    DENTALCHAT_CONNECT_TIMEOUT = float(os.getenv("DENTALCHAT_CONNECT_TIMEOUT", "3"))
+    DENTALCHAT_READ_TIMEOUT = float(os.getenv("DENTALCHAT_READ_TIMEOUT", "10"))
+    DENTALCHAT_MAX_CONNECTIONS = int(os.getenv("DENTALCHAT_MAX_CONNECTIONS", "20"))
+    DENTALCHAT_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("DENTALCHAT_MAX_KEEPALIVE_CONNECTIONS", "10"))
+    DENTALCHAT_KEEPALIVE_EXPIRY = float(os.getenv("DENTALCHAT_KEEPALIVE_EXPIRY", "30"))
+    DENTALCHAT_MAX_RETRIES = int(os.getenv("DENTALCHAT_MAX_RETRIES", "2"))
+    DENTALCHAT_BACKOFF_BASE_SECONDS = float(os.getenv("DENTALCHAT_BACKOFF_BASE_SECONDS", "0.2"))
+    DENTALCHAT_BACKOFF_MAX_SECONDS = float(os.getenv("DENTALCHAT_BACKOFF_MAX_SECONDS", "2"))
+    DENTALCHAT_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("DENTALCHAT_CIRCUIT_FAILURE_THRESHOLD", "5"))
+    DENTALCHAT_CIRCUIT_RESET_SECONDS = float(os.getenv("DENTALCHAT_CIRCUIT_RESET_SECONDS", "30"))
+    
+    # Local dentist directory built with `python -m dentist_directory`; empty uses
+    # only the DentalChat search (or the mock's fixed list)
+    DENTIST_DIRECTORY_PATH = os.getenv("DENTIST_DIRECTORY_PATH", "")
+    
+    # Nearby dentist search cache: results are fresh for TTL_SECONDS, then served
+    # stale for up to STALE_SECONDS while a background refresh runs
+    DENTIST_CACHE_ENABLED = os.getenv("DENTIST_CACHE_ENABLED", "true").lower() == "true"
+    DENTIST_CACHE_SIZE = int(os.getenv("DENTIST_CACHE_SIZE", "2000"))
+    DENTIST_CACHE_TTL_SECONDS = float(os.getenv("DENTIST_CACHE_TTL_SECONDS", "300"))
+    DENTIST_CACHE_STALE_SECONDS = float(os.getenv("DENTIST_CACHE_STALE_SECONDS", "3600"))
+    
+    # How long the completion message waits for the post and dentist lookup before
+    # sending without them, and how long a streamed reply stays open for late updates
+    COMPLETION_GRACE_SECONDS = float(os.getenv("COMPLETION_GRACE_SECONDS", "0.2"))
+    FOLLOW_UP_WAIT_SECONDS = float(os.getenv("FOLLOW_UP_WAIT_SECONDS", "5"))
+    
+    # Post submission outbox (see outbox.py), off by default: when enabled, posts are
+    # saved to SQLite and sent by a background worker pool with retries; otherwise inline
+    POST_OUTBOX_ENABLED = os.getenv("POST_OUTBOX_ENABLED", "false").lower() == "true"
+    POST_OUTBOX_DB_PATH = os.getenv("POST_OUTBOX_DB_PATH", "dentalchat_outbox.db")
+    POST_OUTBOX_WORKERS = int(os.getenv("POST_OUTBOX_WORKERS", "4"))
+    POST_OUTBOX_MAX_ATTEMPTS = int(os.getenv("POST_OUTBOX_MAX_ATTEMPTS", "8"))
+    POST_OUTBOX_LEASE_SECONDS = float(os.getenv("POST_OUTBOX_LEASE_SECONDS", "120"))
+    POST_OUTBOX_BACKOFF_BASE_SECONDS = float(os.getenv("POST_OUTBOX_BACKOFF_BASE_SECONDS", "1"))
+    POST_OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("POST_OUTBOX_BACKOFF_MAX_SECONDS", "300"))
+    POST_OUTBOX_POLL_SECONDS = float(os.getenv("POST_OUTBOX_POLL_SECONDS", "1"))
+    
+    # Metrics (see metrics.py): with a shared directory every worker process
+    # publishes its counts there and /metrics reports the sum of all workers
+    METRICS_SHARED_DIR = os.getenv("METRICS_SHARED_DIR", "")
+    METRICS_PUBLISH_SECONDS = float(os.getenv("METRICS_PUBLISH_SECONDS", "1"))
+    
+    # Tracing (see tracing.py): "jsonl" appends spans to TRACE_JSONL_PATH, "otlp"
+    # sends them to an OpenTelemetry collector; empty disables tracing
+    TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "")
+    TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", "traces.jsonl")
+    TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+    TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))  # Fraction of turns traced
+    TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "dentalchat-intake")
+    
+    # Turn profiling (see profiling.py); off unless a turn asks for it or a
+    # session / sample rate below selects it
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+    PROFILE_MODE = os.getenv("PROFILE_MODE", "sampling")  # "sampling" (collapsed stacks) or "cprofile"
+    PROFILE_SESSIONS = os.getenv("PROFILE_SESSIONS", "")  # Comma-separated session IDs, or "*"
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    PROFILE_SLOW_TURN_MS = float(os.getenv("PROFILE_SLOW_TURN_MS", "1000"))  # Sampled turns faster than this are discarded
+    PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+    # Honor the X-Profile-Turn header and the /profiles endpoints of the HTTP API
+    PROFILE_API_ENABLED = os.getenv("PROFILE_API_ENABLED", "false").lower() == "true"
+    
+    # Logging (see structured_logging.py)
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # "text" or "json" (one object per line)
+    LOG_FILE = os.getenv("LOG_FILE", "")
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # Records past this are dropped, not waited for
+    # Per-event sample rates ("event=rate,..."); other events use LOG_SAMPLE_DEFAULT.
+    # Warnings and errors are always logged.
+    LOG_SAMPLE_RATES = os.getenv(
+        "LOG_SAMPLE_RATES",
+        "turn.received=0.1,extraction.progress=0.1,extraction.fast_path=0.1,api.call=0.1"
+    )
+    LOG_SAMPLE_DEFAULT = float(os.getenv("LOG_SAMPLE_DEFAULT", "1.0"))
+    LOG_REDACT_PHI = os.getenv("LOG_REDACT_PHI", "true").lower() == "true"
+    
+    # HTTP API Settings (fast_api.py)
+    API_HOST = os.getenv("API_HOST", "0.0.0.0")
+    API_PORT = int(os.getenv("API_PORT", "8000"))
+    API_WORKERS = int(os.getenv("API_WORKERS", "1"))  # More than 1 needs SESSION_STORE=sqlite
     
     # Application Settings
     MAX_CONVERSATION_TURNS = 10
+    
+    # Session Store Settings (see session_store.py)
+    SESSION_MAX_ACTIVE = int(os.getenv("SESSION_MAX_ACTIVE", "10000"))
+    SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(24 * 3600)))
+    SESSION_STORE = os.getenv("SESSION_STORE", "memory")  # "memory" or "sqlite"
+    SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "dentalchat_sessions.db")
     PAIN_EMERGENCY_THRESHOLD = 7
     
+    # Turn pipeline: "legacy" makes separate extraction, reply and question calls;
+    # "combined" extracts fields and writes the reply in a single structured call
+    TURN_PIPELINE = os.getenv("TURN_PIPELINE", "legacy")
+    
+    # Extraction cache (messages with contact details or names are never cached)
+    EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+    EXTRACTION_CACHE_SIZE = int(os.getenv("EXTRACTION_CACHE_SIZE", "5000"))
+    EXTRACTION_CACHE_TTL_SECONDS = int(os.getenv("EXTRACTION_CACHE_TTL_SECONDS", "3600"))
+    
+    # Extraction micro-batching across sessions (see batching.py); off by default.
+    # With MAX_IN_FLIGHT > 0, requests only wait for a batch once that many extraction
+    # calls are running; with 0, every request waits up to MAX_WAIT_MS for company.
+    EXTRACTION_BATCHING_ENABLED = os.getenv("EXTRACTION_BATCHING_ENABLED", "false").lower() == "true"
+    EXTRACTION_BATCH_MAX_SIZE = int(os.getenv("EXTRACTION_BATCH_MAX_SIZE", "16"))
+    EXTRACTION_BATCH_MAX_WAIT_MS = float(os.getenv("EXTRACTION_BATCH_MAX_WAIT_MS", "10"))
+    EXTRACTION_BATCH_MAX_IN_FLIGHT = int(os.getenv("EXTRACTION_BATCH_MAX_IN_FLIGHT", "64"))
+    
+    # Prompt context budget per turn (see context_builder.py)
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+    CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "150"))
+    CONTEXT_MAX_RECENT_TURNS = int(os.getenv("CONTEXT_MAX_RECENT_TURNS", "6"))
+    
     # Validation Settings
     MIN_PROBLEM_LENGTH = 10
     MAX_PROBLEM_LENGTH = 500
@@ -65,4 +190,27 @@ class Config:
     - symptoms: List of specific symptoms mentioned
     
     Return as JSON. Use null for missing information.
-    """
\ No newline at end of file
+    """
+    
+    COMBINED_TURN_PROMPT = """
+    For every patient message you must also extract any new information it contains.
+    
+    Respond ONLY with a JSON object in this exact shape:
+    {{
+        "extracted_fields": {{
+            "problem_description": null or "detailed description of dental issue",
+            "pain_level": null or number 1-10,
+            "emergency_status": null or boolean,
+            "location": null or "ZIP code or city, state",
+            "patient_name": null or "full name",
+            "phone": null or "phone number",
+            "email": null or "email address",
+            "started_when": null or "when symptoms began",
+            "symptoms": ["list", "of", "symptoms"]
+        }},
+        "reply": "your empathetic reply, ending with ONE question for the most important missing item",
+        "next_missing_field": null or the field name your question asks about
+    }}
+    
+    Only include values stated in the latest message. Use null for anything not mentioned.
+    """
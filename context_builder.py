@@ -0,0 +1,206 @@
+"""
+Token-budgeted prompt context for DentalChat AI Automation
+"""
+import re
+import textwrap
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from langchain.schema import HumanMessage, AIMessage, BaseMessage
+
+from models import ConversationHistory, ConversationTurn
+from cache import LRUCache
+from config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken ships with langchain-openai, but counting still works without it
+    tiktoken = None
+
+# Rough per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+def build_token_counter(model: str) -> Callable[[str], int]:
+    """
+    Get a function that counts tokens for a model
+    
+    Falls back to about four characters per token when tiktoken or its
+    encoding files are unavailable.
+    """
+    if tiktoken is not None:
+        try:
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoding = tiktoken.get_encoding("cl100k_base")
+            return lambda text: len(encoding.encode(text, disallowed_special=()))
+        except Exception as e:
+            logger.warning(f"Could not load tiktoken encoding, estimating token counts: {e}")
+    return lambda text: (len(text) + 3) // 4
+
+@dataclass
+class BuiltContext:
+    """Messages for one LLM call and how many tokens they cost"""
+    system_context: str
+    messages: List[BaseMessage]
+    input_tokens: int
+    baseline_tokens: int
+    recent_turns: int
+    summarized_turns: int
+
+@dataclass
+class _SessionContext:
+    """Rolling state for one conversation"""
+    turn_tokens: List[int] = field(default_factory=list)
+    summarized_count: int = 0
+    summary_parts: List[str] = field(default_factory=list)
+    summary_tokens: int = 0
+
+class ContextBuilder:
+    """
+    Fit each turn's prompt into a token budget
+    
+    The prompt is the system prompt, one context message with the structured
+    patient information and a running summary of older turns, the most
+    recent turns that fit, and the patient's new message. Turns that no
+    longer fit are folded into the summary once and never re-read, and each
+    turn is tokenized only once, so building the context costs about the same
+    on turn 50 as on turn 5.
+    
+    Per-session state is a cache: if it is evicted, or another worker served
+    the previous turn, it is rebuilt from the turns on the next call.
+    """
+    
+    SUMMARY_SNIPPET_CHARS = 120
+    CONTEXT_HEADER = "Patient information collected so far:\n"
+    SUMMARY_HEADER = "\n\nEarlier in this conversation the patient said: "
+    
+    def __init__(self, max_tokens: Optional[int] = None, summary_max_tokens: Optional[int] = None,
+                 max_recent_turns: Optional[int] = None, model: Optional[str] = None):
+        self.max_tokens = max_tokens or Config.CONTEXT_TOKEN_BUDGET
+        self.summary_max_tokens = summary_max_tokens or Config.CONTEXT_SUMMARY_MAX_TOKENS
+        self.max_recent_turns = max_recent_turns or Config.CONTEXT_MAX_RECENT_TURNS
+        self.count_tokens = build_token_counter(model or Config.OPENAI_MODEL)
+        
+        self.system_prompt = textwrap.dedent(Config.SYSTEM_PROMPT).strip()
+        self.system_prompt_tokens = self.count_tokens(self.system_prompt) + MESSAGE_OVERHEAD_TOKENS
+        self.baseline_system_tokens = self.count_tokens(Config.SYSTEM_PROMPT) + MESSAGE_OVERHEAD_TOKENS
+        self.summary_header_tokens = self.count_tokens(self.SUMMARY_HEADER)
+        
+        self._sessions = LRUCache(max_size=Config.SESSION_MAX_ACTIVE)
+        self._lock = threading.Lock()
+    
+    def build(self, conversation: ConversationHistory, user_message: str, patient_context: str) -> BuiltContext:
+        """
+        Build the prompt context for the patient's latest message
+        
+        Args:
+            conversation: Conversation, possibly already ending with this message
+            user_message: The patient's new message
+            patient_context: Structured patient information for the model
+        
+        Returns:
+            BuiltContext with the system context text and the history messages
+        """
+        history = conversation.turns
+        if history and history[-1].role == "user" and history[-1].message == user_message:
+            history = history[:-1]
+        
+        with self._lock:
+            state = self._sessions.get(conversation.session_id)
+            if state is None or len(state.turn_tokens) > len(history):
+                state = _SessionContext()
+                self._sessions.set(conversation.session_id, state)
+            
+            for turn in history[len(state.turn_tokens):]:
+                state.turn_tokens.append(self.count_tokens(turn.message) + MESSAGE_OVERHEAD_TOKENS)
+            
+            input_tokens = self.count_tokens(user_message) + MESSAGE_OVERHEAD_TOKENS
+            context_tokens = self.count_tokens(self.CONTEXT_HEADER + patient_context) + MESSAGE_OVERHEAD_TOKENS
+            available = self.max_tokens - self.system_prompt_tokens - input_tokens - context_tokens
+            
+            # Keep at most max_recent_turns, then fold the oldest until the rest fits
+            start = max(state.summarized_count, len(history) - self.max_recent_turns)
+            self._fold(state, history, start)
+            recent_tokens = sum(state.turn_tokens[state.summarized_count:len(history)])
+            while state.summarized_count < len(history) and recent_tokens + self._summary_cost(state) > available:
+                recent_tokens -= state.turn_tokens[state.summarized_count]
+                self._fold(state, history, state.summarized_count + 1)
+            
+            summary = " ".join(state.summary_parts)
+            summarized_count = state.summarized_count
+            recent = history[summarized_count:]
+            
+            # What the previous fixed window sent: the full system prompt, the
+            # last six turns including this message, and the message again
+            baseline_tokens = (
+                self.baseline_system_tokens + sum(state.turn_tokens[-5:]) + 2 * input_tokens
+            )
+        
+        system_context = self.CONTEXT_HEADER + patient_context
+        if summary:
+            system_context += self.SUMMARY_HEADER + summary
+        
+        total_tokens = (
+            self.system_prompt_tokens + input_tokens + recent_tokens +
+            self.count_tokens(system_context) + MESSAGE_OVERHEAD_TOKENS
+        )
+        
+        return BuiltContext(
+            system_context=system_context,
+            messages=[self._to_message(turn) for turn in recent],
+            input_tokens=total_tokens,
+            baseline_tokens=baseline_tokens,
+            recent_turns=len(recent),
+            summarized_turns=summarized_count
+        )
+    
+    def forget(self, session_id: str):
+        """Drop the rolling state for a finished conversation"""
+        self._sessions.delete(session_id)
+    
+    def _summary_cost(self, state: _SessionContext) -> int:
+        """Tokens the summary adds to the context message, header included"""
+        return state.summary_tokens + self.summary_header_tokens if state.summary_parts else 0
+    
+    def _fold(self, state: _SessionContext, history: List[ConversationTurn], end: int):
+        """Move turns before `end` into the summary"""
+        for turn in history[state.summarized_count:end]:
+            snippet = self._summarize_turn(turn)
+            if snippet:
+                state.summary_parts.append(snippet)
+                state.summary_tokens += self.count_tokens(snippet) + 1
+        state.summarized_count = max(state.summarized_count, end)
+        
+        # Oldest details go first; PatientInfo keeps the facts that matter
+        while len(state.summary_parts) > 1 and state.summary_tokens > self.summary_max_tokens:
+            dropped = state.summary_parts.pop(0)
+            state.summary_tokens -= self.count_tokens(dropped) + 1
+    
+    def _summarize_turn(self, turn: ConversationTurn) -> Optional[str]:
+        """
+        One short snippet per patient turn
+        
+        Assistant turns are questions the structured patient info already
+        answers, so they are left out.
+        """
+        if turn.role != "user":
+            return None
+        
+        text = re.sub(r'\s+', ' ', turn.message).strip()
+        sentence = re.split(r'(?<=[.!?])\s', text, maxsplit=1)[0]
+        if len(sentence) > self.SUMMARY_SNIPPET_CHARS:
+            sentence = sentence[:self.SUMMARY_SNIPPET_CHARS].rsplit(' ', 1)[0] + "..."
+        if sentence and sentence[-1] not in ".!?":
+            sentence += "."
+        return f'"{sentence}"' if sentence else None
+    
+    @staticmethod
+    def _to_message(turn: ConversationTurn) -> BaseMessage:
+        if turn.role == "user":
+            return HumanMessage(content=turn.message)
+        return AIMessage(content=turn.message)
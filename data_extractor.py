@@ -3,22 +3,97 @@ Data extraction module using LangChain and OpenAI
 """
 import json
 import re
-from typing import Dict, Any, Optional
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema import HumanMessage, SystemMessage
+import time
+from typing import Dict, Any, List, Optional, Tuple
+from pydantic import ValidationError
+from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain.schema import HumanMessage, SystemMessage, BaseMessage
 from models import PatientInfo
 from validators import DataValidator
 from config import Config
+from utils import TextProcessor, async_runner, performance_monitor
+from llm_registry import llm_registry
+from cache import LRUCache
+from batching import MicroBatcher
+from text_scanner import text_scanner
+from tracing import llm_attributes, tracer
+from structured_logging import log_pipeline
+import logging
+
+logger = logging.getLogger(__name__)
+
+def describe_error(e: Exception) -> str:
+    """Error summary for logs; validation errors name the fields, not the rejected values"""
+    if isinstance(e, ValidationError):
+        return "invalid " + ", ".join(".".join(map(str, error["loc"])) for error in e.errors())
+    return f"{type(e).__name__}: {e}"
 
 class PatientDataExtractor:
     """Extract patient information from conversations using LangChain and OpenAI"""
     
+    # Messages longer than this always go to the LLM
+    FAST_PATH_MAX_LENGTH = 120
+    
+    PHONE_PATTERN = re.compile(r'(?:\+?1[\s\-.]?)?\(?\b\d{3}\)?[\s\-.]?\d{3}[\s\-.]?\d{4}\b')
+    ZIP_PATTERN = re.compile(r'\b\d{5}(?:-\d{4})?\b')
+    PAIN_ANSWER_PATTERN = re.compile(r'\b(\d{1,2})\s*(?:/\s*10|out\s+of\s+10)?\b')
+    
+    # Words that carry no extractable information once a value has been matched
+    FILLER_WORDS = {
+        'a', 'about', 'address', 'am', 'an', 'and', 'around', 'at', 'began', 'call', 'can',
+        'cell', 'code', 'contact', 'e', 'email', 'i', "i'm", 'im', 'in', 'is', 'it', "it's",
+        'its', 'level', 'live', 'mail', 'maybe', 'me', 'mobile', 'my', 'number', 'of', 'ok',
+        'okay', 'on', 'out', 'pain', 'phone', 'please', 'postal', 'probably', 'rate', 'reach',
+        'roughly', 's', 'say', 'since', 'started', 'sure', 'thank', 'thanks', 'the', 'this',
+        'would', 'you', 'zip', 'zipcode'
+    }
+    
+    CONTACT_FIELDS = {'phone', 'email'}
+    
+    # Fields that identify a patient; results containing them are never cached
+    PHI_FIELDS = {'patient_name', 'phone', 'email', 'location'}
+    CACHE_MAX_MESSAGE_LENGTH = 200
+    
+    # Schema line for each field the per-turn extraction can ask for, in prompt order
+    EXTRACTION_FIELDS = {
+        'problem_description': '"detailed description of dental issue"',
+        'pain_level': 'null or number 1-10',
+        'emergency_status': 'null or boolean',
+        'location': '"ZIP code or city, state"',
+        'patient_name': '"full name if provided"',
+        'phone': '"phone number if provided"',
+        'email': '"email address if provided"',
+        'started_when': '"when symptoms began"',
+        'symptoms': '["list", "of", "symptoms"]'
+    }
+    
+    # List fields that _merge_patient_info extends instead of filling once
+    MERGED_FIELDS = {'symptoms'}
+    
+    # Keywords used to guess which field the assistant's last question asked for
+    TARGET_FIELD_KEYWORDS = {
+        'email': 'email',
+        'phone': 'phone',
+        'zip': 'location',
+        'location': 'location',
+        'city': 'location',
+        'scale': 'pain_level',
+        'pain level': 'pain_level',
+        '1-10': 'pain_level',
+        'when did': 'started_when',
+        'how long': 'started_when',
+        'name': 'patient_name',
+        'going on': 'problem_description',
+        'describe': 'problem_description'
+    }
+    
     def __init__(self):
-        self.llm = ChatOpenAI(
-            api_key=Config.OPENAI_API_KEY,
-            model=Config.OPENAI_MODEL,
-            temperature=0.1  # Low temperature for consistent extraction
+        self.llm = llm_registry.get_chat_model(temperature=0.1)  # Low temperature for consistent extraction
+        
+        # Common replies ("yes", "I have a toothache") repeat across patients
+        self.cache = LRUCache(
+            max_size=Config.EXTRACTION_CACHE_SIZE,
+            ttl_seconds=Config.EXTRACTION_CACHE_TTL_SECONDS
         )
         
         self.extraction_prompt = ChatPromptTemplate.from_messages([
@@ -26,7 +101,7 @@ class PatientDataExtractor:
             Extract structured information from dental conversations.
             
             Always return valid JSON with these fields:
-            {
+            {{
                 "problem_description": "detailed description of dental issue",
                 "pain_level": null or number 1-10,
                 "emergency_status": null or boolean,
@@ -36,37 +111,151 @@ class PatientDataExtractor:
                 "email": "email address if provided",
                 "started_when": "when symptoms began",
                 "symptoms": ["list", "of", "symptoms"]
-            }
+            }}
             
             Use null for missing information. Be precise and accurate."""),
             ("human", "Extract information from this conversation:\n\n{conversation_text}")
         ])
+        self.extraction_chain = llm_registry.get_runnable(
+            "extraction", lambda: self.extraction_prompt | self.llm
+        )
+        
+        # Per-message extraction asks only for fields that are still missing. The
+        # system message never changes, so provider-side prompt caching can reuse it.
+        self.scoped_extraction_prompt = ChatPromptTemplate.from_messages([
+            ("system", """You are an expert medical information extractor for a dental intake conversation.
+Extract only the requested fields from the patient's latest message.
+Return valid JSON with exactly the requested fields and nothing else.
+Use null for anything the message does not mention. Be precise and accurate."""),
+            ("human", "Requested fields:\n{fields_schema}\n\n{question_context}Patient message: {message}")
+        ])
+        self.scoped_extraction_chain = llm_registry.get_runnable(
+            "scoped_extraction", lambda: self.scoped_extraction_prompt | self.llm
+        )
+        self._schema_cache: Dict[Tuple[str, ...], str] = {}
+        
+        # Opt-in: messages from different sessions that arrive together share one call
+        self.batch_extraction_prompt = ChatPromptTemplate.from_messages([
+            ("system", """You are an expert medical information extractor for a dental intake conversation.
+You will receive a JSON list of items. Each item is a message from a DIFFERENT patient.
+For each item, extract only its requested fields from its own message; never use
+information from another item.
+Return valid JSON in this shape: {{"results": [{{"id": <item id>, "fields": {{<requested field>: <value>}}}}]}}
+Include only the fields a message actually mentions and leave out the rest. Be precise and accurate."""),
+            ("human", "{items}")
+        ])
+        self.batch_extraction_chain = llm_registry.get_runnable(
+            "batch_extraction",
+            lambda: self.batch_extraction_prompt | self.llm.bind(response_format={"type": "json_object"})
+        )
+        self.batcher: Optional[MicroBatcher] = None
+        if Config.EXTRACTION_BATCHING_ENABLED:
+            self.batcher = MicroBatcher(
+                self._aextract_batch,
+                max_batch_size=Config.EXTRACTION_BATCH_MAX_SIZE,
+                max_wait_seconds=Config.EXTRACTION_BATCH_MAX_WAIT_MS / 1000,
+                max_in_flight=Config.EXTRACTION_BATCH_MAX_IN_FLIGHT,
+                name="extraction_batch"
+            )
+        
+        # Combined mode: one JSON response carries the extracted fields and the reply
+        self.turn_llm = llm_registry.get_runnable(
+            "combined_turn_llm",
+            lambda: llm_registry.get_chat_model(temperature=0.7).bind(response_format={"type": "json_object"})
+        )
+        
+        self.turn_prompt = ChatPromptTemplate.from_messages([
+            ("system", Config.SYSTEM_PROMPT + Config.COMBINED_TURN_PROMPT),
+            ("system", "{conversation_context}"),
+            MessagesPlaceholder(variable_name="chat_history"),
+            ("human", "Information collected so far:\n{patient_info}\n\nStill missing: {missing_fields}\n\nPatient message: {input}")
+        ])
+        self.turn_chain = llm_registry.get_runnable(
+            "combined_turn", lambda: self.turn_prompt | self.turn_llm
+        )
     
     def extract_from_message(self, message: str, current_info: PatientInfo) -> PatientInfo:
         """
         Extract information from a single message and update current info
         """
+        return async_runner.run(self.aextract_from_message(message, current_info))
+    
+    async def aextract_from_message(self, message: str, current_info: PatientInfo,
+                                    target_field: Optional[str] = None) -> PatientInfo:
+        """
+        Async version of extract_from_message built on ainvoke
+        """
+        updated_info, _ = await self.aextract_turn(message, current_info, target_field)
+        return updated_info
+    
+    @performance_monitor.timer("extraction")
+    @tracer.traced("extraction")
+    async def aextract_turn(self, message: str, current_info: PatientInfo,
+                            target_field: Optional[str] = None) -> Tuple[PatientInfo, Dict[str, Any]]:
+        """
+        Extract information from a single message and report how it was done
+        
+        Args:
+            message: The user's message
+            current_info: Information collected so far
+            target_field: PatientInfo field the assistant just asked about, if known
+            
+        Returns:
+            Tuple of (updated_info, stats) where stats has "llm_skipped" and "latency"
+        """
+        start_time = time.perf_counter()
+        
+        # Short answers like "75201" or "john@x.com" don't need a model call
+        extracted_data = self._rule_based_extract(message, target_field)
+        if extracted_data is not None:
+            updated_info = self._merge_patient_info(current_info, extracted_data)
+            enhanced_info = self._enhance_extracted_info(updated_info, message)
+            
+            latency = time.perf_counter() - start_time
+            performance_monitor.increment_metric('extraction_llm_skipped')
+            performance_monitor.observe('extraction_fast_path_seconds', latency)
+            
+            log_pipeline.event(logger, "extraction.fast_path", target=target_field, fields=list(extracted_data))
+            
+            return enhanced_info, {"llm_skipped": True, "latency": latency}
+        
+        # Nothing left that the message could fill in
+        fields = self._fields_to_extract(current_info, target_field)
+        if not fields:
+            enhanced_info = self._enhance_extracted_info(current_info, message)
+            performance_monitor.increment_metric('extraction_llm_skipped')
+            return enhanced_info, {"llm_skipped": True, "latency": time.perf_counter() - start_time}
+        
+        cache_key = self._cache_key(message, current_info, target_field)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                extracted_data, llm_latency = cached
+                enhanced_info = self._enhance_extracted_info(
+                    self._merge_patient_info(current_info, extracted_data), message
+                )
+                performance_monitor.increment_metric('extraction_cache_hits')
+                performance_monitor.observe('extraction_cache_saved_seconds', llm_latency)
+                return enhanced_info, {"llm_skipped": True, "cache_hit": True,
+                                       "latency": time.perf_counter() - start_time}
+            performance_monitor.increment_metric('extraction_cache_misses')
+        
         try:
-            # Create conversation context including the current message
-            conversation_context = f"""
-Previous information collected:
-- Problem: {current_info.problem_description or 'Not provided'}
-- Pain level: {current_info.pain_level or 'Not provided'}
-- Name: {current_info.patient_name or 'Not provided'}
-- Phone: {current_info.phone or 'Not provided'}
-- Email: {current_info.email or 'Not provided'}
-- Location: {current_info.location or 'Not provided'}
-- Started when: {current_info.started_when or 'Not provided'}
-
-New message: {message}
-"""
+            # Use LangChain to extract only the fields still missing
+            request = (fields, target_field, message)
+            if self.batcher is not None:
+                extracted_data = await self.batcher.submit(request)
+            else:
+                extracted_data = await self._aextract_fields(*request)
             
-            # Use LangChain to extract information
-            chain = self.extraction_prompt | self.llm
-            response = chain.invoke({"conversation_text": conversation_context})
+            llm_latency = time.perf_counter() - start_time
+            performance_monitor.increment_metric('extraction_llm_calls')
+            performance_monitor.observe('extraction_llm_seconds', llm_latency)
+            performance_monitor.observe('extraction_requested_fields', len(fields))
             
-            # Parse the JSON response
-            extracted_data = self._parse_extraction_response(response.content)
+            # Only cache results that don't identify the patient
+            if cache_key is not None and not any(extracted_data.get(field) for field in self.PHI_FIELDS):
+                self.cache.set(cache_key, (extracted_data, llm_latency))
             
             # Update current patient info with extracted data
             updated_info = self._merge_patient_info(current_info, extracted_data)
@@ -74,26 +263,298 @@ New message: {message}
             # Apply additional validation and enhancement
             enhanced_info = self._enhance_extracted_info(updated_info, message)
             
-            # Debug logging
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.info(f"Extracted from '{message[:50]}...': {extracted_data}")
-            logger.info(f"Updated info complete: {enhanced_info.is_complete()}")
-            logger.info(f"Missing fields: {enhanced_info.missing_fields()}")
+            # Field values are redacted when written; only built when DEBUG is on
+            if log_pipeline.should_log(logger, "extraction.result", logging.DEBUG):
+                log_pipeline.log_sampled(logger, "extraction.result", level=logging.DEBUG, extracted=extracted_data)
             
-            return enhanced_info
+            return enhanced_info, {"llm_skipped": False, "latency": time.perf_counter() - start_time}
             
         except Exception as e:
-            print(f"Error in extraction: {e}")
-            return current_info
+            log_pipeline.event(logger, "extraction.error", level=logging.ERROR, stage="extraction", error=describe_error(e))
+            return current_info, {"llm_skipped": False, "latency": time.perf_counter() - start_time}
+    
+    @performance_monitor.timer("combined_turn")
+    @tracer.traced("combined_turn")
+    async def aextract_and_reply(self, message: str, current_info: PatientInfo,
+                                 chat_history: List[BaseMessage],
+                                 target_field: Optional[str] = None,
+                                 conversation_context: str = "") -> Tuple[PatientInfo, Dict[str, Any]]:
+        """
+        Extract information and generate the assistant reply with a single LLM call
+        
+        Args:
+            message: The user's message
+            current_info: Information collected so far
+            chat_history: Recent conversation messages, excluding this message
+            target_field: PatientInfo field the assistant just asked about, if known
+            conversation_context: Context that doesn't fit in chat_history, such as the
+                summary of turns trimmed from it (ContextBuilder's system_context)
+            
+        Returns:
+            Tuple of (updated_info, stats). stats has "reply" and "next_missing_field"
+            (None when the LLM was skipped), "llm_skipped" and "latency".
+        """
+        start_time = time.perf_counter()
+        
+        # Apply the rule-based pre-pass first so the reply sees those fields, and so
+        # a turn that completes the intake needs no model call at all
+        rule_data = self._rule_based_extract(message, target_field)
+        if rule_data is not None:
+            current_info = self._enhance_extracted_info(self._merge_patient_info(current_info, rule_data), message)
+            if current_info.is_complete():
+                performance_monitor.increment_metric('extraction_llm_skipped')
+                latency = time.perf_counter() - start_time
+                return current_info, {"reply": None, "next_missing_field": None, "llm_skipped": True, "latency": latency}
+        
+        try:
+            with tracer.span("llm.combined_turn", llm_attributes(self.llm)) as span:
+                response = await self.turn_chain.ainvoke({
+                    "conversation_context": conversation_context or "No earlier context.",
+                    "chat_history": chat_history,
+                    "patient_info": self._format_known_info(current_info),
+                    "missing_fields": ", ".join(current_info.missing_fields()) or "nothing",
+                    "input": message
+                })
+                span.record_usage(response)
+            
+            performance_monitor.increment_metric('extraction_llm_calls')
+            performance_monitor.observe('combined_turn_llm_seconds', time.perf_counter() - start_time)
+            performance_monitor.record_usage('combined_turn', response)
+            
+            turn_data = self._parse_extraction_response(response.content)
+            extracted_data = turn_data.get("extracted_fields") or {}
+            
+            updated_info = self._merge_patient_info(current_info, extracted_data)
+            enhanced_info = self._enhance_extracted_info(updated_info, message)
+            
+            next_field = turn_data.get("next_missing_field")
+            if next_field not in PatientInfo.__fields__:
+                next_field = None
+            
+            reply = turn_data.get("reply")
+            return enhanced_info, {
+                "reply": reply.strip() if isinstance(reply, str) and reply.strip() else None,
+                "next_missing_field": next_field,
+                "llm_skipped": False,
+                "latency": time.perf_counter() - start_time
+            }
+            
+        except Exception as e:
+            log_pipeline.event(logger, "extraction.error", level=logging.ERROR, stage="combined_turn", error=describe_error(e))
+            return current_info, {"reply": None, "next_missing_field": None, "llm_skipped": False,
+                                  "latency": time.perf_counter() - start_time}
+    
+    def _format_known_info(self, info: PatientInfo) -> str:
+        """
+        Format the collected fields for a prompt, skipping empty ones
+        """
+        lines = [f"- {field}: {value}" for field, value in info.dict().items() if value not in (None, "", [])]
+        return "\n".join(lines) if lines else "Nothing yet"
+    
+    async def _aextract_fields(self, fields: Tuple[str, ...], target_field: Optional[str],
+                               message: str) -> Dict[str, Any]:
+        """
+        Extract the requested fields from one message with its own LLM call
+        """
+        question_context = ""
+        if target_field:
+            question_context = f"The assistant just asked for: {target_field}\n\n"
+        
+        with tracer.span("llm.extraction", llm_attributes(self.llm)) as span:
+            response = await self.scoped_extraction_chain.ainvoke({
+                "fields_schema": self._fields_schema(fields),
+                "question_context": question_context,
+                "message": message
+            })
+            span.set_attribute("extraction.fields", len(fields))
+            span.record_usage(response)
+        self._observe_output_tokens('extraction', response)
+        
+        # Ignore anything that was not asked for
+        return {
+            key: value for key, value in self._parse_extraction_response(response.content).items()
+            if key in fields
+        }
+    
+    async def _aextract_batch(self, requests: List[Tuple[Tuple[str, ...], Optional[str], str]]) -> List[Dict[str, Any]]:
+        """
+        MicroBatcher callback: extract fields for messages from several sessions in one call
+        
+        Items the model leaves out of its answer get no new information, the
+        same as a failed single extraction.
+        """
+        if len(requests) == 1:
+            return [await self._aextract_fields(*requests[0])]
+        
+        items = [
+            {
+                "id": index,
+                "requested_fields": {field: self.EXTRACTION_FIELDS[field].strip('"') for field in fields},
+                "asked_for": target_field,
+                "message": message
+            }
+            for index, (fields, target_field, message) in enumerate(requests)
+        ]
+        
+        # Traced under the session whose call started the batch
+        with tracer.span("llm.extraction_batch", llm_attributes(self.llm)) as span:
+            response = await self.batch_extraction_chain.ainvoke({"items": json.dumps(items)})
+            span.set_attribute("extraction.batch_size", len(requests))
+            span.record_usage(response)
+        self._observe_output_tokens('extraction_batch', response)
+        
+        results_by_id = {}
+        for result in self._parse_extraction_response(response.content).get("results", []):
+            if isinstance(result, dict) and isinstance(result.get("fields"), dict):
+                results_by_id[result.get("id")] = result["fields"]
+        
+        return [
+            {key: value for key, value in results_by_id.get(index, {}).items() if key in fields}
+            for index, (fields, _, _) in enumerate(requests)
+        ]
+    
+    def _observe_output_tokens(self, call_site: str, response: Any):
+        performance_monitor.record_usage(call_site, response)
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            performance_monitor.observe('extraction_output_tokens', usage.get("output_tokens", 0))
+    
+    def _fields_to_extract(self, current_info: PatientInfo, target_field: Optional[str]) -> Tuple[str, ...]:
+        """
+        Fields worth asking the model for: the empty ones, the merged list
+        fields and the one just asked about
+        
+        Other filled fields are skipped because _merge_patient_info never
+        overwrites them; symptoms are always asked for since new ones are
+        added to the list.
+        """
+        info_dict = current_info.dict()
+        return tuple(
+            field for field in self.EXTRACTION_FIELDS
+            if field == target_field or field in self.MERGED_FIELDS or info_dict.get(field) in (None, "", [])
+        )
+    
+    def _fields_schema(self, fields: Tuple[str, ...]) -> str:
+        """
+        JSON schema text for a set of fields, built once per distinct set
+        """
+        schema = self._schema_cache.get(fields)
+        if schema is None:
+            lines = [f'    "{field}": {self.EXTRACTION_FIELDS[field]}' for field in fields]
+            schema = "{\n" + ",\n".join(lines) + "\n}"
+            self._schema_cache[fields] = schema
+        return schema
+    
+    def _cache_key(self, message: str, current_info: PatientInfo, target_field: Optional[str]) -> Optional[tuple]:
+        """
+        Build the extraction cache key, or None if the message must not be cached
+        
+        The key is the normalized message plus which fields are already filled,
+        since that decides what the merge can still change.
+        """
+        if not Config.EXTRACTION_CACHE_ENABLED or target_field in self.PHI_FIELDS:
+            return None
+        
+        normalized = " ".join(message.lower().split()).strip(" .!?,")
+        if not normalized or len(normalized) > self.CACHE_MAX_MESSAGE_LENGTH:
+            return None
+        
+        # Digits and "@" mean phone numbers, ZIP codes or emails
+        if "@" in normalized or any(char.isdigit() for char in normalized):
+            return None
+        
+        filled = tuple(bool(value) for value in current_info.dict().values())
+        return normalized, filled, target_field
+    
+    def detect_target_field(self, question: Optional[str]) -> Optional[str]:
+        """
+        Guess which PatientInfo field an assistant message is asking for
+        """
+        if not question:
+            return None
+        
+        question_lower = question.lower()
+        best_field, best_position = None, len(question_lower)
+        for keyword, field in self.TARGET_FIELD_KEYWORDS.items():
+            position = question_lower.find(keyword)
+            if position != -1 and position < best_position:
+                best_field, best_position = field, position
+        
+        return best_field
+    
+    def _rule_based_extract(self, message: str, target_field: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Deterministic pre-pass for short answers (ZIP code, phone, email, pain score, time frame)
+        
+        Returns the extracted fields only when the whole message is accounted for,
+        otherwise None so the message goes to the LLM.
+        """
+        text = message.strip()
+        if not text or len(text) > self.FAST_PATH_MAX_LENGTH:
+            return None
+        
+        extracted = {}
+        residue = text
+        
+        email = TextProcessor.extract_email(residue)
+        if email:
+            extracted["email"] = email
+            residue = residue.replace(email, " ")
+        
+        phone_match = self.PHONE_PATTERN.search(residue)
+        if phone_match:
+            phone = TextProcessor.extract_phone(phone_match.group(0))
+            if phone:
+                extracted["phone"] = phone
+                residue = residue[:phone_match.start()] + " " + residue[phone_match.end():]
+        
+        zip_match = self.ZIP_PATTERN.search(residue)
+        if zip_match:
+            is_valid, zip_code, _ = DataValidator.validate_zip_code(zip_match.group(0))
+            if is_valid:
+                extracted["location"] = zip_code
+                residue = residue[:zip_match.start()] + " " + residue[zip_match.end():]
+        
+        residue = residue.lower()
+        
+        time_frame = DataValidator.extract_time_frame(residue)
+        if time_frame:
+            extracted["started_when"] = time_frame
+            residue = residue.replace(time_frame, " ", 1)
+        
+        # A bare number only means a pain score when that's what was asked
+        if target_field == "pain_level" or "pain" in residue or "10" in residue:
+            pain_match = self.PAIN_ANSWER_PATTERN.search(residue)
+            if pain_match:
+                is_valid, level, _ = DataValidator.validate_pain_level(pain_match.group(1))
+                if is_valid:
+                    extracted["pain_level"] = level
+                    residue = residue[:pain_match.start()] + " " + residue[pain_match.end():]
+        
+        if not extracted:
+            return None
+        
+        # Anything left over might carry information only the LLM can pick up
+        leftover_words = re.findall(r"[a-z0-9']+", residue)
+        if any(word not in self.FILLER_WORDS for word in leftover_words):
+            return None
+        
+        if target_field and target_field not in extracted:
+            # Either contact method satisfies a request for contact info
+            if not (target_field in self.CONTACT_FIELDS and self.CONTACT_FIELDS & extracted.keys()):
+                return None
+        
+        return extracted
     
     def extract_from_conversation(self, conversation_text: str) -> PatientInfo:
         """
         Extract information from full conversation history
         """
         try:
-            chain = self.extraction_prompt | self.llm
-            response = chain.invoke({"conversation_text": conversation_text})
+            with tracer.span("llm.conversation_extraction", llm_attributes(self.llm)) as span:
+                response = self.extraction_chain.invoke({"conversation_text": conversation_text})
+                span.record_usage(response)
+            performance_monitor.record_usage('conversation_extraction', response)
             
             extracted_data = self._parse_extraction_response(response.content)
             patient_info = PatientInfo(**extracted_data)
@@ -104,7 +565,7 @@ New message: {message}
             return enhanced_info
             
         except Exception as e:
-            print(f"Error in conversation extraction: {e}")
+            log_pipeline.event(logger, "extraction.error", level=logging.ERROR, stage="conversation_extraction", error=describe_error(e))
             return PatientInfo()
     
     def _parse_extraction_response(self, response_text: str) -> Dict[str, Any]:
@@ -122,7 +583,9 @@ New message: {message}
                 return json.loads(response_text)
                 
         except json.JSONDecodeError:
-            print(f"Failed to parse JSON: {response_text}")
+            # The response repeats patient details; "content" is redacted when written
+            log_pipeline.event(logger, "extraction.parse_failed", level=logging.WARNING,
+                               chars=len(response_text), content=response_text[:200])
             return {}
     
     def _merge_patient_info(self, current: PatientInfo, extracted: Dict[str, Any]) -> PatientInfo:
@@ -150,7 +613,7 @@ New message: {message}
         try:
             return PatientInfo(**current_dict)
         except Exception as e:
-            print(f"Error creating PatientInfo: {e}")
+            log_pipeline.event(logger, "extraction.error", level=logging.ERROR, stage="merge", error=describe_error(e))
             return current
     
     def _enhance_extracted_info(self, patient_info: PatientInfo, text: str) -> PatientInfo:
@@ -159,35 +622,36 @@ New message: {message}
         """
         info_dict = patient_info.dict()
         
+        # One pass finds the pain level, emergency keywords and time frame
+        scan = text_scanner.scan(text)
+        
         # Extract pain level from text if not already set
         if not info_dict.get("pain_level"):
-            pain_level = DataValidator.extract_pain_level_from_text(text)
+            pain_level = scan.pain_level
             if pain_level:
                 info_dict["pain_level"] = pain_level
         
         # Detect emergency status if not set
         if info_dict.get("emergency_status") is None:
             is_emergency = (
-                DataValidator.detect_emergency_keywords(text) or
-                (info_dict.get("pain_level", 0) >= Config.PAIN_EMERGENCY_THRESHOLD)
+                scan.is_emergency or
+                ((info_dict.get("pain_level") or 0) >= Config.PAIN_EMERGENCY_THRESHOLD)
             )
             info_dict["emergency_status"] = is_emergency
         
         # Extract time frame if not set
         if not info_dict.get("started_when"):
-            time_frame = DataValidator.extract_time_frame(text)
+            time_frame = scan.time_frame
             if time_frame:
                 info_dict["started_when"] = time_frame
         
         # Enhanced contact info extraction for consolidated messages
         if not info_dict.get("phone"):
-            from utils import TextProcessor
             phone = TextProcessor.extract_phone(text)
             if phone:
                 info_dict["phone"] = phone
         
         if not info_dict.get("email"):
-            from utils import TextProcessor
             email = TextProcessor.extract_email(text)
             if email:
                 info_dict["email"] = email
@@ -195,7 +659,6 @@ New message: {message}
         # Extract name from contact info format like "John Smith, email, phone"
         if not info_dict.get("patient_name"):
             # Look for name patterns at the beginning of contact info
-            import re
             name_pattern = r'^([A-Za-z\s]+)(?=,|\s*[a-zA-Z0-9._%+-]+@)'
             match = re.search(name_pattern, text.strip())
             if match:
@@ -230,23 +693,31 @@ New message: {message}
         try:
             return PatientInfo(**info_dict)
         except Exception as e:
-            print(f"Error in enhancement: {e}")
+            log_pipeline.event(logger, "extraction.error", level=logging.ERROR, stage="enhancement", error=describe_error(e))
             return patient_info
 
 class SmartQuestionGenerator:
     """Generate smart follow-up questions based on missing information"""
     
+    # Only the end of the conversation is used; callers can pass just this much
+    HISTORY_WINDOW_CHARS = 500
+    PROMPT_CONTEXT_CHARS = 300
+    
     def __init__(self):
-        self.llm = ChatOpenAI(
-            api_key=Config.OPENAI_API_KEY,
-            model=Config.OPENAI_MODEL,
-            temperature=0.7  # Higher temperature for more natural questions
-        )
+        self.llm = llm_registry.get_chat_model(temperature=0.7)  # Higher temperature for more natural questions
     
     def generate_follow_up_question(self, patient_info: PatientInfo, conversation_history: str) -> str:
         """
         Generate appropriate follow-up question based on missing information
         """
+        return async_runner.run(self.agenerate_follow_up_question(patient_info, conversation_history))
+    
+    @performance_monitor.timer("question")
+    @tracer.traced("question")
+    async def agenerate_follow_up_question(self, patient_info: PatientInfo, conversation_history: str) -> str:
+        """
+        Async version of generate_follow_up_question built on ainvoke
+        """
         missing_fields = patient_info.missing_fields()
         
         if not missing_fields:
@@ -256,7 +727,7 @@ class SmartQuestionGenerator:
         context = {
             "missing_fields": missing_fields,
             "current_info": patient_info.dict(),
-            "conversation_history": conversation_history[-500:]  # Last 500 chars
+            "conversation_history": conversation_history[-self.HISTORY_WINDOW_CHARS:]
         }
         
         prompt = f"""
@@ -266,7 +737,7 @@ class SmartQuestionGenerator:
         Missing information: {', '.join(missing_fields)}
         
         Current conversation context:
-        {conversation_history[-300:]}
+        {conversation_history[-self.PROMPT_CONTEXT_CHARS:]}
         
         Guidelines:
         - Ask for the most critical missing information first
@@ -279,10 +750,13 @@ class SmartQuestionGenerator:
         """
         
         try:
-            response = self.llm.invoke([HumanMessage(content=prompt)])
+            with tracer.span("llm.question", llm_attributes(self.llm)) as span:
+                response = await self.llm.ainvoke([HumanMessage(content=prompt)])
+                span.record_usage(response)
+            performance_monitor.record_usage('question', response)
             return response.content.strip()
         except Exception as e:
-            print(f"Error generating question: {e}")
+            log_pipeline.event(logger, "extraction.error", level=logging.ERROR, stage="question", error=describe_error(e))
             return self._get_default_question(missing_fields[0])
     
     def _get_default_question(self, missing_field: str) -> str:
@@ -1,42 +1,272 @@
 """
 DentalChat API integration module
 """
-import requests
+import asyncio
+import random
+import threading
+import time
+import httpx
 import json
 from typing import Dict, Any, Optional, List
 from models import DentalChatPost, PatientInfo, APIResponse
+from cache import SingleFlightCache
+from dentist_directory import DentistDirectory, load_configured_directory
 from config import Config
+from utils import LoggingUtils, async_runner, performance_monitor
+from tracing import tracer
 import logging
 
 # Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class CircuitOpenError(Exception):
+    """Raised instead of calling DentalChat while the circuit breaker is open"""
+
+class CircuitBreaker:
+    """
+    Fail fast while a backend is down
+    
+    After failure_threshold consecutive failures the circuit opens and calls
+    are rejected without touching the network. After reset_timeout seconds
+    one trial call is let through (half-open): success closes the circuit,
+    failure opens it again. A trial that ends without a verdict (e.g. it was
+    cancelled) is released so the next call can try.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self) -> str:
+        """Current state: closed, open or half_open"""
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+    
+    def allow_request(self) -> bool:
+        """Check whether a call may go out now"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._trial_in_progress = False
+            
+            if self._state == self.HALF_OPEN and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            return False
+    
+    def record_success(self):
+        """Close the circuit after a successful call"""
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_progress = False
+    
+    def release_trial(self):
+        """Give up a call that ended without a result, without counting it either way"""
+        with self._lock:
+            self._trial_in_progress = False
+    
+    def record_failure(self):
+        """Count a failed call, opening the circuit at the threshold"""
+        with self._lock:
+            self._failures += 1
+            self._trial_in_progress = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"DentalChat circuit opened after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
 class DentalChatAPI:
-    """Handle API interactions with DentalChat platform"""
+    """
+    Handle API interactions with DentalChat platform
+    
+    Calls go through a pooled httpx.AsyncClient with keep-alive, separate
+    connect and read timeouts, jittered retries and a circuit breaker. The
+    a* methods are the async API; the plain methods are blocking wrappers
+    that run them on the shared AsyncRunner loop.
+    
+    GET requests are retried on timeouts, connection errors, 429 and 5xx
+    gateway errors. Post creation is retried the same way when it carries an
+    idempotency key; without one it is retried only when the connection
+    could not be opened, i.e. the request was never sent.
+    """
+    
+    RETRY_STATUS_CODES = {429, 502, 503, 504}
     
     def __init__(self):
         self.base_url = Config.DENTALCHAT_BASE_URL
         self.api_key = Config.DENTALCHAT_API_KEY
-        self.session = requests.Session()
+        self.max_retries = Config.DENTALCHAT_MAX_RETRIES
+        self.backoff_base = Config.DENTALCHAT_BACKOFF_BASE_SECONDS
+        self.backoff_max = Config.DENTALCHAT_BACKOFF_MAX_SECONDS
         
-        # Set default headers
-        self.session.headers.update({
+        # Default headers
+        self.headers = {
             'Content-Type': 'application/json',
             'Authorization': f'Bearer {self.api_key}',
             'User-Agent': 'DentalChat-AI-Bot/1.0'
-        })
+        }
+        self.timeout = httpx.Timeout(
+            connect=Config.DENTALCHAT_CONNECT_TIMEOUT,
+            read=Config.DENTALCHAT_READ_TIMEOUT,
+            write=Config.DENTALCHAT_READ_TIMEOUT,
+            pool=Config.DENTALCHAT_CONNECT_TIMEOUT
+        )
+        self.limits = httpx.Limits(
+            max_connections=Config.DENTALCHAT_MAX_CONNECTIONS,
+            max_keepalive_connections=Config.DENTALCHAT_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=Config.DENTALCHAT_KEEPALIVE_EXPIRY
+        )
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=Config.DENTALCHAT_CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=Config.DENTALCHAT_CIRCUIT_RESET_SECONDS
+        )
+        
+        # Offline dentist search, used for ZIP codes it knows (see dentist_directory.py)
+        self.dentist_directory: Optional[DentistDirectory] = load_configured_directory()
+        
+        # Dentist search results, shared by patients searching the same area
+        self.dentist_cache: Optional[SingleFlightCache] = None
+        if Config.DENTIST_CACHE_ENABLED:
+            self.dentist_cache = SingleFlightCache(
+                max_size=Config.DENTIST_CACHE_SIZE,
+                ttl_seconds=Config.DENTIST_CACHE_TTL_SECONDS,
+                stale_seconds=Config.DENTIST_CACHE_STALE_SECONDS
+            )
+        
+        # An AsyncClient belongs to the event loop it was first used on. Clients may
+        # keep their loop alive through open connections, so entries for closed
+        # loops are dropped explicitly (see _client) rather than by weak reference
+        self._clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+        self._clients_lock = threading.Lock()
     
-    def create_patient_post(self, patient_info: PatientInfo) -> APIResponse:
+    def _client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._clients_lock:
+            client = self._clients.get(loop)
+            if client is None or client.is_closed:
+                for old_loop in [old_loop for old_loop in self._clients if old_loop.is_closed()]:
+                    del self._clients[old_loop]
+                client = httpx.AsyncClient(
+                    base_url=self.base_url,
+                    headers=self.headers,
+                    timeout=self.timeout,
+                    limits=self.limits
+                )
+                self._clients[loop] = client
+            return client
+    
+    async def aclose(self):
+        """Close the connection pool for the running event loop"""
+        with self._clients_lock:
+            client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+    
+    def _backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """Full-jitter exponential backoff, honoring a short Retry-After"""
+        if response is not None and response.headers.get("Retry-After", "").isdigit():
+            return min(float(response.headers["Retry-After"]), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+    
+    async def _request(self, method: str, path: str, idempotent: bool, endpoint: str, **kwargs) -> httpx.Response:
+        """
+        Send a request with retries and circuit breaking
+        
+        The whole call, retries included, is timed as the "api_<endpoint>"
+        stage, traced as a "dentalchat.<endpoint>" span and logged with
+        LoggingUtils.log_api_call.
+        
+        Raises:
+            CircuitOpenError: The circuit is open, nothing was sent
+            httpx.HTTPError: The last attempt failed at the transport level
+        """
+        start_time = time.perf_counter()
+        success = False
+        try:
+            with tracer.span(f"dentalchat.{endpoint}", {"http.method": method}) as span:
+                response = await self._send(method, path, idempotent, **kwargs)
+                span.set_attribute("http.status_code", response.status_code)
+            success = response.status_code < 400
+            return response
+        finally:
+            elapsed = time.perf_counter() - start_time
+            performance_monitor.observe_latency(f"api_{endpoint}", elapsed)
+            LoggingUtils.log_api_call(endpoint, success, elapsed)
+    
+    async def _send(self, method: str, path: str, idempotent: bool, **kwargs) -> httpx.Response:
+        attempt = 0
+        while True:
+            if not self.circuit_breaker.allow_request():
+                raise CircuitOpenError("DentalChat is temporarily unavailable")
+            
+            try:
+                response = await self._client().request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                self.circuit_breaker.record_failure()
+                # Without an idempotent call only a failed connect is safe to repeat
+                retryable = idempotent or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                logger.warning(f"DentalChat {method} {path} failed ({type(e).__name__}), retrying")
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                tracer.current_span().set_attribute("http.retries", attempt)
+                continue
+            except BaseException:
+                # Cancelled (client gone, timeout) or a non-transport error; a
+                # half-open trial must not stay claimed or the circuit never recovers
+                self.circuit_breaker.release_trial()
+                raise
+            
+            if response.status_code >= 500:
+                self.circuit_breaker.record_failure()
+            else:
+                self.circuit_breaker.record_success()
+            
+            if idempotent and response.status_code in self.RETRY_STATUS_CODES and attempt < self.max_retries:
+                logger.warning(f"DentalChat {method} {path} returned {response.status_code}, retrying")
+                await asyncio.sleep(self._backoff(attempt, response))
+                attempt += 1
+                tracer.current_span().set_attribute("http.retries", attempt)
+                continue
+            
+            return response
+    
+    def create_patient_post(self, patient_info: PatientInfo, idempotency_key: Optional[str] = None) -> APIResponse:
         """
         Create a patient post on DentalChat platform
         
         Args:
             patient_info: Complete patient information
+            idempotency_key: Sent as Idempotency-Key so repeats create one post
             
         Returns:
             APIResponse with success status and post details
         """
+        return async_runner.run(self.acreate_patient_post(patient_info, idempotency_key))
+    
+    async def acreate_patient_post(self, patient_info: PatientInfo, idempotency_key: Optional[str] = None) -> APIResponse:
+        """
+        Async version of create_patient_post
+        """
         try:
             # Validate patient info is complete
             if not patient_info.is_complete():
@@ -54,10 +284,10 @@ class DentalChatAPI:
             payload = self._prepare_post_payload(post_data)
             
             # Make API request
-            response = self.session.post(
-                f"{self.base_url}/patient/create-post",
-                json=payload,
-                timeout=30
+            headers = {'Idempotency-Key': idempotency_key} if idempotency_key else None
+            response = await self._request(
+                "POST", "/patient/create-post", idempotent=bool(idempotency_key), endpoint="create_post",
+                json=payload, headers=headers
             )
             
             if response.status_code == 200 or response.status_code == 201:
@@ -76,15 +306,23 @@ class DentalChatAPI:
                 return APIResponse(
                     success=False,
                     message="Failed to create post",
+                    data={"status_code": response.status_code},
                     error=error_msg
                 )
-                
-        except requests.RequestException as e:
-            logger.error(f"API request failed: {e}")
+        
+        except CircuitOpenError as e:
+            return APIResponse(
+                success=False,
+                message=str(e),
+                error="CIRCUIT_OPEN"
+            )
+        except httpx.HTTPError as e:
+            error = str(e) or type(e).__name__
+            logger.error(f"API request failed: {error}")
             return APIResponse(
                 success=False,
                 message="Network error occurred",
-                error=str(e)
+                error=error
             )
         except Exception as e:
             logger.error(f"Unexpected error: {e}")
@@ -94,30 +332,70 @@ class DentalChatAPI:
                 error=str(e)
             )
     
-    def get_nearby_dentists(self, zip_code: str, emergency: bool = False) -> APIResponse:
+    def get_nearby_dentists(self, zip_code: str, emergency: bool = False,
+                            radius: int = 25, limit: int = 10) -> APIResponse:
         """
         Get list of nearby dentists
         
+        Successful results are cached per (zip_code, emergency, radius, limit)
+        when Config.DENTIST_CACHE_ENABLED is set; see SingleFlightCache.
+        
         Args:
             zip_code: Patient's ZIP code
             emergency: Whether this is an emergency case
+            radius: Search radius in miles
+            limit: Maximum number of dentists
             
         Returns:
             APIResponse with dentist list
         """
+        return async_runner.run(self.aget_nearby_dentists(zip_code, emergency, radius, limit))
+    
+    async def aget_nearby_dentists(self, zip_code: str, emergency: bool = False,
+                                   radius: int = 25, limit: int = 10) -> APIResponse:
+        """
+        Async version of get_nearby_dentists
+        """
+        if self.dentist_cache is None:
+            return await self._afind_dentists(zip_code, emergency, radius, limit)
+        
+        return await self.dentist_cache.get_or_load(
+            (zip_code, emergency, radius, limit),
+            lambda: self._afind_dentists(zip_code, emergency, radius, limit),
+            cacheable=lambda response: response.success
+        )
+    
+    async def _afind_dentists(self, zip_code: str, emergency: bool, radius: int, limit: int) -> APIResponse:
+        """
+        Search the local directory when it knows the ZIP code, else DentalChat
+        
+        For emergencies the local directory only returns dentists with
+        emergency hours.
+        """
+        if self.dentist_directory is not None:
+            dentists = self.dentist_directory.search(zip_code, radius, emergency_only=emergency, limit=limit)
+            if dentists is not None:
+                return APIResponse(
+                    success=True,
+                    message=f"Found {len(dentists)} dentists nearby",
+                    data={"dentists": dentists}
+                )
+        return await self._asearch_dentists(zip_code, emergency, radius, limit)
+    
+    async def _asearch_dentists(self, zip_code: str, emergency: bool, radius: int, limit: int) -> APIResponse:
+        """
+        Call the DentalChat dentist search, bypassing the cache
+        """
         try:
             params = {
                 'zip_code': zip_code,
                 'emergency': emergency,
-                'radius': 25,  # 25 mile radius
-                'limit': 10
+                'radius': radius,
+                'limit': limit
             }
             
-            response = self.session.get(
-                f"{self.base_url}/dentists/search",
-                params=params,
-                timeout=30
-            )
+            response = await self._request("GET", "/dentists/search", idempotent=True, endpoint="dentist_search",
+                                           params=params)
             
             if response.status_code == 200:
                 dentists = response.json().get('dentists', [])
@@ -132,13 +410,16 @@ class DentalChatAPI:
                     message="Failed to find nearby dentists",
                     error=self._parse_error_response(response)
                 )
-                
+        
+        except CircuitOpenError as e:
+            return APIResponse(success=False, message=str(e), error="CIRCUIT_OPEN")
         except Exception as e:
-            logger.error(f"Error finding dentists: {e}")
+            error = str(e) or type(e).__name__
+            logger.error(f"Error finding dentists: {error}")
             return APIResponse(
                 success=False,
                 message="Error finding nearby dentists",
-                error=str(e)
+                error=error
             )
     
     def get_post_status(self, post_id: str) -> APIResponse:
@@ -151,11 +432,14 @@ class DentalChatAPI:
         Returns:
             APIResponse with post status
         """
+        return async_runner.run(self.aget_post_status(post_id))
+    
+    async def aget_post_status(self, post_id: str) -> APIResponse:
+        """
+        Async version of get_post_status
+        """
         try:
-            response = self.session.get(
-                f"{self.base_url}/patient/post/{post_id}",
-                timeout=30
-            )
+            response = await self._request("GET", f"/patient/post/{post_id}", idempotent=True, endpoint="post_status")
             
             if response.status_code == 200:
                 post_data = response.json()
@@ -170,13 +454,16 @@ class DentalChatAPI:
                     message="Failed to get post status",
                     error=self._parse_error_response(response)
                 )
-                
+        
+        except CircuitOpenError as e:
+            return APIResponse(success=False, message=str(e), error="CIRCUIT_OPEN")
         except Exception as e:
-            logger.error(f"Error getting post status: {e}")
+            error = str(e) or type(e).__name__
+            logger.error(f"Error getting post status: {error}")
             return APIResponse(
                 success=False,
                 message="Error retrieving post status",
-                error=str(e)
+                error=error
             )
     
     def _prepare_post_payload(self, post_data: DentalChatPost) -> Dict[str, Any]:
@@ -205,7 +492,7 @@ class DentalChatAPI:
             }
         }
     
-    def _parse_error_response(self, response: requests.Response) -> str:
+    def _parse_error_response(self, response: httpx.Response) -> str:
         """
         Parse error response from API
         """
@@ -225,7 +512,7 @@ class MockDentalChatAPI(DentalChatAPI):
         self.mock_responses = True
         logger.info("Using Mock DentalChat API for demo")
     
-    def create_patient_post(self, patient_info: PatientInfo) -> APIResponse:
+    def create_patient_post(self, patient_info: PatientInfo, idempotency_key: Optional[str] = None) -> APIResponse:
         """
         Mock post creation for demo
         """
@@ -237,9 +524,9 @@ class MockDentalChatAPI(DentalChatAPI):
                 error="INCOMPLETE_DATA"
             )
         
-        # Simulate successful post creation
+        # Simulate successful post creation; a repeated key gets the same post
         import uuid
-        post_id = str(uuid.uuid4())[:8]
+        post_id = str(uuid.uuid5(uuid.NAMESPACE_URL, idempotency_key) if idempotency_key else uuid.uuid4())[:8]
         
         return APIResponse(
             success=True,
@@ -253,7 +540,13 @@ class MockDentalChatAPI(DentalChatAPI):
             }
         )
     
-    def get_nearby_dentists(self, zip_code: str, emergency: bool = False) -> APIResponse:
+    async def acreate_patient_post(self, patient_info: PatientInfo, idempotency_key: Optional[str] = None) -> APIResponse:
+        """
+        Mock post creation for demo (async)
+        """
+        return self.create_patient_post(patient_info, idempotency_key)
+    
+    async def _asearch_dentists(self, zip_code: str, emergency: bool, radius: int, limit: int) -> APIResponse:
         """
         Mock dentist search
         """
@@ -284,7 +577,7 @@ class MockDentalChatAPI(DentalChatAPI):
         return APIResponse(
             success=True,
             message=f"Found {len(mock_dentists)} dentists nearby (DEMO MODE)",
-            data={"dentists": mock_dentists}
+            data={"dentists": mock_dentists[:limit]}
         )
     
     def get_post_status(self, post_id: str) -> APIResponse:
@@ -303,6 +596,12 @@ class MockDentalChatAPI(DentalChatAPI):
             }
         )
 
+    async def aget_post_status(self, post_id: str) -> APIResponse:
+        """
+        Mock post status (async)
+        """
+        return self.get_post_status(post_id)
+
 def get_api_client(use_mock: bool = True) -> DentalChatAPI:
     """
     Factory function to get appropriate API client
@@ -0,0 +1,396 @@
+"""
+Local dentist directory with a grid index for DentalChat AI Automation
+"""
+import argparse
+import csv
+import json
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE_LAT = 69.0
+
+# Grid cell size; about 17 miles north-south, so a 25 mile search reads 4-5 rows
+DEFAULT_CELL_DEGREES = 0.25
+
+FORMAT_VERSION = 1
+
+# Fixed-width text columns, so the whole roster can be memory-mapped
+NAME_DTYPE = "S40"
+PRACTICE_DTYPE = "S48"
+
+def parse_zip(zip_code: str) -> Optional[int]:
+    """First five digits of a ZIP code as an int, or None if it is not one"""
+    digits = str(zip_code).strip()[:5]
+    return int(digits) if len(digits) == 5 and digits.isdigit() else None
+
+def haversine_miles(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle distance in miles from one point to many"""
+    lat1 = math.radians(lat)
+    lat2 = np.radians(lats.astype(np.float64))
+    dlat = lat2 - lat1
+    dlon = np.radians(lons.astype(np.float64)) - math.radians(lon)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def unit_vectors(lats: np.ndarray, lons: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Points on the unit sphere; the chord between two of them gives their distance"""
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    return np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)
+
+def chord_to_miles(chord_squared: np.ndarray) -> np.ndarray:
+    """Haversine distance from the squared chord between unit vectors"""
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.minimum(np.sqrt(chord_squared) / 2, 1.0))
+
+class DentistDirectory:
+    """
+    ZIP centroids and a dentist roster in flat NumPy arrays
+    
+    Dentists are stored sorted by grid cell (row-major over lat/lon), with
+    the occupied cell ids and their start offsets alongside. The cells of
+    one grid row within a longitude range are therefore one contiguous slice
+    of the roster, and a radius search reads one slice per row of its
+    bounding box. Each dentist also has a precomputed unit vector, so the
+    candidates are filtered and ranked by squared chord length (the
+    haversine distance without any trigonometry) and only the results are
+    converted to miles.
+    
+    save() writes one .npy file per array; load() memory-maps them, so
+    several worker processes share one copy through the page cache and
+    start-up does not parse anything. The grid ignores the antimeridian,
+    which is fine for US ZIP codes.
+    """
+    
+    DENTIST_COLUMNS = ("lat", "lon", "x", "y", "z", "rating", "emergency", "zip", "name", "practice")
+    
+    def __init__(self, zip_codes: np.ndarray, zip_lat: np.ndarray, zip_lon: np.ndarray,
+                 dentists: Dict[str, np.ndarray], cell_ids: np.ndarray, cell_offsets: np.ndarray,
+                 cell_degrees: float):
+        """
+        Use build() or load(); this expects arrays already in index order
+        """
+        self.zip_codes = zip_codes
+        self.zip_lat = zip_lat
+        self.zip_lon = zip_lon
+        self.dentists = dentists
+        self.cell_ids = cell_ids
+        self.cell_offsets = cell_offsets
+        self.cell_degrees = cell_degrees
+        self.grid_columns = int(math.ceil(360 / cell_degrees))
+    
+    @classmethod
+    def build(cls, zip_codes: np.ndarray, zip_lat: np.ndarray, zip_lon: np.ndarray,
+              dentists: Dict[str, np.ndarray], cell_degrees: float = DEFAULT_CELL_DEGREES) -> "DentistDirectory":
+        """
+        Build the index from unsorted arrays
+        
+        Args:
+            zip_codes, zip_lat, zip_lon: ZIP centroid table
+            dentists: Arrays for lat, lon, rating, emergency, zip, name and
+                practice, all the same length
+            cell_degrees: Grid cell size in degrees
+        """
+        zip_order = np.argsort(zip_codes, kind="stable")
+        
+        columns = {
+            "lat": np.asarray(dentists["lat"], dtype=np.float32),
+            "lon": np.asarray(dentists["lon"], dtype=np.float32),
+            "rating": np.asarray(dentists["rating"], dtype=np.float32),
+            "emergency": np.asarray(dentists["emergency"], dtype=bool),
+            "zip": np.asarray(dentists["zip"], dtype=np.int32),
+            "name": np.asarray(dentists["name"], dtype=NAME_DTYPE),
+            "practice": np.asarray(dentists["practice"], dtype=PRACTICE_DTYPE)
+        }
+        columns["x"], columns["y"], columns["z"] = unit_vectors(columns["lat"], columns["lon"])
+        
+        directory = cls(
+            zip_codes=np.asarray(zip_codes, dtype=np.int32)[zip_order],
+            zip_lat=np.asarray(zip_lat, dtype=np.float32)[zip_order],
+            zip_lon=np.asarray(zip_lon, dtype=np.float32)[zip_order],
+            dentists=columns,
+            cell_ids=np.empty(0, dtype=np.int64),
+            cell_offsets=np.zeros(1, dtype=np.int64),
+            cell_degrees=cell_degrees
+        )
+        
+        cells = directory._cell_of(columns["lat"], columns["lon"])
+        order = np.argsort(cells, kind="stable")
+        directory.dentists = {name: column[order] for name, column in columns.items()}
+        
+        sorted_cells = cells[order]
+        directory.cell_ids, starts = np.unique(sorted_cells, return_index=True)
+        directory.cell_offsets = np.append(starts, len(sorted_cells)).astype(np.int64)
+        return directory
+    
+    @classmethod
+    def from_csv(cls, zip_csv: str, dentist_csv: str, cell_degrees: float = DEFAULT_CELL_DEGREES) -> "DentistDirectory":
+        """
+        Build from CSV files
+        
+        zip_csv has columns zip, lat, lon. dentist_csv has name, practice,
+        lat, lon, rating, emergency (1/0 or true/false) and zip.
+        """
+        with open(zip_csv, newline="") as handle:
+            zip_rows = [row for row in csv.DictReader(handle) if parse_zip(row["zip"]) is not None]
+        with open(dentist_csv, newline="") as handle:
+            dentist_rows = list(csv.DictReader(handle))
+        
+        return cls.build(
+            zip_codes=np.array([parse_zip(row["zip"]) for row in zip_rows]),
+            zip_lat=np.array([float(row["lat"]) for row in zip_rows]),
+            zip_lon=np.array([float(row["lon"]) for row in zip_rows]),
+            dentists={
+                "lat": [float(row["lat"]) for row in dentist_rows],
+                "lon": [float(row["lon"]) for row in dentist_rows],
+                "rating": [float(row.get("rating") or 0) for row in dentist_rows],
+                "emergency": [row.get("emergency", "").lower() in ("1", "true", "yes") for row in dentist_rows],
+                "zip": [parse_zip(row.get("zip", "")) or 0 for row in dentist_rows],
+                "name": [row["name"].encode("utf-8")[:40] for row in dentist_rows],
+                "practice": [row.get("practice", "").encode("utf-8")[:48] for row in dentist_rows]
+            },
+            cell_degrees=cell_degrees
+        )
+    
+    def save(self, path: str):
+        """Write the directory as .npy files plus meta.json into `path`"""
+        os.makedirs(path, exist_ok=True)
+        arrays = {
+            "zip_codes": self.zip_codes,
+            "zip_lat": self.zip_lat,
+            "zip_lon": self.zip_lon,
+            "cell_ids": self.cell_ids,
+            "cell_offsets": self.cell_offsets
+        }
+        arrays.update({f"dentist_{name}": column for name, column in self.dentists.items()})
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(array))
+        
+        with open(os.path.join(path, "meta.json"), "w") as handle:
+            json.dump({"version": FORMAT_VERSION, "cell_degrees": self.cell_degrees,
+                       "dentists": len(self), "zip_codes": len(self.zip_codes)}, handle)
+    
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "DentistDirectory":
+        """
+        Open a directory written by save()
+        
+        Raises:
+            ValueError: The files were written by an incompatible version
+        """
+        with open(os.path.join(path, "meta.json")) as handle:
+            meta = json.load(handle)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported dentist directory version: {meta.get('version')}")
+        
+        mode = "r" if mmap else None
+        def read(name: str) -> np.ndarray:
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+        
+        return cls(
+            zip_codes=read("zip_codes"),
+            zip_lat=read("zip_lat"),
+            zip_lon=read("zip_lon"),
+            dentists={name: read(f"dentist_{name}") for name in cls.DENTIST_COLUMNS},
+            cell_ids=read("cell_ids"),
+            cell_offsets=read("cell_offsets"),
+            cell_degrees=meta["cell_degrees"]
+        )
+    
+    def _row_of(self, lat):
+        return np.floor((np.asarray(lat, dtype=np.float64) + 90) / self.cell_degrees).astype(np.int64)
+    
+    def _column_of(self, lon):
+        return np.floor((np.asarray(lon, dtype=np.float64) + 180) / self.cell_degrees).astype(np.int64)
+    
+    def _cell_of(self, lat, lon):
+        return self._row_of(lat) * self.grid_columns + self._column_of(lon)
+    
+    def centroid(self, zip_code: str) -> Optional[Tuple[float, float]]:
+        """Latitude and longitude of a ZIP code, or None if it is unknown"""
+        code = parse_zip(zip_code)
+        if code is None:
+            return None
+        index = int(np.searchsorted(self.zip_codes, code))
+        if index == len(self.zip_codes) or self.zip_codes[index] != code:
+            return None
+        return float(self.zip_lat[index]), float(self.zip_lon[index])
+    
+    def _candidates(self, lat: float, lon: float, radius_miles: float) -> np.ndarray:
+        """Roster indices in the grid cells overlapping the search's bounding box"""
+        dlat = radius_miles / MILES_PER_DEGREE_LAT
+        dlon = radius_miles / (MILES_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01))
+        
+        first_row, last_row = int(self._row_of(lat - dlat)), int(self._row_of(lat + dlat))
+        first_column, last_column = int(self._column_of(lon - dlon)), int(self._column_of(lon + dlon))
+        
+        rows = np.arange(first_row, last_row + 1, dtype=np.int64) * self.grid_columns
+        cell_starts = np.searchsorted(self.cell_ids, rows + first_column, side="left")
+        cell_ends = np.searchsorted(self.cell_ids, rows + last_column, side="right")
+        starts = self.cell_offsets[cell_starts]
+        ends = self.cell_offsets[cell_ends]
+        
+        return np.concatenate([np.arange(start, end) for start, end in zip(starts, ends) if end > start]
+                              or [np.empty(0, dtype=np.int64)])
+    
+    def search_near(self, lat: float, lon: float, radius_miles: float = 25, emergency_only: bool = False,
+                    limit: int = 10, order_by: str = "distance") -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find dentists within a radius of a point
+        
+        Args:
+            order_by: "distance" (nearest first) or "rating" (best first,
+                nearest first among equal ratings)
+        
+        Returns:
+            Roster indices and their distances in miles, best first
+        """
+        candidates = self._candidates(lat, lon, radius_miles)
+        if emergency_only and len(candidates):
+            candidates = candidates[self.dentists["emergency"][candidates]]
+        if not len(candidates):
+            return candidates, np.empty(0)
+        
+        qx, qy, qz = unit_vectors(lat, lon)
+        chord_squared = (
+            (self.dentists["x"][candidates] - qx) ** 2 +
+            (self.dentists["y"][candidates] - qy) ** 2 +
+            (self.dentists["z"][candidates] - qz) ** 2
+        )
+        max_chord = 2 * math.sin(min(radius_miles / (2 * EARTH_RADIUS_MILES), math.pi / 2))
+        within = chord_squared <= max_chord ** 2
+        candidates, chord_squared = candidates[within], chord_squared[within]
+        
+        if order_by == "rating":
+            order = np.lexsort((chord_squared, -self.dentists["rating"][candidates]))[:limit]
+        else:
+            if len(chord_squared) > limit:
+                nearest = np.argpartition(chord_squared, limit - 1)[:limit]
+            else:
+                nearest = np.arange(len(chord_squared))
+            order = nearest[np.argsort(chord_squared[nearest], kind="stable")]
+        return candidates[order], chord_to_miles(chord_squared[order])
+    
+    def search(self, zip_code: str, radius_miles: float = 25, emergency_only: bool = False,
+               limit: int = 10, order_by: str = "distance") -> Optional[List[Dict]]:
+        """
+        Find dentists near a ZIP code's centroid
+        
+        Returns:
+            Dentists in the same shape as the DentalChat search API, or None
+            if the ZIP code is not in the directory
+        """
+        point = self.centroid(zip_code)
+        if point is None:
+            return None
+        
+        indices, distances = self.search_near(point[0], point[1], radius_miles, emergency_only, limit, order_by)
+        return [
+            {
+                "name": self.dentists["name"][index].decode("utf-8", "ignore"),
+                "practice": self.dentists["practice"][index].decode("utf-8", "ignore"),
+                "distance": f"{distance:.1f} miles",
+                "rating": round(float(self.dentists["rating"][index]), 1),
+                "emergency_hours": bool(self.dentists["emergency"][index])
+            }
+            for index, distance in zip(indices.tolist(), distances.tolist())
+        ]
+    
+    def __len__(self) -> int:
+        return len(self.dentists["lat"])
+
+# Metro areas for synthetic data: ZIP prefix (first three digits) and center
+SYNTHETIC_METROS = [
+    (752, 32.78, -96.80), (770, 29.76, -95.37), (100, 40.71, -74.01), (900, 34.05, -118.24),
+    (606, 41.88, -87.63), (850, 33.45, -112.07), (191, 39.95, -75.17), (782, 29.42, -98.49),
+    (921, 32.72, -117.16), (981, 47.61, -122.33), (802, 39.74, -104.99), (303, 33.75, -84.39),
+    (331, 25.76, -80.19), (21, 42.36, -71.06), (554, 44.98, -93.27), (972, 45.52, -122.68)
+]
+SYNTHETIC_FIRST_NAMES = ["Sarah", "Michael", "Emily", "David", "Priya", "James", "Maria", "Wei", "Aisha", "Robert"]
+SYNTHETIC_LAST_NAMES = ["Johnson", "Chen", "Rodriguez", "Patel", "Kim", "Nguyen", "Okafor", "Smith", "Garcia", "Cohen"]
+SYNTHETIC_PRACTICE_SUFFIXES = ["Family Dental", "Dental Care", "Smiles", "Dentistry", "Dental Group"]
+
+def generate_synthetic_directory(dentist_count: int, zips_per_metro: int = 100, seed: int = 0,
+                                 cell_degrees: float = DEFAULT_CELL_DEGREES) -> DentistDirectory:
+    """
+    Build a plausible directory for demos and benchmarks
+    
+    ZIP codes are {prefix}00 to {prefix}{zips_per_metro - 1} around each
+    metro in SYNTHETIC_METROS (so 75201 is downtown Dallas); dentists are
+    placed around ZIP centroids.
+    """
+    rng = np.random.default_rng(seed)
+    
+    zip_codes, zip_lat, zip_lon = [], [], []
+    for prefix, lat, lon in SYNTHETIC_METROS:
+        offsets = rng.normal(0, 0.15, size=(zips_per_metro, 2))
+        offsets[1] = 0  # {prefix}01 is the metro center
+        zip_codes.extend(prefix * 100 + index for index in range(zips_per_metro))
+        zip_lat.extend(lat + offsets[:, 0])
+        zip_lon.extend(lon + offsets[:, 1])
+    zip_codes, zip_lat, zip_lon = np.array(zip_codes), np.array(zip_lat), np.array(zip_lon)
+    
+    home = rng.integers(0, len(zip_codes), size=dentist_count)
+    first = rng.integers(0, len(SYNTHETIC_FIRST_NAMES), size=dentist_count)
+    last = rng.integers(0, len(SYNTHETIC_LAST_NAMES), size=dentist_count)
+    suffix = rng.integers(0, len(SYNTHETIC_PRACTICE_SUFFIXES), size=dentist_count)
+    
+    return DentistDirectory.build(
+        zip_codes=zip_codes,
+        zip_lat=zip_lat,
+        zip_lon=zip_lon,
+        dentists={
+            "lat": zip_lat[home] + rng.normal(0, 0.02, size=dentist_count),
+            "lon": zip_lon[home] + rng.normal(0, 0.02, size=dentist_count),
+            "rating": np.clip(np.round(rng.normal(4.4, 0.4, size=dentist_count), 1), 1.0, 5.0),
+            "emergency": rng.random(dentist_count) < 0.3,
+            "zip": zip_codes[home],
+            "name": [f"Dr. {SYNTHETIC_FIRST_NAMES[f]} {SYNTHETIC_LAST_NAMES[l]}" for f, l in zip(first, last)],
+            "practice": [f"{SYNTHETIC_LAST_NAMES[l]} {SYNTHETIC_PRACTICE_SUFFIXES[s]}" for l, s in zip(last, suffix)]
+        },
+        cell_degrees=cell_degrees
+    )
+
+def load_configured_directory() -> Optional[DentistDirectory]:
+    """
+    Open the directory at Config.DENTIST_DIRECTORY_PATH, or None if unset or unreadable
+    """
+    path = Config.DENTIST_DIRECTORY_PATH
+    if not path:
+        return None
+    try:
+        directory = DentistDirectory.load(path)
+        logger.info(f"Loaded dentist directory from {path}: {len(directory)} dentists")
+        return directory
+    except Exception as e:
+        logger.error(f"Could not load dentist directory from {path}: {e}")
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a dentist directory for DENTIST_DIRECTORY_PATH")
+    parser.add_argument("out", help="directory to write the .npy files to")
+    parser.add_argument("--zips", help="CSV with zip, lat, lon")
+    parser.add_argument("--dentists", help="CSV with name, practice, lat, lon, rating, emergency, zip")
+    parser.add_argument("--synthetic", type=int, metavar="COUNT", help="generate COUNT synthetic dentists instead")
+    args = parser.parse_args()
+    
+    if args.synthetic:
+        directory = generate_synthetic_directory(args.synthetic)
+    elif args.zips and args.dentists:
+        directory = DentistDirectory.from_csv(args.zips, args.dentists)
+    else:
+        parser.error("pass --zips and --dentists, or --synthetic")
+    
+    directory.save(args.out)
+    print(f"Wrote {len(directory)} dentists and {len(directory.zip_codes)} ZIP codes to {args.out}")
+
+if __name__ == "__main__":
+    main()
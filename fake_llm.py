@@ -0,0 +1,273 @@
+"""
+Local stand-in for the chat model, for benchmarks and offline runs
+
+Besides the built-in keyword rules, a JSON script (FAKE_LLM_SCRIPT_PATH)
+can script intakes the rules don't cover:
+
+    {
+        "extractions": {"knocked out": {"problem_description": "Knocked-out tooth", "pain_level": 9}},
+        "replies": {"knocked out": "Keep the tooth moist. What is your ZIP code?"},
+        "default_reply": "Could you tell me more?"
+    }
+
+Phrases are matched case-insensitively against the patient message; the
+first matching reply wins. Replies without a question mark are followed by
+the built-in follow-up question, as the app asks one after such replies.
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import weakref
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from config import Config
+
+NAME_PATTERN = re.compile(r"(?i:my name is|i'm|i am|this is)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)")
+SCHEMA_KEY_PATTERN = re.compile(r'"(\w+)":')
+
+_UNSEEDED = random.Random()
+
+DEFAULT_REPLY = "I'm sorry you're dealing with that. Could you tell me a little more about when it started?"
+COMBINED_REPLY = "Thanks for letting me know. What's your ZIP code so I can find dentists near you?"
+
+def _canned_reply(message: str, replies: Optional[Dict[str, str]]) -> Optional[str]:
+    lowered = message.lower()
+    for phrase, reply in (replies or {}).items():
+        if phrase.lower() in lowered:
+            return reply
+    return None
+
+def _extract_fields(fields: List[str], message: str,
+                    canned: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Crude keyword extraction, good enough to move an intake along"""
+    result: Dict[str, Any] = {field: None for field in fields}
+    
+    if "problem_description" in result and len(message.split()) >= 4 and not NAME_PATTERN.search(message):
+        result["problem_description"] = message.strip()
+    if "patient_name" in result:
+        match = NAME_PATTERN.search(message)
+        if match:
+            result["patient_name"] = match.group(1)
+    
+    # Canned fields win, for messages the heuristics above get wrong
+    lowered = message.lower()
+    for phrase, fields_for_phrase in (canned or {}).items():
+        if phrase.lower() in lowered:
+            result.update({field: value for field, value in fields_for_phrase.items() if field in result})
+    return result
+
+def fake_response(messages: List[BaseMessage], canned: Optional[Dict[str, Dict[str, Any]]] = None,
+                  replies: Optional[Dict[str, str]] = None, default_reply: Optional[str] = None) -> str:
+    """
+    Answer the prompts this app sends with plausibly shaped output
+    
+    Recognizes batched and scoped extraction (JSON with the requested fields),
+    the combined JSON turn, whole-conversation extraction, and otherwise
+    writes a short reply with a question. The output depends only on the
+    messages, so runs are repeatable.
+    
+    Args:
+        canned: Extraction fields to return when the patient message
+            contains a phrase, as {phrase: {field: value}}
+        replies: Chat replies to use when the patient message contains a
+            phrase, as {phrase: reply}
+        default_reply: Chat reply when no phrase matches
+    """
+    system = "\n".join(str(m.content) for m in messages if m.type == "system")
+    human = str(messages[-1].content) if messages else ""
+    
+    if '"results"' in system:
+        items = json.loads(human)
+        return json.dumps({"results": [
+            {"id": item["id"], "fields": {
+                field: value
+                for field, value in _extract_fields(list(item["requested_fields"]), item["message"], canned).items()
+                if value is not None
+            }}
+            for item in items
+        ]})
+    
+    if "Requested fields:" in human:
+        schema, _, rest = human.partition("\n\n")
+        message = rest.rpartition("Patient message: ")[2]
+        return json.dumps(_extract_fields(SCHEMA_KEY_PATTERN.findall(schema), message, canned))
+    
+    if "extracted_fields" in system:
+        message = human.rpartition("Patient message: ")[2]
+        reply = _canned_reply(message, replies)
+        return json.dumps({
+            "extracted_fields": _extract_fields(["problem_description", "patient_name"], message, canned),
+            "reply": reply or default_reply or COMBINED_REPLY,
+            # A scripted reply may ask about anything
+            "next_missing_field": None if reply else "location"
+        })
+    
+    if "Extract information from this conversation" in human:
+        return json.dumps({"problem_description": None, "pain_level": None})
+    
+    # Only chat turns carry a system prompt. The follow-up question prompt embeds the
+    # transcript, which would match phrases from earlier turns, and must get a question
+    if system:
+        return _canned_reply(human, replies) or default_reply or DEFAULT_REPLY
+    return DEFAULT_REPLY
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model with provider-like latency and no network
+    
+    Each call waits base_latency (the time to first token) plus
+    per_token_latency for every output token, approximated as four
+    characters. latency_distribution shapes the noise around that:
+    "uniform" scales it by 1 +/- jitter, "lognormal" by a log-normal factor
+    with sigma jitter (occasional slow calls, like a real provider), and
+    "fixed" not at all. With a seed, the noise for a call depends only on
+    the seed and the prompt, so runs are repeatable whatever the interleaving.
+    max_concurrency limits in-flight calls per event loop, like a provider
+    rate limit; 0 means unlimited.
+    """
+    
+    base_latency: float = 0.3
+    per_token_latency: float = 0.01
+    jitter: float = 0.2
+    latency_distribution: str = "uniform"
+    seed: Optional[int] = None
+    canned_extractions: Dict[str, Dict[str, Any]] = {}
+    canned_replies: Dict[str, str] = {}
+    default_reply: Optional[str] = None
+    max_concurrency: int = 0
+    temperature: float = 0.0
+    model_name: str = "fake"
+    
+    _semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = PrivateAttr(
+        default_factory=weakref.WeakKeyDictionary
+    )
+    _thread_semaphore: Optional[threading.BoundedSemaphore] = PrivateAttr(default=None)
+    
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+    
+    def _rng(self, text: str) -> random.Random:
+        if self.seed is None:
+            return _UNSEEDED
+        return random.Random(f"{self.seed}:{text}")
+    
+    def _scaled(self, seconds: float, rng: random.Random) -> float:
+        if self.latency_distribution == "fixed":
+            return seconds
+        if self.latency_distribution == "lognormal":
+            return seconds * rng.lognormvariate(0.0, self.jitter)
+        return max(0.0, seconds * (1 + rng.uniform(-self.jitter, self.jitter)))
+    
+    def _latency(self, text: str) -> float:
+        return self._scaled(self.base_latency + self.per_token_latency * (len(text) / 4), self._rng(text))
+    
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        return fake_response(messages, self.canned_extractions, self.canned_replies, self.default_reply)
+    
+    def _usage(self, messages: List[BaseMessage], text: str) -> Dict[str, int]:
+        # Four characters per token, like the latency model
+        input_tokens = sum(len(str(m.content)) for m in messages) // 4
+        output_tokens = len(text) // 4
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+    
+    def _semaphore(self) -> Optional[asyncio.Semaphore]:
+        if not self.max_concurrency:
+            return None
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            # A semaphore that has had waiters holds its loop, so the weak key
+            # alone does not free it; drop the ones for closed loops here
+            for old_loop in [old_loop for old_loop in self._semaphores if old_loop.is_closed()]:
+                del self._semaphores[old_loop]
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+    
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        text = self._respond(messages)
+        if self.max_concurrency and self._thread_semaphore is None:
+            self._thread_semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        
+        if self._thread_semaphore is not None:
+            with self._thread_semaphore:
+                time.sleep(self._latency(text))
+        else:
+            time.sleep(self._latency(text))
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+    
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        text = self._respond(messages)
+        semaphore = self._semaphore()
+        
+        if semaphore is not None:
+            async with semaphore:
+                await asyncio.sleep(self._latency(text))
+        else:
+            await asyncio.sleep(self._latency(text))
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+    
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        text = self._respond(messages)
+        semaphore = self._semaphore()
+        
+        if semaphore is not None:
+            await semaphore.acquire()
+        try:
+            rng = self._rng(text)
+            await asyncio.sleep(self._scaled(self.base_latency, rng))
+            for word in re.findall(r"\S+\s*", text):
+                await asyncio.sleep(self._scaled(self.per_token_latency * max(1, len(word) / 4), rng))
+                yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, text)))
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+def load_script(path: str) -> Dict[str, Any]:
+    """
+    Read a fake-model script (see the module docstring)
+    
+    Raises:
+        ValueError: If the file is not a JSON object with the expected keys
+    """
+    with open(path) as handle:
+        script = json.load(handle)
+    if not isinstance(script, dict):
+        raise ValueError(f"{path}: expected a JSON object")
+    unknown = set(script) - {"extractions", "replies", "default_reply"}
+    if unknown:
+        raise ValueError(f"{path}: unknown keys {sorted(unknown)}")
+    return script
+
+def build_fake_chat_model(temperature: float) -> FakeChatModel:
+    """FakeChatModel configured from the FAKE_LLM_* settings"""
+    script = load_script(Config.FAKE_LLM_SCRIPT_PATH) if Config.FAKE_LLM_SCRIPT_PATH else {}
+    return FakeChatModel(
+        canned_extractions=script.get("extractions", {}),
+        canned_replies=script.get("replies", {}),
+        default_reply=script.get("default_reply"),
+        temperature=temperature,
+        base_latency=Config.FAKE_LLM_BASE_LATENCY,
+        per_token_latency=Config.FAKE_LLM_PER_TOKEN_LATENCY,
+        jitter=Config.FAKE_LLM_JITTER,
+        latency_distribution=Config.FAKE_LLM_LATENCY_DISTRIBUTION,
+        seed=Config.FAKE_LLM_SEED,
+        max_concurrency=Config.FAKE_LLM_MAX_CONCURRENCY
+    )
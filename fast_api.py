@@ -1 +1,250 @@
+"""
+FastAPI service for DentalChat AI Automation
+"""
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
 
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+
+from chat_agent import ConversationManager
+from llm_registry import llm_registry
+from models import APIResponse
+from utils import DataValidator, LoggingUtils, performance_monitor
+from profiling import turn_profiler
+from config import Config
+import logging
+
+LoggingUtils.setup_logging()
+logger = logging.getLogger(__name__)
+
+class MessageRequest(BaseModel):
+    """Incoming patient message"""
+    message: str = Field(min_length=1, max_length=1000)
+
+class SessionResponse(BaseModel):
+    """New conversation session"""
+    session_id: str
+    message: str
+
+class MessageResponse(BaseModel):
+    """Assistant reply to a patient message"""
+    session_id: str
+    response: str
+    is_complete: bool
+
+class SessionSummary(BaseModel):
+    """Conversation summary from ConversationManager.get_session_info"""
+    session_id: str
+    created_at: str
+    is_complete: bool
+    total_turns: int
+    patient_info: dict
+    missing_fields: List[str]
+    conversation_text: str
+
+def profile_requested(request: Request) -> bool:
+    """Whether the client asked for this turn to be profiled"""
+    return Config.PROFILE_API_ENABLED and request.headers.get("X-Profile-Turn", "").lower() in ("1", "true", "yes")
+
+def format_sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def create_app() -> FastAPI:
+    """
+    Build the ASGI application
+    
+    All state lives on app.state, so each uvicorn worker gets its own manager.
+    """
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        manager = app.state.conversation_manager = ConversationManager()
+        if Config.LLM_PREWARM:
+            await llm_registry.aprewarm()
+        
+        # Drain posts left in the outbox by a previous run right away
+        outbox_worker = manager.agent.outbox_worker
+        if outbox_worker is not None:
+            outbox_worker.start()
+        yield
+        if outbox_worker is not None:
+            await outbox_worker.stop()
+    
+    app = FastAPI(title="DentalChat AI Assistant", lifespan=lifespan)
+    
+    def get_manager(request: Request) -> ConversationManager:
+        return request.app.state.conversation_manager
+    
+    def check_session_id(session_id: str):
+        if not DataValidator.is_valid_session_id(session_id):
+            raise HTTPException(status_code=404, detail="Session not found")
+    
+    @app.get("/health")
+    async def health():
+        """Liveness check"""
+        return {"status": "ok"}
+    
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        """Counters, stage latency histograms and token usage for Prometheus"""
+        return PlainTextResponse(
+            performance_monitor.render_prometheus(),
+            media_type="text/plain; version=0.0.4"
+        )
+    
+    @app.get("/outbox/metrics")
+    async def outbox_metrics(request: Request):
+        """Post outbox depth, drain rate and age of the oldest undelivered post"""
+        metrics = await asyncio.to_thread(get_manager(request).get_outbox_metrics)
+        if metrics is None:
+            raise HTTPException(status_code=404, detail="Post outbox is disabled")
+        return metrics
+    
+    @app.post("/sessions", response_model=SessionResponse, status_code=201)
+    async def create_session(request: Request):
+        """Start a new conversation"""
+        session_id, welcome_msg = await asyncio.to_thread(get_manager(request).create_session)
+        return SessionResponse(session_id=session_id, message=welcome_msg)
+    
+    @app.get("/sessions/{session_id}", response_model=SessionSummary)
+    async def get_session(session_id: str, request: Request):
+        """Get the conversation summary and extracted patient information"""
+        check_session_id(session_id)
+        summary = await asyncio.to_thread(get_manager(request).get_session_info, session_id)
+        if summary is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return summary
+    
+    @app.post("/sessions/{session_id}/messages", response_model=MessageResponse)
+    async def send_message(session_id: str, body: MessageRequest, request: Request):
+        """Send a patient message and get the full reply"""
+        check_session_id(session_id)
+        response, is_complete = await get_manager(request).asend_message(
+            session_id, body.message, profile=profile_requested(request)
+        )
+        return MessageResponse(session_id=session_id, response=response, is_complete=is_complete)
+    
+    @app.post("/sessions/{session_id}/messages/stream")
+    async def stream_message(session_id: str, body: MessageRequest, request: Request):
+        """Send a message and stream the reply as Server-Sent Events"""
+        check_session_id(session_id)
+        manager = get_manager(request)
+        profile = profile_requested(request)
+        
+        async def event_stream() -> AsyncIterator[str]:
+            start_time = time.perf_counter()
+            time_to_first_token = None
+            
+            async for chunk in manager.astream_message(session_id, body.message, profile=profile):
+                if time_to_first_token is None:
+                    time_to_first_token = time.perf_counter() - start_time
+                yield format_sse("token", {"text": chunk})
+            
+            yield format_sse("done", {
+                "is_complete": await manager.ais_session_complete(session_id),
+                "time_to_first_token": time_to_first_token,
+                "total_time": time.perf_counter() - start_time
+            })
+        
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    @app.websocket("/sessions/{session_id}/ws")
+    async def session_websocket(websocket: WebSocket, session_id: str):
+        """
+        Chat over a WebSocket: send {"message": ...}, receive token frames
+        followed by a done frame for each turn. With PROFILE_API_ENABLED,
+        {"profile": true} profiles that turn. A message that fails the
+        MessageRequest checks, or is not JSON, gets an error frame instead.
+        """
+        if not DataValidator.is_valid_session_id(session_id):
+            await websocket.close(code=1008)
+            return
+        
+        manager: ConversationManager = websocket.app.state.conversation_manager
+        await websocket.accept()
+        
+        try:
+            while True:
+                text = await websocket.receive_text()
+                try:
+                    payload = json.loads(text)
+                    if not isinstance(payload, dict):
+                        raise TypeError("expected a JSON object")
+                    body = MessageRequest(**payload)
+                except json.JSONDecodeError:
+                    await websocket.send_json({"event": "error", "detail": "Invalid message: expected JSON"})
+                    continue
+                except (TypeError, ValidationError) as e:
+                    detail = e.errors()[0]["msg"] if isinstance(e, ValidationError) else str(e)
+                    await websocket.send_json({"event": "error", "detail": f"Invalid message: {detail}"})
+                    continue
+                
+                start_time = time.perf_counter()
+                time_to_first_token = None
+                
+                profile = Config.PROFILE_API_ENABLED and bool(payload.get("profile"))
+                async for chunk in manager.astream_message(session_id, body.message, profile=profile):
+                    if time_to_first_token is None:
+                        time_to_first_token = time.perf_counter() - start_time
+                    await websocket.send_json({"event": "token", "text": chunk})
+                
+                await websocket.send_json({
+                    "event": "done",
+                    "is_complete": await manager.ais_session_complete(session_id),
+                    "time_to_first_token": time_to_first_token,
+                    "total_time": time.perf_counter() - start_time
+                })
+        except WebSocketDisconnect:
+            logger.info(f"WebSocket closed for session {session_id[:8]}")
+    
+    @app.post("/sessions/{session_id}/profile")
+    async def profile_session(session_id: str, turns: int = 1):
+        """
+        Profile the session's next turns on this worker
+        
+        With several workers, prefer the X-Profile-Turn header: only the
+        worker that receives this call is armed.
+        """
+        if not Config.PROFILE_API_ENABLED:
+            raise HTTPException(status_code=404, detail="Profiling API is disabled")
+        check_session_id(session_id)
+        turn_profiler.request(session_id, max(1, min(turns, 100)))
+        return {"session_id": session_id, "turns": turns}
+    
+    @app.get("/profiles")
+    async def list_profiles(session_id: Optional[str] = None):
+        """Recently saved turn profiles on this worker, newest last"""
+        if not Config.PROFILE_API_ENABLED:
+            raise HTTPException(status_code=404, detail="Profiling API is disabled")
+        return {"profiles": turn_profiler.get_recent(session_id), "stats": turn_profiler.get_stats()}
+    
+    @app.get("/posts/{post_id}/status", response_model=APIResponse)
+    async def get_post_status(post_id: str, request: Request):
+        """Check the status of a DentalChat post"""
+        return await get_manager(request).agent.api_client.aget_post_status(post_id)
+    
+    return app
+
+if __name__ == "__main__":
+    if Config.API_WORKERS > 1 and Config.SESSION_STORE == "memory":
+        raise SystemExit(
+            "API_WORKERS > 1 needs a shared session store, since each worker would keep its own "
+            "in-memory sessions. Set SESSION_STORE=sqlite or API_WORKERS=1."
+        )
+    uvicorn.run(
+        "fast_api:create_app",
+        factory=True,
+        host=Config.API_HOST,
+        port=Config.API_PORT,
+        workers=Config.API_WORKERS
+    )
@@ -0,0 +1,144 @@
+"""
+Process-wide registry of LLM clients and LangChain runnables
+"""
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_openai import ChatOpenAI
+
+from fake_llm import build_fake_chat_model
+from config import Config
+from utils import async_runner
+import logging
+
+logger = logging.getLogger(__name__)
+
+class LLMRegistry:
+    """
+    Build each chat model and LCEL runnable once per process
+    
+    Every model shares the same pooled HTTP clients, so all call sites reuse
+    warm keep-alive connections to the provider instead of opening their own.
+    The async pool is bound to the event loop that first uses it; in this app
+    that is the AsyncRunner loop (Streamlit) or the ASGI server loop.
+    """
+    
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._models: Dict[Tuple, BaseChatModel] = {}
+        self._runnables: Dict[str, Any] = {}
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+    
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=Config.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=Config.LLM_MAX_KEEPALIVE_CONNECTIONS
+        )
+    
+    @property
+    def http_client(self) -> httpx.Client:
+        """Shared sync HTTP client for all models"""
+        with self._lock:
+            if self._http_client is None:
+                self._http_client = httpx.Client(limits=self._limits(), timeout=Config.LLM_TIMEOUT)
+            return self._http_client
+    
+    @property
+    def http_async_client(self) -> httpx.AsyncClient:
+        """Shared async HTTP client for all models"""
+        with self._lock:
+            if self._http_async_client is None:
+                self._http_async_client = httpx.AsyncClient(limits=self._limits(), timeout=Config.LLM_TIMEOUT)
+            return self._http_async_client
+    
+    def get_chat_model(self, temperature: float, model: Optional[str] = None) -> BaseChatModel:
+        """
+        Get the shared chat model for a model name and temperature
+        
+        Args:
+            temperature: Sampling temperature
+            model: Model name, defaults to Config.OPENAI_MODEL
+        
+        Returns:
+            ChatOpenAI instance shared by every caller with the same settings,
+            or a FakeChatModel when Config.LLM_PROVIDER is "fake"
+        """
+        model = model or Config.OPENAI_MODEL
+        key = (Config.LLM_PROVIDER, model, temperature)
+        
+        with self._lock:
+            if key not in self._models and Config.LLM_PROVIDER == "fake":
+                self._models[key] = build_fake_chat_model(temperature)
+                logger.info(f"Built fake chat model (temperature={temperature})")
+            elif key not in self._models:
+                self._models[key] = ChatOpenAI(
+                    api_key=Config.OPENAI_API_KEY,
+                    base_url=Config.OPENAI_BASE_URL,
+                    model=model,
+                    temperature=temperature,
+                    # Report token usage on streamed replies too
+                    stream_usage=True,
+                    http_client=self.http_client,
+                    http_async_client=self.http_async_client
+                )
+                logger.info(f"Built chat model {model} (temperature={temperature})")
+            return self._models[key]
+    
+    def get_runnable(self, name: str, builder: Callable[[], Any]) -> Any:
+        """
+        Get a named runnable, building it on first use
+        
+        Args:
+            name: Unique name for the runnable, e.g. "extraction"
+            builder: Zero-argument callable that builds the runnable
+        """
+        with self._lock:
+            if name not in self._runnables:
+                self._runnables[name] = builder()
+            return self._runnables[name]
+    
+    def prewarm(self) -> bool:
+        """
+        Open TLS connections to the provider ahead of the first real request
+        
+        Returns:
+            True if both the sync and async pools connected, False otherwise
+        """
+        if Config.LLM_PROVIDER == "fake":
+            return True
+        
+        url = f"{Config.OPENAI_BASE_URL.rstrip('/')}/models"
+        headers = {"Authorization": f"Bearer {Config.OPENAI_API_KEY}"}
+        
+        try:
+            self.http_client.get(url, headers=headers)
+            async_runner.run(self.http_async_client.get(url, headers=headers))
+            logger.info("Pre-warmed LLM provider connections")
+            return True
+        except Exception as e:
+            logger.warning(f"Could not pre-warm LLM provider connections: {e}")
+            return False
+    
+    async def aprewarm(self) -> bool:
+        """
+        Async version of prewarm for servers that own their event loop
+        """
+        if Config.LLM_PROVIDER == "fake":
+            return True
+        
+        url = f"{Config.OPENAI_BASE_URL.rstrip('/')}/models"
+        headers = {"Authorization": f"Bearer {Config.OPENAI_API_KEY}"}
+        
+        try:
+            await self.http_async_client.get(url, headers=headers)
+            logger.info("Pre-warmed LLM provider connections")
+            return True
+        except Exception as e:
+            logger.warning(f"Could not pre-warm LLM provider connections: {e}")
+            return False
+
+# Global instance
+llm_registry = LLMRegistry()
@@ -16,19 +16,26 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from chat_agent import ConversationManager
 from models import PatientInfo
 from utils import LoggingUtils, performance_monitor
+from profiling import turn_profiler
+from llm_registry import llm_registry
 from config import Config
 
 # Setup logging
-LoggingUtils.setup_logging(level="INFO")
+LoggingUtils.setup_logging()
+
+@st.cache_resource
+def get_conversation_manager() -> ConversationManager:
+    """Build one ConversationManager per process, shared by all browser sessions"""
+    if Config.LLM_PREWARM:
+        llm_registry.prewarm()
+    return ConversationManager()
 
 class DentalChatApp:
     """Simple DentalChat application"""
     
     def __init__(self):
-        # Use session state to persist conversation manager
-        if 'conversation_manager' not in st.session_state:
-            st.session_state.conversation_manager = ConversationManager()
-        self.conversation_manager = st.session_state.conversation_manager
+        # Conversations are keyed by session ID, so every browser session can share one manager
+        self.conversation_manager = get_conversation_manager()
         self.setup_page()
     
     def setup_page(self):
@@ -82,6 +89,57 @@ class DentalChatApp:
             st.write(f"Conversations: {metrics['conversations_started']}")
             st.write(f"Completed: {metrics['conversations_completed']}")
             
+            store_metrics = self.conversation_manager.sessions.get_metrics()
+            st.write(f"Active sessions: {store_metrics['size']} (expired: {store_metrics['expired']}, evicted: {store_metrics['evicted']})")
+            st.write(f"Extraction LLM calls skipped: {metrics['extraction_llm_skipped']}")
+            
+            cache_lookups = metrics['extraction_cache_hits'] + metrics['extraction_cache_misses']
+            if cache_lookups:
+                saved = performance_monitor.get_observations().get('extraction_cache_saved_seconds', {}).get('total', 0.0)
+                st.write(f"Extraction cache hit rate: {metrics['extraction_cache_hits'] / cache_lookups:.0%} ({saved:.1f}s saved)")
+            
+            mean_ttft = performance_monitor.get_mean('reply_time_to_first_token_seconds')
+            if mean_ttft:
+                st.write(f"Avg time to first token: {mean_ttft:.2f}s")
+            
+            mean_tokens = performance_monitor.get_mean('context_input_tokens')
+            mean_baseline = performance_monitor.get_mean('context_baseline_tokens')
+            if mean_tokens and mean_baseline:
+                st.write(f"Avg prompt tokens per turn: {mean_tokens:.0f} (was {mean_baseline:.0f})")
+            
+            latency = performance_monitor.get_latency_summary()
+            stage_p95 = [
+                f"{stage} {latency[stage]['p95']:.2f}s"
+                for stage in ("extraction", "reply", "question", "post")
+                if stage in latency
+            ]
+            if stage_p95:
+                st.write(f"p95 latency: {', '.join(stage_p95)}")
+            
+            token_counts = performance_monitor.get_token_counts()
+            if token_counts:
+                prompt_tokens = sum(counts['prompt_tokens'] for counts in token_counts.values())
+                completion_tokens = sum(counts['completion_tokens'] for counts in token_counts.values())
+                st.write(f"LLM tokens: {prompt_tokens} prompt / {completion_tokens} completion")
+            
+            # Estimate the time saved from the average cost of a real extraction call
+            mean_llm_latency = performance_monitor.get_mean('extraction_llm_seconds')
+            if mean_llm_latency and metrics['extraction_llm_skipped']:
+                saved = mean_llm_latency * metrics['extraction_llm_skipped']
+                st.write(f"Estimated latency saved: {saved:.1f}s")
+            
+            outbox_metrics = self.conversation_manager.get_outbox_metrics()
+            if outbox_metrics:
+                st.write(f"Post outbox: {outbox_metrics['depth']} queued "
+                         f"(oldest {outbox_metrics['oldest_age_seconds']:.0f}s, "
+                         f"dead-lettered: {outbox_metrics['dead_lettered']})")
+            
+            st.checkbox("Profile next turn", key="profile_next_turn")
+            session_id = st.session_state.get('session_id')
+            recent_profiles = turn_profiler.get_recent(session_id) if session_id else []
+            if recent_profiles:
+                st.caption(f"Last profile: {recent_profiles[-1]['path']}")
+            
             if st.button("Reset"):
                 st.session_state.clear()
                 st.rerun()
@@ -124,6 +182,42 @@ class DentalChatApp:
                 col1, col2 = st.columns([3, 1])
                 with col1:
                     st.success(f"**🦷 Dr. Assistant:** {message['content']}")
+        
+        # Stream the reply to the latest user message into its own bubble
+        if st.session_state.get('pending_message'):
+            self.stream_response(st.session_state.pending_message)
+    
+    def stream_response(self, user_input: str):
+        """Render the assistant reply token by token, then record it"""
+        st.session_state.pending_message = None
+        profile = st.session_state.pop('profile_next_turn', False)
+        
+        try:
+            st.write("")  # spacing
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                st.markdown("**🦷 Dr. Assistant:**")
+                response = st.write_stream(self.conversation_manager.stream_message(
+                    st.session_state.session_id,
+                    user_input,
+                    profile=profile
+                ))
+            
+            # Add assistant response
+            st.session_state.messages.append({"role": "assistant", "content": response})
+            
+            # Check if complete
+            if self.conversation_manager.is_session_complete(st.session_state.session_id):
+                st.session_state.conversation_complete = True
+                performance_monitor.increment_metric('conversations_completed')
+                performance_monitor.increment_metric('posts_created')
+            
+            performance_monitor.increment_metric('api_calls')
+            st.rerun()
+            
+        except Exception as e:
+            st.error(f"Error: {str(e)}")
+            performance_monitor.increment_metric('errors')
     
     def handle_input(self):
         """Handle user input"""
@@ -147,38 +241,16 @@ class DentalChatApp:
                 st.error("No active session. Please start a new conversation.")
                 return
             
-            # Add user message
+            # Add user message; the reply streams in show_conversation on the next run
             st.session_state.messages.append({"role": "user", "content": user_input})
-            
-            try:
-                # Get AI response
-                with st.spinner('Thinking...'):
-                    response, is_complete = self.conversation_manager.send_message(
-                        st.session_state.session_id, 
-                        user_input
-                    )
-                
-                # Add assistant response
-                st.session_state.messages.append({"role": "assistant", "content": response})
-                
-                # Check if complete
-                if is_complete:
-                    st.session_state.conversation_complete = True
-                    performance_monitor.increment_metric('conversations_completed')
-                    performance_monitor.increment_metric('posts_created')
-                
-                performance_monitor.increment_metric('api_calls')
-                st.rerun()
-                
-            except Exception as e:
-                st.error(f"Error: {str(e)}")
-                performance_monitor.increment_metric('errors')
+            st.session_state.pending_message = user_input
+            st.rerun()
 
 def main():
     """Main entry point"""
     try:
         # Check for API key
-        if not Config.OPENAI_API_KEY:
+        if not Config.OPENAI_API_KEY and Config.LLM_PROVIDER != "fake":
             st.error("❌ OpenAI API key not found. Please set OPENAI_API_KEY in your .env file.")
             st.stop()
         
@@ -0,0 +1,334 @@
+"""
+Low-contention metrics storage for DentalChat AI Automation
+
+Every thread writes to its own MetricShard, so recording a value takes no
+lock; reads merge the shards into a snapshot. With a shared directory, each
+worker process also publishes its snapshot there and reads add up the
+snapshots of every process.
+"""
+import atexit
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of durations in seconds"""
+    
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        # One count per bucket plus the overflow (+Inf) bucket; not cumulative
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+    
+    @classmethod
+    def from_snapshot(cls, buckets: Sequence[float], data: Dict[str, Any]) -> "LatencyHistogram":
+        histogram = cls(buckets)
+        histogram.counts = list(data['counts'])
+        histogram.count = sum(histogram.counts)
+        histogram.total = data['total']
+        histogram.max = data['max']
+        return histogram
+    
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+    
+    def percentile(self, pct: float) -> Optional[float]:
+        """
+        Estimate a percentile by interpolating inside its bucket
+        
+        Accurate to the bucket width; values past the last bucket are
+        reported as the largest value seen.
+        """
+        if not self.count:
+            return None
+        rank = pct / 100 * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                if index == len(self.buckets):
+                    return self.max
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = min(self.buckets[index], self.max)
+                return lower + (upper - lower) * max(0.0, rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.max
+    
+    def cumulative_counts(self) -> List[Tuple[float, int]]:
+        """(upper bound, observations <= bound) pairs, ending with +Inf"""
+        pairs = []
+        running = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), self.counts):
+            running += bucket_count
+            pairs.append((bound, running))
+        return pairs
+    
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'total': self.total,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99)
+        }
+
+def empty_snapshot() -> Dict[str, Dict]:
+    """
+    Snapshot layout shared by shards, processes and readers
+    
+    counters: name -> int
+    observations: name -> [count, total, max]
+    histograms: stage -> {"counts": [...], "total": float, "max": float}
+    tokens: call site -> [calls, prompt tokens, completion tokens]
+    """
+    return {'counters': {}, 'observations': {}, 'histograms': {}, 'tokens': {}}
+
+def merge_snapshot(into: Dict[str, Dict], other: Dict[str, Dict]):
+    """Add one snapshot into another in place"""
+    for name, value in other['counters'].items():
+        into['counters'][name] = into['counters'].get(name, 0) + value
+    
+    for name, (count, total, maximum) in other['observations'].items():
+        stats = into['observations'].setdefault(name, [0, 0.0, 0.0])
+        stats[0] += count
+        stats[1] += total
+        stats[2] = max(stats[2], maximum)
+    
+    for stage, data in other['histograms'].items():
+        merged = into['histograms'].get(stage)
+        if merged is None:
+            into['histograms'][stage] = {'counts': list(data['counts']), 'total': data['total'], 'max': data['max']}
+        elif len(merged['counts']) == len(data['counts']):
+            merged['counts'] = [a + b for a, b in zip(merged['counts'], data['counts'])]
+            merged['total'] += data['total']
+            merged['max'] = max(merged['max'], data['max'])
+    
+    for call_site, counts in other['tokens'].items():
+        merged = into['tokens'].setdefault(call_site, [0, 0, 0])
+        for index, value in enumerate(counts):
+            merged[index] += value
+
+class MetricShard:
+    """
+    Metrics written by a single thread
+    
+    Only the owning thread writes, so updates need no lock. Readers copy
+    each container in one call, which is atomic for dicts and lists; a
+    reader may see an entry mid-update, which is fine for monitoring.
+    """
+    
+    __slots__ = ('counters', 'observations', 'histograms', 'tokens', 'buckets', 'thread')
+    
+    def __init__(self, buckets: Sequence[float]):
+        self.counters: Dict[str, int] = {}
+        self.observations: Dict[str, List[float]] = {}
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.tokens: Dict[str, List[int]] = {}
+        self.buckets = tuple(buckets)
+        self.thread = weakref.ref(threading.current_thread())
+    
+    def is_orphaned(self) -> bool:
+        thread = self.thread()
+        return thread is None or not thread.is_alive()
+    
+    def snapshot(self) -> Dict[str, Dict]:
+        return {
+            'counters': self.counters.copy(),
+            'observations': {name: list(stats) for name, stats in self.observations.copy().items()},
+            'histograms': {
+                stage: {'counts': list(histogram.counts), 'total': histogram.total, 'max': histogram.max}
+                for stage, histogram in self.histograms.copy().items()
+            },
+            'tokens': {call_site: list(counts) for call_site, counts in self.tokens.copy().items()}
+        }
+
+class ShardedMetrics:
+    """
+    Per-thread metric shards merged on read
+    
+    The first write from a thread registers its shard under a lock; after
+    that writes only touch thread-local state. Shards of threads that have
+    exited are folded into one retired snapshot when a new shard registers
+    or metrics are read, so short-lived threads don't pile up.
+    
+    With shared_dir set, a background thread writes this process's
+    snapshot to <shared_dir>/<process id>.json every publish_interval
+    seconds (and at exit), and read_all() adds in the files of the other
+    processes. Point every worker at the same directory, ideally on tmpfs
+    such as /dev/shm, and empty it when the deployment starts. A worker's
+    file stays after it exits so its counts are not lost.
+    """
+    
+    def __init__(self, buckets: Sequence[float], shared_dir: Optional[str] = None,
+                 publish_interval: float = 1.0):
+        self.buckets = tuple(buckets)
+        self.shared_dir = shared_dir or None
+        self.publish_interval = publish_interval
+        
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards: List[MetricShard] = []
+        self._retired = empty_snapshot()
+        
+        self._process_id = self._new_process_id()
+        self._publisher: Optional[threading.Thread] = None
+        self._stop_publishing = threading.Event()
+        self._remote: Tuple[float, Dict[str, Dict]] = (0.0, empty_snapshot())
+        if self.shared_dir:
+            atexit.register(self.close)
+        
+        if hasattr(os, "register_at_fork"):
+            # A forked worker starts from zero; the parent keeps publishing its own counts
+            os.register_at_fork(after_in_child=self._after_fork)
+    
+    @staticmethod
+    def _new_process_id() -> str:
+        # The pid alone can be reused by a later worker
+        return f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    
+    def shard(self) -> MetricShard:
+        """This thread's shard; the hot path is one thread-local lookup"""
+        shard = getattr(self._local, "shard", None)
+        if shard is not None:
+            return shard
+        return self._register()
+    
+    def _register(self) -> MetricShard:
+        shard = MetricShard(self.buckets)
+        with self._lock:
+            self._retire_orphans()
+            self._shards.append(shard)
+            self._local.shard = shard
+        if self.shared_dir:
+            self._ensure_publisher()
+        return shard
+    
+    def _retire_orphans(self):
+        """Fold shards of exited threads into the retired snapshot; call with the lock held"""
+        alive = []
+        for shard in self._shards:
+            if shard.is_orphaned():
+                merge_snapshot(self._retired, shard.snapshot())
+            else:
+                alive.append(shard)
+        self._shards = alive
+    
+    def read_local(self) -> Dict[str, Dict]:
+        """Merged snapshot of this process"""
+        with self._lock:
+            self._retire_orphans()
+            shards = list(self._shards)
+            total = empty_snapshot()
+            merge_snapshot(total, self._retired)
+        for shard in shards:
+            merge_snapshot(total, shard.snapshot())
+        return total
+    
+    def read_all(self) -> Dict[str, Dict]:
+        """Merged snapshot of this process plus every process publishing to shared_dir"""
+        total = self.read_local()
+        if self.shared_dir:
+            merge_snapshot(total, self._read_remote())
+        return total
+    
+    def _read_remote(self) -> Dict[str, Dict]:
+        """Snapshots of the other processes, re-read at most once per publish interval"""
+        read_at, remote = self._remote
+        if time.monotonic() - read_at < self.publish_interval:
+            return remote
+        
+        remote = empty_snapshot()
+        own_file = f"{self._process_id}.json"
+        try:
+            names = os.listdir(self.shared_dir)
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            if not name.endswith(".json") or name == own_file:
+                continue
+            try:
+                with open(os.path.join(self.shared_dir, name)) as handle:
+                    snapshot = json.load(handle)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable metrics snapshot {name}: {e}")
+                continue
+            if tuple(snapshot.get('buckets', ())) == self.buckets:
+                merge_snapshot(remote, snapshot)
+        
+        self._remote = (time.monotonic(), remote)
+        return remote
+    
+    def publish(self):
+        """Write this process's snapshot to the shared directory"""
+        if not self.shared_dir:
+            return
+        snapshot = self.read_local()
+        snapshot['buckets'] = list(self.buckets)
+        snapshot['published_at'] = time.time()
+        
+        os.makedirs(self.shared_dir, exist_ok=True)
+        # Write then rename, so readers never see a partial file
+        fd, temp_path = tempfile.mkstemp(dir=self.shared_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as handle:
+                json.dump(snapshot, handle)
+            os.replace(temp_path, os.path.join(self.shared_dir, f"{self._process_id}.json"))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    
+    def _ensure_publisher(self):
+        with self._lock:
+            if self._publisher is not None and self._publisher.is_alive():
+                return
+            self._stop_publishing.clear()
+            self._publisher = threading.Thread(target=self._publish_loop, name="metrics-publisher", daemon=True)
+            self._publisher.start()
+    
+    def _publish_loop(self):
+        while True:
+            stopping = self._stop_publishing.wait(self.publish_interval)
+            try:
+                self.publish()
+            except OSError as e:
+                logger.warning(f"Could not publish metrics to {self.shared_dir}: {e}")
+            if stopping:
+                return
+    
+    def close(self):
+        """Stop the publisher after one last publish"""
+        publisher = self._publisher
+        if publisher is not None and publisher.is_alive():
+            self._stop_publishing.set()
+            publisher.join()
+    
+    def reset(self):
+        """Drop this process's metrics; every thread starts a new shard"""
+        with self._lock:
+            self._shards = []
+            self._retired = empty_snapshot()
+            self._local = threading.local()
+    
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []
+        self._retired = empty_snapshot()
+        self._process_id = self._new_process_id()
+        self._publisher = None
+        self._stop_publishing = threading.Event()
+        self._remote = (0.0, empty_snapshot())
@@ -1,9 +1,10 @@
 """
 Data models for DentalChat AI Automation
 """
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, PrivateAttr, validator
 from typing import Optional, List
 from datetime import datetime
+from bisect import bisect_right
 import re
 
 class PatientInfo(BaseModel):
@@ -85,13 +86,29 @@ class ConversationTurn(BaseModel):
     extracted_info: Optional[dict] = None
 
 class ConversationHistory(BaseModel):
-    """Complete conversation history"""
+    """
+    Complete conversation history
+    
+    The text transcript is rendered incrementally: each turn is formatted once,
+    and the end offset of every line is kept so a tail window by characters or
+    turns can be cut without re-joining the whole conversation. Turns appended
+    to `turns` directly (e.g. by a session store) are rendered on next access.
+    """
     session_id: str
     turns: List[ConversationTurn] = []
     patient_info: PatientInfo = Field(default_factory=PatientInfo)
     is_complete: bool = False
     created_at: datetime = Field(default_factory=datetime.now)
     
+    # Rendered "Role: message\n" line per turn and the transcript length after each
+    _lines: List[str] = PrivateAttr(default_factory=list)
+    _line_ends: List[int] = PrivateAttr(default_factory=list)
+    _rendered_turns: Optional[list] = PrivateAttr(default=None)
+    _text: Optional[str] = PrivateAttr(default=None)
+    
+    # Turns of this object already written by a persistent session store
+    _persisted_turns: int = PrivateAttr(default=0)
+    
     def add_turn(self, role: str, message: str, extracted_info: dict = None):
         """Add a conversation turn"""
         turn = ConversationTurn(
@@ -101,12 +118,65 @@ class ConversationHistory(BaseModel):
         )
         self.turns.append(turn)
     
+    def _sync_transcript(self):
+        """Render any turns added since the last access"""
+        if self._rendered_turns is not self.turns or len(self.turns) < len(self._lines):
+            # The turn list was replaced or truncated; start over
+            self._lines = []
+            self._line_ends = []
+            self._rendered_turns = self.turns
+            self._text = None
+        
+        if len(self._lines) == len(self.turns):
+            return
+        
+        total = self._line_ends[-1] if self._line_ends else 0
+        for turn in self.turns[len(self._lines):]:
+            line = f"{turn.role.title()}: {turn.message}\n"
+            total += len(line)
+            self._lines.append(line)
+            self._line_ends.append(total)
+        self._text = None
+    
     def get_conversation_text(self) -> str:
         """Get full conversation as text"""
-        text = ""
-        for turn in self.turns:
-            text += f"{turn.role.title()}: {turn.message}\n"
-        return text
+        self._sync_transcript()
+        if self._text is None:
+            self._text = "".join(self._lines)
+        return self._text
+    
+    def get_transcript_tail(self, max_chars: Optional[int] = None, max_turns: Optional[int] = None) -> str:
+        """
+        Get the end of the conversation text
+        
+        Args:
+            max_chars: Return at most this many trailing characters
+            max_turns: Return at most this many trailing turns
+        
+        Returns:
+            The same text as slicing get_conversation_text(), built only from
+            the turns that fall inside the window
+        """
+        self._sync_transcript()
+        start_turn = 0
+        if max_turns is not None:
+            start_turn = max(len(self._lines) - max_turns, 0)
+        
+        if max_chars is None:
+            return "".join(self._lines[start_turn:])
+        if max_chars <= 0 or not self._lines:
+            return ""
+        
+        # First line that ends after the window starts, cut to the window
+        total = self._line_ends[-1]
+        window_start = max(total - max_chars, 0)
+        first = max(bisect_right(self._line_ends, window_start), start_turn)
+        line_start = self._line_ends[first - 1] if first else 0
+        
+        tail = "".join(self._lines[first:])
+        if line_start < window_start:
+            tail = tail[window_start - line_start:]
+        return tail
 
 class DentalChatPost(BaseModel):
     """DentalChat post submission model"""
@@ -0,0 +1,449 @@
+"""
+Durable outbox for DentalChat post submission
+"""
+import asyncio
+import contextvars
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Tuple
+
+from models import APIResponse, PatientInfo
+from utils import performance_monitor
+from tracing import tracer
+from config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+IN_PROGRESS = "in_progress"
+DELIVERED = "delivered"
+DEAD = "dead"
+
+# Failures that will not go away by sending the same post again
+PERMANENT_ERRORS = {"INCOMPLETE_DATA"}
+
+@dataclass
+class OutboxEntry:
+    """One post waiting to be, or already, submitted"""
+    entry_id: int
+    session_id: str
+    idempotency_key: str
+    patient_info: PatientInfo
+    status: str
+    attempts: int
+    created_at: float
+    post_id: Optional[str] = None
+    result: Optional[dict] = None
+    last_error: Optional[str] = None
+    
+    @property
+    def reference(self) -> str:
+        """Short reference a patient can quote to support"""
+        return self.idempotency_key[:8].upper()
+
+class PostOutbox:
+    """
+    Post submissions persisted in SQLite before anything is sent
+    
+    An entry is claimed by a worker with a lease, so entries held by a worker
+    that died are picked up again once the lease runs out. Every attempt for
+    an entry sends the same idempotency key, so a retry after a lost response
+    cannot create a second post. Entries that fail max_attempts times, or
+    fail in a way a retry cannot fix, are dead-lettered and kept for support.
+    
+    Like SQLiteSessionStore, the database can be shared by several worker
+    processes.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS post_outbox (
+            entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            patient_info TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            next_attempt_at REAL NOT NULL,
+            lease_expires_at REAL,
+            post_id TEXT,
+            result TEXT,
+            last_error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_post_outbox_ready ON post_outbox (status, next_attempt_at);
+    """
+    
+    COLUMNS = (
+        "entry_id, session_id, idempotency_key, patient_info, status, attempts, "
+        "created_at, post_id, result, last_error"
+    )
+    
+    def __init__(self, db_path: str = None, max_attempts: int = None, lease_seconds: float = None,
+                 backoff_base: float = None, backoff_max: float = None):
+        self.db_path = db_path or Config.POST_OUTBOX_DB_PATH
+        self.max_attempts = max_attempts or Config.POST_OUTBOX_MAX_ATTEMPTS
+        self.lease_seconds = lease_seconds or Config.POST_OUTBOX_LEASE_SECONDS
+        self.backoff_base = backoff_base or Config.POST_OUTBOX_BACKOFF_BASE_SECONDS
+        self.backoff_max = backoff_max or Config.POST_OUTBOX_BACKOFF_MAX_SECONDS
+        
+        self._local = threading.local()
+        self._connection().executescript(self.SCHEMA)
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+    
+    @staticmethod
+    def _row_to_entry(row: tuple) -> OutboxEntry:
+        entry_id, session_id, key, patient_info, status, attempts, created_at, post_id, result, last_error = row
+        return OutboxEntry(
+            entry_id=entry_id,
+            session_id=session_id,
+            idempotency_key=key,
+            patient_info=PatientInfo(**json.loads(patient_info)),
+            status=status,
+            attempts=attempts,
+            created_at=created_at,
+            post_id=post_id,
+            result=json.loads(result) if result else None,
+            last_error=last_error
+        )
+    
+    def enqueue(self, session_id: str, patient_info: PatientInfo) -> OutboxEntry:
+        """
+        Persist a post for submission
+        
+        The idempotency key is derived from the session, so enqueueing the
+        same conversation twice returns the existing entry instead of
+        queueing a second post. A dead-lettered entry is queued again with
+        the new patient info and a fresh set of attempts.
+        """
+        key = str(uuid.uuid5(uuid.NAMESPACE_URL, f"dentalchat-post:{session_id}"))
+        now = time.time()
+        
+        conn = self._connection()
+        conn.execute(
+            "INSERT INTO post_outbox "
+            "(session_id, idempotency_key, patient_info, status, created_at, next_attempt_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (idempotency_key) DO UPDATE SET "
+            "patient_info = excluded.patient_info, status = excluded.status, attempts = 0, "
+            "next_attempt_at = excluded.next_attempt_at, last_error = NULL "
+            "WHERE status = ?",
+            (session_id, key, json.dumps(patient_info.dict()), PENDING, now, now, DEAD)
+        )
+        return self.get(key)
+    
+    def get(self, idempotency_key: str) -> Optional[OutboxEntry]:
+        row = self._connection().execute(
+            f"SELECT {self.COLUMNS} FROM post_outbox WHERE idempotency_key = ?",
+            (idempotency_key,)
+        ).fetchone()
+        return self._row_to_entry(row) if row else None
+    
+    def claim(self, limit: int = 1) -> List[OutboxEntry]:
+        """
+        Lease up to `limit` entries that are due, oldest first
+        
+        Entries in progress whose lease has run out count as due.
+        """
+        conn = self._connection()
+        now = time.time()
+        
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                f"SELECT {self.COLUMNS} FROM post_outbox "
+                "WHERE (status = ? AND next_attempt_at <= ?) OR (status = ? AND lease_expires_at <= ?) "
+                "ORDER BY entry_id LIMIT ?",
+                (PENDING, now, IN_PROGRESS, now, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE post_outbox SET status = ?, attempts = attempts + 1, lease_expires_at = ? "
+                "WHERE entry_id = ?",
+                [(IN_PROGRESS, now + self.lease_seconds, row[0]) for row in rows]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        
+        entries = [self._row_to_entry(row) for row in rows]
+        for entry in entries:
+            entry.status = IN_PROGRESS
+            entry.attempts += 1
+        return entries
+    
+    def mark_delivered(self, entry: OutboxEntry, response: APIResponse):
+        entry.status = DELIVERED
+        entry.post_id = (response.data or {}).get("post_id")
+        entry.result = response.data
+        self._connection().execute(
+            "UPDATE post_outbox SET status = ?, post_id = ?, result = ?, lease_expires_at = NULL "
+            "WHERE entry_id = ?",
+            (DELIVERED, entry.post_id, json.dumps(response.data), entry.entry_id)
+        )
+    
+    def mark_failed(self, entry: OutboxEntry, error: str, permanent: bool = False):
+        """Schedule a retry with jittered backoff, or dead-letter the entry"""
+        entry.last_error = error
+        if permanent or entry.attempts >= self.max_attempts:
+            entry.status = DEAD
+            next_attempt_at = time.time()
+            logger.error(f"Post outbox entry {entry.reference} dead-lettered after "
+                         f"{entry.attempts} attempts: {error}")
+        else:
+            entry.status = PENDING
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** (entry.attempts - 1))))
+            next_attempt_at = time.time() + delay
+        
+        self._connection().execute(
+            "UPDATE post_outbox SET status = ?, next_attempt_at = ?, last_error = ?, lease_expires_at = NULL "
+            "WHERE entry_id = ?",
+            (entry.status, next_attempt_at, error, entry.entry_id)
+        )
+    
+    def requeue_dead(self) -> int:
+        """Give dead-lettered entries a fresh set of attempts, e.g. after an outage"""
+        cursor = self._connection().execute(
+            "UPDATE post_outbox SET status = ?, attempts = 0, next_attempt_at = ? WHERE status = ?",
+            (PENDING, time.time(), DEAD)
+        )
+        return cursor.rowcount
+    
+    def next_due_in(self) -> Optional[float]:
+        """Seconds until the next pending entry is due, or None if nothing is waiting"""
+        row = self._connection().execute(
+            "SELECT MIN(CASE WHEN status = ? THEN next_attempt_at ELSE lease_expires_at END) "
+            "FROM post_outbox WHERE status IN (?, ?)",
+            (PENDING, PENDING, IN_PROGRESS)
+        ).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+    
+    def get_metrics(self) -> Dict[str, float]:
+        """Queue depth by status and age of the oldest undelivered entry"""
+        conn = self._connection()
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM post_outbox GROUP BY status").fetchall())
+        (oldest,) = conn.execute(
+            "SELECT MIN(created_at) FROM post_outbox WHERE status IN (?, ?)",
+            (PENDING, IN_PROGRESS)
+        ).fetchone()
+        
+        return {
+            'depth': counts.get(PENDING, 0) + counts.get(IN_PROGRESS, 0),
+            'in_progress': counts.get(IN_PROGRESS, 0),
+            'delivered': counts.get(DELIVERED, 0),
+            'dead_lettered': counts.get(DEAD, 0),
+            'oldest_age_seconds': time.time() - oldest if oldest is not None else 0.0
+        }
+
+class OutboxWorker:
+    """
+    Pool of async tasks draining a PostOutbox into DentalChat
+    
+    The pool runs on one event loop; wake() and wait_for() may be called
+    from any loop or thread. Waiters only hear about entries processed by
+    this process, so a reply can pick up the post ID when it is quick and
+    otherwise fall back to its reference.
+    """
+    
+    # Window for the drain rate
+    RATE_WINDOW_SECONDS = 60.0
+    
+    def __init__(self, outbox: PostOutbox, api_client, concurrency: int = None,
+                 poll_interval: float = None):
+        """
+        Args:
+            outbox: Queue to drain
+            api_client: DentalChatAPI (or mock) used to create the posts
+            concurrency: Number of entries submitted at once
+            poll_interval: Longest sleep between checks for due entries
+        """
+        self.outbox = outbox
+        self.api_client = api_client
+        self.concurrency = concurrency or Config.POST_OUTBOX_WORKERS
+        self.poll_interval = poll_interval or Config.POST_OUTBOX_POLL_SECONDS
+        
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._lock = threading.Lock()
+        
+        # idempotency key -> futures of callers waiting for the outcome, with their loops
+        self._waiters: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = {}
+        self._delivered_at: Deque[float] = deque()
+    
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+    
+    def start(self):
+        """Start the pool on the running event loop, unless it is already running"""
+        with self._lock:
+            if self.running and not self._loop.is_closed():
+                return
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            # Start from an empty context, so deliveries are not traced as part of
+            # whichever turn happened to start the pool
+            self._tasks = [
+                contextvars.Context().run(self._loop.create_task, self._work(index))
+                for index in range(self.concurrency)
+            ]
+        logger.info(f"Post outbox worker started with {self.concurrency} tasks")
+    
+    async def stop(self):
+        """Cancel the pool; leased entries are retried after their lease runs out"""
+        with self._lock:
+            tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def wake(self):
+        """Tell the pool new entries are due"""
+        loop, wakeup = self._loop, self._wakeup
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(wakeup.set)
+    
+    def watch(self, idempotency_key: str) -> asyncio.Future:
+        """
+        Future for the entry once this process delivers or dead-letters it
+        
+        Call before wake(), so the outcome cannot be missed. Entries sent by
+        another process never resolve the future; see wait_for.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            self._waiters.setdefault(idempotency_key, []).append((loop, future))
+        
+        def forget(_):
+            with self._lock:
+                waiters = self._waiters.get(idempotency_key, [])
+                if (loop, future) in waiters:
+                    waiters.remove((loop, future))
+                if not waiters:
+                    self._waiters.pop(idempotency_key, None)
+        
+        future.add_done_callback(forget)
+        return future
+    
+    async def wait_for(self, entry: OutboxEntry, outcome: Optional[asyncio.Future] = None) -> OutboxEntry:
+        """
+        Wait until an entry is delivered or dead-lettered, by any process
+        
+        Args:
+            entry: Entry returned by PostOutbox.enqueue
+            outcome: Future from watch(), registered before the pool was woken
+        """
+        if outcome is None:
+            outcome = self.watch(entry.idempotency_key)
+        try:
+            while entry.status not in (DELIVERED, DEAD):
+                try:
+                    # shield: a poll timeout must not cancel the watch
+                    return await asyncio.wait_for(asyncio.shield(outcome), self.poll_interval)
+                except asyncio.TimeoutError:
+                    entry = await asyncio.to_thread(self.outbox.get, entry.idempotency_key)
+            return entry
+        finally:
+            outcome.cancel()
+    
+    def _notify(self, entry: OutboxEntry):
+        with self._lock:
+            waiters = self._waiters.pop(entry.idempotency_key, [])
+        for loop, future in waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(entry))
+    
+    def drain_rate(self) -> float:
+        """Posts delivered per second over the last minute"""
+        cutoff = time.monotonic() - self.RATE_WINDOW_SECONDS
+        with self._lock:
+            while self._delivered_at and self._delivered_at[0] < cutoff:
+                self._delivered_at.popleft()
+            return len(self._delivered_at) / self.RATE_WINDOW_SECONDS
+    
+    def get_metrics(self) -> Dict[str, float]:
+        metrics = self.outbox.get_metrics()
+        metrics['drain_rate_per_second'] = self.drain_rate()
+        metrics['workers'] = len(self._tasks) if self.running else 0
+        return metrics
+    
+    async def _work(self, index: int):
+        while True:
+            # Cleared before looking, so a wake() during the claim is not lost
+            self._wakeup.clear()
+            try:
+                entries = await asyncio.to_thread(self.outbox.claim, 1)
+            except Exception as e:
+                logger.error(f"Post outbox worker {index} could not claim entries: {e}")
+                entries = []
+            
+            if not entries:
+                await self._sleep()
+                continue
+            
+            for entry in entries:
+                await self._deliver(entry)
+    
+    async def _sleep(self):
+        """Sleep until woken, the next entry is due, or poll_interval passes"""
+        try:
+            due_in = await asyncio.to_thread(self.outbox.next_due_in)
+        except Exception:
+            due_in = None
+        timeout = self.poll_interval if due_in is None else min(self.poll_interval, max(due_in, 0.01))
+        
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+    
+    async def _deliver(self, entry: OutboxEntry):
+        attributes = {"session.id": entry.session_id, "outbox.reference": entry.reference,
+                      "outbox.attempt": entry.attempts}
+        with tracer.span("outbox.deliver", attributes) as span:
+            start_time = time.perf_counter()
+            try:
+                response = await self.api_client.acreate_patient_post(
+                    entry.patient_info, idempotency_key=entry.idempotency_key
+                )
+            except Exception as e:
+                response = APIResponse(success=False, message="Unexpected error", error=str(e) or type(e).__name__)
+            performance_monitor.observe('outbox_attempt_seconds', time.perf_counter() - start_time)
+            
+            if response.success:
+                await asyncio.to_thread(self.outbox.mark_delivered, entry, response)
+                with self._lock:
+                    self._delivered_at.append(time.monotonic())
+                performance_monitor.observe('outbox_delivery_seconds', time.time() - entry.created_at)
+                logger.info(f"Post outbox entry {entry.reference} delivered as post {entry.post_id}")
+            else:
+                status_code = (response.data or {}).get("status_code")
+                permanent = response.error in PERMANENT_ERRORS or (
+                    status_code is not None and 400 <= status_code < 500 and status_code not in (408, 429)
+                )
+                await asyncio.to_thread(self.outbox.mark_failed, entry, response.error or response.message, permanent)
+                logger.warning(f"Post outbox entry {entry.reference} attempt {entry.attempts} failed: {response.error}")
+            span.set_attribute("outbox.status", entry.status)
+        
+        if entry.status in (DELIVERED, DEAD):
+            self._notify(entry)
@@ -0,0 +1,209 @@
+"""
+On-demand profiling of individual conversation turns
+
+A turn is profiled when the caller asks for it (profile=True, e.g. from the
+X-Profile-Turn header), when its session was armed with request() or is
+listed in PROFILE_SESSIONS, or when it is picked by PROFILE_SAMPLE_RATE. The
+sampled turns are only kept if they take longer than PROFILE_SLOW_TURN_MS,
+which catches sporadic spikes without saving every turn.
+
+Two modes:
+    sampling  A background thread records the stack of the thread running
+              the turn every PROFILE_INTERVAL_MS and writes collapsed
+              stacks (<name>.folded), the input format of flamegraph.pl,
+              speedscope and inferno.
+    cprofile  Deterministic cProfile; writes <name>.prof for pstats or
+              snakeviz and <name>.txt with the top functions.
+
+File names start with the session ID. Both modes see everything on the
+profiled thread while the turn runs, including other sessions' coroutines
+on the same event loop. Only one turn per process is profiled at a time.
+With profiling off, a turn pays for one dictionary lookup.
+"""
+import cProfile
+import io
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List, Optional
+
+from config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+class StackSampler:
+    """Periodically record one thread's call stack"""
+    
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+    
+    def start(self):
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[self._collapse(frame)] += 1
+    
+    @staticmethod
+    def _collapse(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+    
+    def write_collapsed(self, path: str):
+        with open(path, "w") as handle:
+            for stack, count in self.samples.most_common():
+                handle.write(f"{stack} {count}\n")
+
+class TurnProfiler:
+    """Decides which turns to profile and saves their profiles"""
+    
+    MODES = ("sampling", "cprofile")
+    
+    def __init__(self, output_dir: str, mode: str = "sampling", sessions: str = "",
+                 sample_rate: float = 0.0, slow_turn_ms: float = 1000.0, interval_ms: float = 5.0,
+                 history: int = 20):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown profiling mode {mode!r}, expected one of {self.MODES}")
+        self.output_dir = output_dir
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.slow_turn_ms = slow_turn_ms
+        self.interval = interval_ms / 1000
+        
+        configured = {session.strip() for session in sessions.split(",") if session.strip()}
+        self.profile_all = "*" in configured
+        # session ID -> turns left to profile
+        self._armed: Dict[str, int] = {session: sys.maxsize for session in configured - {"*"}}
+        
+        self._busy = threading.Lock()
+        self._recent: Deque[Dict] = deque(maxlen=history)
+        self._stats = {'profiled': 0, 'saved': 0, 'discarded_fast': 0, 'skipped_busy': 0}
+    
+    def request(self, session_id: str, turns: int = 1):
+        """Profile the next turns of a session"""
+        self._armed[session_id] = self._armed.get(session_id, 0) + turns
+    
+    def _reason(self, session_id: str, force: bool) -> Optional[str]:
+        if force:
+            return "requested"
+        if self._armed:
+            remaining = self._armed.get(session_id)
+            if remaining:
+                if remaining == 1:
+                    del self._armed[session_id]
+                else:
+                    self._armed[session_id] = remaining - 1
+                return "session"
+        if self.profile_all:
+            return "session"
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+    
+    @contextmanager
+    def profile_turn(self, session_id: str, force: bool = False) -> Iterator[Optional[Dict]]:
+        """
+        Profile the enclosed turn if it qualifies
+        
+        Yields None when the turn is not profiled, otherwise a dict that gets
+        "path" once the profile is saved (it stays None for sampled turns
+        that were fast enough to discard).
+        """
+        reason = self._reason(session_id, force)
+        if reason is None:
+            yield None
+            return
+        if not self._busy.acquire(blocking=False):
+            self._stats['skipped_busy'] += 1
+            logger.info(f"Not profiling turn of session {session_id[:8]}: another turn is being profiled")
+            yield None
+            return
+        
+        result = {"session_id": session_id, "mode": self.mode, "reason": reason, "path": None}
+        profile = None
+        sampler = None
+        start_time = time.perf_counter()
+        try:
+            if self.mode == "cprofile":
+                profile = cProfile.Profile()
+                profile.enable()
+            else:
+                sampler = StackSampler(threading.get_ident(), self.interval)
+                sampler.start()
+            yield result
+        finally:
+            if profile is not None:
+                profile.disable()
+            if sampler is not None:
+                sampler.stop()
+            self._busy.release()
+            
+            result["duration_ms"] = round((time.perf_counter() - start_time) * 1000, 1)
+            self._stats['profiled'] += 1
+            if reason == "sampled" and result["duration_ms"] < self.slow_turn_ms:
+                self._stats['discarded_fast'] += 1
+            else:
+                self._save(result, profile, sampler)
+    
+    def _save(self, result: Dict, profile: Optional[cProfile.Profile], sampler: Optional[StackSampler]):
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(
+            self.output_dir,
+            f"{result['session_id']}-{time.strftime('%Y%m%dT%H%M%S')}-{int(result['duration_ms'])}ms"
+        )
+        try:
+            if profile is not None:
+                result["path"] = f"{base}.prof"
+                profile.dump_stats(result["path"])
+                summary = io.StringIO()
+                pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(40)
+                with open(f"{base}.txt", "w") as handle:
+                    handle.write(summary.getvalue())
+            else:
+                result["path"] = f"{base}.folded"
+                sampler.write_collapsed(result["path"])
+        except OSError as e:
+            logger.warning(f"Could not save profile for session {result['session_id'][:8]}: {e}")
+            return
+        
+        self._stats['saved'] += 1
+        self._recent.append(dict(result))
+        logger.info(f"Profiled turn of session {result['session_id'][:8]} ({result['reason']}, "
+                    f"{result['duration_ms']} ms): {result['path']}")
+    
+    def get_recent(self, session_id: Optional[str] = None) -> List[Dict]:
+        """Most recently saved profiles, newest last, optionally for one session"""
+        return [entry for entry in self._recent if session_id is None or entry["session_id"] == session_id]
+    
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self._stats)
+
+# Global instance
+turn_profiler = TurnProfiler(
+    output_dir=Config.PROFILE_DIR,
+    mode=Config.PROFILE_MODE,
+    sessions=Config.PROFILE_SESSIONS,
+    sample_rate=Config.PROFILE_SAMPLE_RATE,
+    slow_turn_ms=Config.PROFILE_SLOW_TURN_MS,
+    interval_ms=Config.PROFILE_INTERVAL_MS
+)
@@ -0,0 +1,484 @@
+"""
+Conversation session storage for DentalChat AI Automation
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from models import ConversationHistory, ConversationTurn, PatientInfo
+from config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SessionStore(ABC):
+    """
+    Interface for conversation storage
+    
+    get() returns the live ConversationHistory for a session; callers mutate it
+    and then call save() so backends that persist state can write the changes.
+    """
+    
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[ConversationHistory]:
+        """Get a conversation, or None if it is unknown or expired"""
+    
+    @abstractmethod
+    def save(self, conversation: ConversationHistory):
+        """Store a new conversation or persist changes to an existing one"""
+    
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        """Remove a conversation, returning True if it existed"""
+    
+    @abstractmethod
+    def cleanup_expired(self) -> int:
+        """Remove idle conversations past their TTL, returning how many were removed"""
+    
+    @abstractmethod
+    def keys(self) -> List[str]:
+        """Get the IDs of all stored conversations"""
+    
+    @abstractmethod
+    def get_metrics(self) -> Dict[str, int]:
+        """Get size, hit and eviction counters"""
+    
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+    
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+    
+    async def aget(self, session_id: str) -> Optional[ConversationHistory]:
+        """get() for async callers; runs in a worker thread by default"""
+        return await asyncio.to_thread(self.get, session_id)
+    
+    async def asave(self, conversation: ConversationHistory):
+        """save() for async callers; runs in a worker thread by default"""
+        await asyncio.to_thread(self.save, conversation)
+
+class InMemorySessionStore(SessionStore):
+    """
+    Bounded in-process store with idle TTL and LRU eviction
+    
+    Sessions are kept in least-recently-used order, so both the LRU victim and
+    any expired sessions are always at the front of the dict.
+    """
+    
+    def __init__(self, max_sessions: int = None, ttl_seconds: float = None):
+        self.max_sessions = max_sessions or Config.SESSION_MAX_ACTIVE
+        self.ttl_seconds = ttl_seconds or Config.SESSION_TTL_SECONDS
+        
+        self._sessions: "OrderedDict[str, ConversationHistory]" = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        
+        self._metrics = {
+            'hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'evicted': 0
+        }
+    
+    def _is_expired(self, session_id: str, now: float) -> bool:
+        return now - self._last_access[session_id] > self.ttl_seconds
+    
+    def _remove(self, session_id: str):
+        del self._sessions[session_id]
+        del self._last_access[session_id]
+    
+    def _evict_expired(self, now: float) -> int:
+        """Drop expired sessions from the front of the LRU order"""
+        removed = 0
+        while self._sessions:
+            oldest_id = next(iter(self._sessions))
+            if not self._is_expired(oldest_id, now):
+                break
+            self._remove(oldest_id)
+            removed += 1
+        
+        self._metrics['expired'] += removed
+        return removed
+    
+    def get(self, session_id: str) -> Optional[ConversationHistory]:
+        now = time.monotonic()
+        
+        with self._lock:
+            if session_id not in self._sessions:
+                self._metrics['misses'] += 1
+                return None
+            
+            if self._is_expired(session_id, now):
+                self._remove(session_id)
+                self._metrics['expired'] += 1
+                self._metrics['misses'] += 1
+                logger.info(f"Session {session_id[:8]} expired")
+                return None
+            
+            self._sessions.move_to_end(session_id)
+            self._last_access[session_id] = now
+            self._metrics['hits'] += 1
+            return self._sessions[session_id]
+    
+    def save(self, conversation: ConversationHistory):
+        now = time.monotonic()
+        session_id = conversation.session_id
+        
+        with self._lock:
+            self._sessions[session_id] = conversation
+            self._sessions.move_to_end(session_id)
+            self._last_access[session_id] = now
+            
+            self._evict_expired(now)
+            while len(self._sessions) > self.max_sessions:
+                evicted_id, _ = self._sessions.popitem(last=False)
+                del self._last_access[evicted_id]
+                self._metrics['evicted'] += 1
+                logger.info(f"Evicted least recently used session {evicted_id[:8]}")
+    
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            if session_id not in self._sessions:
+                return False
+            self._remove(session_id)
+            return True
+    
+    def cleanup_expired(self) -> int:
+        with self._lock:
+            removed = self._evict_expired(time.monotonic())
+        
+        logger.info(f"Cleaned up {removed} expired sessions")
+        return removed
+    
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._sessions.keys())
+    
+    def get_metrics(self) -> Dict[str, int]:
+        with self._lock:
+            metrics = self._metrics.copy()
+            metrics['size'] = len(self._sessions)
+            metrics['max_sessions'] = self.max_sessions
+            return metrics
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
+    
+    # Only a short in-process lock is taken, so these run on the event loop
+    async def aget(self, session_id: str) -> Optional[ConversationHistory]:
+        return self.get(session_id)
+    
+    async def asave(self, conversation: ConversationHistory):
+        self.save(conversation)
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Durable store on SQLite in WAL mode, shareable by several worker processes
+    
+    Turns are written to an append-only table. Each process keeps the
+    conversations it has seen in memory together with the number of turns and
+    the version it last saw, so a request only reads the session row plus any
+    turns other workers appended since then.
+    
+    Each ConversationHistory also remembers how many of its own turns have
+    been written, so saving an object that has dropped out of the cache
+    (after eviction or interleaved writes) only appends its new turns.
+    Saves within a process are serialized, so two saves of one object can't
+    both write the same turns.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            patient_info TEXT NOT NULL,
+            is_complete INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            last_access REAL NOT NULL,
+            turn_count INTEGER NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions (last_access);
+        CREATE TABLE IF NOT EXISTS turns (
+            session_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            timestamp TEXT NOT NULL,
+            role TEXT NOT NULL,
+            message TEXT NOT NULL,
+            extracted_info TEXT,
+            PRIMARY KEY (session_id, seq)
+        );
+    """
+    
+    def __init__(self, db_path: str = None, max_sessions: int = None, ttl_seconds: float = None):
+        self.db_path = db_path or Config.SESSION_DB_PATH
+        self.max_sessions = max_sessions or Config.SESSION_MAX_ACTIVE
+        self.ttl_seconds = ttl_seconds or Config.SESSION_TTL_SECONDS
+        
+        # session_id -> (conversation, persisted turn count, version), in LRU order
+        self._cache: "OrderedDict[str, Tuple[ConversationHistory, int, int]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._local = threading.local()
+        
+        self._metrics = {
+            'hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'evicted': 0,
+            'full_loads': 0,
+            'tail_loads': 0
+        }
+        
+        self._connection().executescript(self.SCHEMA)
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+    
+    def _count(self, metric_name: str, amount: int = 1):
+        with self._cache_lock:
+            self._metrics[metric_name] += amount
+    
+    def _cache_put(self, session_id: str, entry: Tuple[ConversationHistory, int, int]):
+        with self._cache_lock:
+            self._cache[session_id] = entry
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.max_sessions:
+                self._cache.popitem(last=False)
+    
+    def _drop_cached(self, session_id: str):
+        with self._cache_lock:
+            self._cache.pop(session_id, None)
+    
+    @staticmethod
+    def _row_to_turn(row: tuple) -> ConversationTurn:
+        timestamp, role, message, extracted_info = row
+        return ConversationTurn(
+            timestamp=datetime.fromisoformat(timestamp),
+            role=role,
+            message=message,
+            extracted_info=json.loads(extracted_info) if extracted_info else None
+        )
+    
+    def _load_turns(self, conn: sqlite3.Connection, session_id: str, from_seq: int) -> List[ConversationTurn]:
+        rows = conn.execute(
+            "SELECT timestamp, role, message, extracted_info FROM turns "
+            "WHERE session_id = ? AND seq >= ? ORDER BY seq",
+            (session_id, from_seq)
+        ).fetchall()
+        return [self._row_to_turn(row) for row in rows]
+    
+    def _delete_rows(self, conn: sqlite3.Connection, session_ids: List[str]):
+        for session_id in session_ids:
+            conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._drop_cached(session_id)
+    
+    def get(self, session_id: str) -> Optional[ConversationHistory]:
+        conn = self._connection()
+        now = time.time()
+        
+        row = conn.execute(
+            "SELECT patient_info, is_complete, created_at, last_access, turn_count, version "
+            "FROM sessions WHERE session_id = ?",
+            (session_id,)
+        ).fetchone()
+        
+        if row is None:
+            self._drop_cached(session_id)
+            self._count('misses')
+            return None
+        
+        patient_info, is_complete, created_at, last_access, turn_count, version = row
+        
+        if now - last_access > self.ttl_seconds:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._delete_rows(conn, [session_id])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self._count('expired')
+            self._count('misses')
+            logger.info(f"Session {session_id[:8]} expired")
+            return None
+        
+        conn.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (now, session_id))
+        
+        with self._cache_lock:
+            cached = self._cache.get(session_id)
+        
+        if cached is not None and cached[2] == version:
+            with self._cache_lock:
+                if session_id in self._cache:
+                    self._cache.move_to_end(session_id)
+            self._count('hits')
+            return cached[0]
+        
+        if cached is not None:
+            # Another worker changed the session: apply its changes and new turns only
+            conversation, cached_count, _ = cached
+            conversation.turns.extend(self._load_turns(conn, session_id, cached_count))
+            self._count('tail_loads')
+        else:
+            conversation = ConversationHistory(
+                session_id=session_id,
+                turns=self._load_turns(conn, session_id, 0),
+                created_at=datetime.fromisoformat(created_at)
+            )
+            self._count('full_loads')
+        
+        conversation.patient_info = PatientInfo(**json.loads(patient_info))
+        conversation.is_complete = bool(is_complete)
+        conversation._persisted_turns = len(conversation.turns)
+        
+        self._cache_put(session_id, (conversation, turn_count, version))
+        self._count('misses')
+        return conversation
+    
+    def save(self, conversation: ConversationHistory):
+        with self._save_lock:
+            self._save(conversation)
+    
+    def _save(self, conversation: ConversationHistory):
+        conn = self._connection()
+        session_id = conversation.session_id
+        now = time.time()
+        
+        turns = list(conversation.turns)
+        persisted_count = conversation._persisted_turns
+        new_turns = turns[persisted_count:]
+        
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT turn_count, version FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            
+            if row is None:
+                db_count, db_version = 0, 0
+                conn.execute(
+                    "INSERT INTO sessions (session_id, patient_info, is_complete, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (session_id, "{}", 0, conversation.created_at.isoformat(), now)
+                )
+            else:
+                db_count, db_version = row
+            
+            conn.executemany(
+                "INSERT INTO turns (session_id, seq, timestamp, role, message, extracted_info) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (session_id, db_count + offset, turn.timestamp.isoformat(), turn.role, turn.message,
+                     json.dumps(turn.extracted_info) if turn.extracted_info is not None else None)
+                    for offset, turn in enumerate(new_turns)
+                ]
+            )
+            
+            new_count, new_version = db_count + len(new_turns), db_version + 1
+            conn.execute(
+                "UPDATE sessions SET patient_info = ?, is_complete = ?, last_access = ?, "
+                "turn_count = ?, version = ? WHERE session_id = ?",
+                (json.dumps(conversation.patient_info.dict()), int(conversation.is_complete), now,
+                 new_count, new_version, session_id)
+            )
+            
+            if row is None:
+                self._evict_over_capacity(conn)
+            
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        
+        conversation._persisted_turns = len(turns)
+        if db_count == persisted_count:
+            self._cache_put(session_id, (conversation, new_count, new_version))
+        else:
+            # Another worker wrote turns this object hasn't seen; reload in full next time
+            self._drop_cached(session_id)
+    
+    def _evict_over_capacity(self, conn: sqlite3.Connection):
+        """Drop the least recently used sessions beyond max_sessions"""
+        (size,) = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()
+        if size <= self.max_sessions:
+            return
+        
+        victims = [row[0] for row in conn.execute(
+            "SELECT session_id FROM sessions ORDER BY last_access LIMIT ?",
+            (size - self.max_sessions,)
+        )]
+        self._delete_rows(conn, victims)
+        self._count('evicted', len(victims))
+        logger.info(f"Evicted {len(victims)} least recently used sessions")
+    
+    def delete(self, session_id: str) -> bool:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            exists = conn.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone() is not None
+            self._delete_rows(conn, [session_id])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return exists
+    
+    def cleanup_expired(self) -> int:
+        conn = self._connection()
+        cutoff = time.time() - self.ttl_seconds
+        
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            expired = [row[0] for row in conn.execute(
+                "SELECT session_id FROM sessions WHERE last_access < ?", (cutoff,)
+            )]
+            self._delete_rows(conn, expired)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        
+        self._count('expired', len(expired))
+        logger.info(f"Cleaned up {len(expired)} expired sessions")
+        return len(expired)
+    
+    def keys(self) -> List[str]:
+        return [row[0] for row in self._connection().execute("SELECT session_id FROM sessions")]
+    
+    def get_metrics(self) -> Dict[str, int]:
+        with self._cache_lock:
+            metrics = self._metrics.copy()
+            metrics['cached'] = len(self._cache)
+        metrics['size'] = len(self)
+        metrics['max_sessions'] = self.max_sessions
+        return metrics
+    
+    def __len__(self) -> int:
+        (size,) = self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()
+        return size
+
+def create_session_store() -> SessionStore:
+    """
+    Factory function to get the configured session store
+    
+    Returns:
+        SQLiteSessionStore if Config.SESSION_STORE is "sqlite", else InMemorySessionStore
+    """
+    if Config.SESSION_STORE == "sqlite":
+        return SQLiteSessionStore()
+    return InMemorySessionStore()
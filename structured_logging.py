@@ -0,0 +1,220 @@
+"""
+Non-blocking, sampled and redacted logging for DentalChat AI Automation
+
+LogPipeline.setup() sends every record through a bounded queue to a
+listener thread, which formats and writes it, so request threads and the
+event loop never wait on a terminal or a log file. When the queue is full
+new records are dropped and counted instead of blocking.
+
+Code on the per-turn path logs named events with log_pipeline.event().
+Each event type has a sample rate (LOG_SAMPLE_RATES); a skipped event
+costs a level check, a dict lookup and a random() call, and nothing is
+formatted. Warnings and errors are never sampled.
+
+Before a record is written, fields that hold patient details (name,
+contact details, location, message text) are masked and email addresses,
+phone numbers and ZIP codes in the message text are replaced.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import time
+from typing import Any, Callable, Dict, Optional
+
+from config import Config
+
+class PHIRedactor:
+    """Mask patient details in log messages and fields"""
+    
+    MASK = "[REDACTED]"
+    PHI_KEYS = frozenset({
+        'patient_name', 'name', 'phone', 'email', 'location', 'zip_code',
+        'problem_description', 'message', 'user_message', 'content'
+    })
+    PATTERNS = (
+        re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+'),
+        re.compile(r'(?:\+?1[\s\-.]?)?\(?\b\d{3}\)?[\s\-.]?\d{3}[\s\-.]?\d{4}\b'),
+        re.compile(r'(?<![\w.])\d{5}(?:-\d{4})?(?!\w)')
+    )
+    
+    def redact_text(self, text: str) -> str:
+        for pattern in self.PATTERNS:
+            text = pattern.sub(self.MASK, text)
+        return text
+    
+    def redact_value(self, key: str, value: Any) -> Any:
+        if key in self.PHI_KEYS and value not in (None, ""):
+            return self.MASK
+        if isinstance(value, dict):
+            return {k: self.redact_value(k, v) for k, v in value.items()}
+        if isinstance(value, str):
+            return self.redact_text(value)
+        return value
+
+class EventSampler:
+    """Per-event-type sample rates, parsed from "event=rate,event=rate" """
+    
+    def __init__(self, rates: str = "", default_rate: float = 1.0):
+        self.default_rate = default_rate
+        self.rates: Dict[str, float] = {}
+        for item in rates.split(","):
+            if "=" in item:
+                event, rate = item.split("=", 1)
+                self.rates[event.strip()] = float(rate)
+    
+    def should_log(self, event: str) -> bool:
+        rate = self.rates.get(event, self.default_rate)
+        return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Format records as text lines or as one JSON object per line
+    
+    Event fields (from log_pipeline.event) follow the message as key=value
+    pairs in text mode and become top-level keys in JSON mode.
+    """
+    
+    TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    
+    def __init__(self, fmt: str = "text", redactor: Optional[PHIRedactor] = None):
+        super().__init__(self.TEXT_FORMAT)
+        self.json = fmt == "json"
+        self.redactor = redactor
+    
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text and record.exc_text not in message:
+            message = f"{message}\n{record.exc_text}"
+        fields = dict(getattr(record, "fields", None) or {})
+        
+        if self.redactor is not None:
+            message = self.redactor.redact_text(message)
+            fields = {key: self.redactor.redact_value(key, value) for key, value in fields.items()}
+        
+        if self.json:
+            entry = {
+                "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+                "level": record.levelname,
+                "logger": record.name,
+                "event": getattr(record, "event", None),
+                "message": message
+            }
+            entry.update(fields)
+            return json.dumps(entry, default=str)
+        
+        line = f"{self.formatTime(record)} - {record.name} - {record.levelname} - {message}"
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of raising"""
+    
+    def __init__(self, log_queue: queue.Queue, on_drop: Optional[Callable[[], None]] = None):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.on_drop = on_drop
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            if self.on_drop is not None:
+                self.on_drop()
+
+class LogPipeline:
+    """Queue-backed root logging with event sampling and PHI redaction"""
+    
+    def __init__(self, fmt: str = "text", queue_size: int = 10000, sample_rates: str = "",
+                 default_sample_rate: float = 1.0, redact_phi: bool = True):
+        self.fmt = fmt
+        self.queue_size = queue_size
+        self.sampler = EventSampler(sample_rates, default_sample_rate)
+        self.redactor = PHIRedactor() if redact_phi else None
+        self._handler: Optional[DroppingQueueHandler] = None
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self._stats = {'sampled_out': 0}
+    
+    def setup(self, level: str = "INFO", log_file: Optional[str] = None,
+              on_drop: Optional[Callable[[], None]] = None):
+        """
+        Replace the root logger's handlers with the queue
+        
+        Safe to call again; the previous listener is stopped first.
+        """
+        self.stop()
+        formatter = StructuredFormatter(self.fmt, self.redactor)
+        handlers = [logging.StreamHandler()]
+        if log_file:
+            handlers.append(logging.FileHandler(log_file))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        
+        self._handler = DroppingQueueHandler(queue.Queue(self.queue_size), on_drop)
+        self._listener = logging.handlers.QueueListener(self._handler.queue, *handlers, respect_handler_level=True)
+        
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+            handler.close()
+        root.addHandler(self._handler)
+        root.setLevel(getattr(logging, level.upper(), logging.INFO))
+        
+        self._listener.start()
+        atexit.unregister(self.stop)
+        atexit.register(self.stop)
+    
+    def stop(self):
+        """Write out queued records and stop the listener thread"""
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.stop()
+    
+    def should_log(self, logger: logging.Logger, event: str, level: int = logging.INFO) -> bool:
+        """
+        Whether an event would be logged
+        
+        Check this first when the event's fields are expensive to compute.
+        Each call draws a new sample.
+        """
+        if not logger.isEnabledFor(level):
+            return False
+        if level >= logging.WARNING or self.sampler.should_log(event):
+            return True
+        self._stats['sampled_out'] += 1
+        return False
+    
+    def event(self, logger: logging.Logger, event: str, message: str = "",
+              level: int = logging.INFO, **fields):
+        """Log a named event with structured fields, subject to its sample rate"""
+        if self.should_log(logger, event, level):
+            self.log_sampled(logger, event, message, level, **fields)
+    
+    @staticmethod
+    def log_sampled(logger: logging.Logger, event: str, message: str = "",
+                    level: int = logging.INFO, **fields):
+        """Log an event that already passed should_log()"""
+        logger.log(level, message or event, extra={"event": event, "fields": fields})
+    
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            'queued': self._handler.queue.qsize() if self._handler is not None else 0,
+            'dropped': self._handler.dropped if self._handler is not None else 0,
+            'sampled_out': self._stats['sampled_out']
+        }
+
+# Global instance
+log_pipeline = LogPipeline(
+    fmt=Config.LOG_FORMAT,
+    queue_size=Config.LOG_QUEUE_SIZE,
+    sample_rates=Config.LOG_SAMPLE_RATES,
+    default_sample_rate=Config.LOG_SAMPLE_DEFAULT,
+    redact_phi=Config.LOG_REDACT_PHI
+)
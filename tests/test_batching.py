@@ -0,0 +1,140 @@
+"""
+MicroBatcher flushing, error propagation and per-loop state
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from batching import MicroBatcher
+
+class RecordingBackend:
+    """Batch function that doubles each item and records the batches it saw"""
+    
+    def __init__(self, delay: float = 0.0, error: Exception = None):
+        self.delay = delay
+        self.error = error
+        self.batches = []
+    
+    async def __call__(self, items):
+        self.batches.append(list(items))
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return [item * 2 for item in items]
+
+async def submit_all(batcher: MicroBatcher, items):
+    return await asyncio.gather(*(batcher.submit(item) for item in items))
+
+def test_full_batch_is_dispatched_without_waiting():
+    backend = RecordingBackend()
+    batcher = MicroBatcher(backend, max_batch_size=3, max_wait_seconds=10)
+    
+    start = time.monotonic()
+    results = asyncio.run(submit_all(batcher, [1, 2, 3]))
+    
+    assert results == [2, 4, 6]
+    assert backend.batches == [[1, 2, 3]]
+    assert time.monotonic() - start < 1
+
+def test_partial_batch_is_flushed_after_the_wait():
+    backend = RecordingBackend()
+    batcher = MicroBatcher(backend, max_batch_size=10, max_wait_seconds=0.05)
+    
+    start = time.monotonic()
+    results = asyncio.run(submit_all(batcher, [1, 2]))
+    
+    assert results == [2, 4]
+    assert backend.batches == [[1, 2]]
+    assert time.monotonic() - start >= 0.04
+
+def test_items_beyond_the_batch_size_wait_for_the_timer():
+    backend = RecordingBackend()
+    batcher = MicroBatcher(backend, max_batch_size=2, max_wait_seconds=0.05)
+    
+    async def scenario():
+        tasks = [asyncio.create_task(batcher.submit(item)) for item in range(5)]
+        await asyncio.sleep(0.01)
+        dispatched_early = [list(batch) for batch in backend.batches]
+        return dispatched_early, await asyncio.gather(*tasks)
+    
+    dispatched_early, results = asyncio.run(scenario())
+    
+    assert dispatched_early == [[0, 1], [2, 3]]
+    assert backend.batches == [[0, 1], [2, 3], [4]]
+    assert results == [0, 2, 4, 6, 8]
+
+def test_adaptive_batching_queues_only_while_saturated():
+    backend = RecordingBackend(delay=0.05)
+    batcher = MicroBatcher(backend, max_batch_size=10, max_wait_seconds=10, max_in_flight=1)
+    
+    async def scenario():
+        first = asyncio.create_task(batcher.submit(1))
+        await asyncio.sleep(0.01)
+        # The only slot is busy, so these queue up and go out together
+        rest = [asyncio.create_task(batcher.submit(item)) for item in (2, 3, 4)]
+        return await asyncio.gather(first, *rest)
+    
+    start = time.monotonic()
+    results = asyncio.run(scenario())
+    
+    assert results == [2, 4, 6, 8]
+    assert backend.batches == [[1], [2, 3, 4]]
+    # No max_wait_seconds timer was involved
+    assert time.monotonic() - start < 1
+
+def test_batch_error_reaches_every_caller_in_the_batch():
+    backend = RecordingBackend(error=RuntimeError("backend down"))
+    batcher = MicroBatcher(backend, max_batch_size=2, max_wait_seconds=10)
+    
+    async def scenario():
+        return await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+    
+    results = asyncio.run(scenario())
+    
+    assert [str(result) for result in results] == ["backend down", "backend down"]
+
+def test_wrong_number_of_results_is_an_error():
+    async def short_batch(items):
+        return items[:-1]
+    batcher = MicroBatcher(short_batch, max_batch_size=2, max_wait_seconds=10)
+    
+    with pytest.raises(ValueError):
+        asyncio.run(submit_all(batcher, [1, 2]))
+
+def test_loop_state_is_dropped_once_idle():
+    backend = RecordingBackend()
+    batcher = MicroBatcher(backend, max_batch_size=2, max_wait_seconds=0.01)
+    
+    async def scenario():
+        results = await submit_all(batcher, [1, 2, 3])
+        # The loop is still running but has nothing waiting or in flight
+        await asyncio.sleep(0)
+        return results, len(batcher._states)
+    
+    for _ in range(3):
+        results, states_while_running = asyncio.run(scenario())
+        assert results == [2, 4, 6]
+        assert states_while_running == 0
+        assert batcher._states == {}
+
+def test_each_loop_gets_its_own_batches():
+    backend = RecordingBackend(delay=0.05)
+    batcher = MicroBatcher(backend, max_batch_size=10, max_wait_seconds=0.02)
+    results = {}
+    
+    def run_in_thread(name, items):
+        results[name] = asyncio.run(submit_all(batcher, items))
+    
+    threads = [threading.Thread(target=run_in_thread, args=(name, items))
+               for name, items in (("a", [1, 2]), ("b", [10, 20]))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    
+    assert results == {"a": [2, 4], "b": [20, 40]}
+    assert sorted(map(sorted, backend.batches)) == [[1, 2], [10, 20]]
+    assert batcher._states == {}
+    assert batcher.pending_count() == 0
@@ -0,0 +1,134 @@
+"""
+SingleFlightCache coalescing, stale-while-revalidate and cancellation
+"""
+import asyncio
+import time
+
+import pytest
+
+from cache import SingleFlightCache
+
+class CountingLoader:
+    """Loader returning "value-N" for its N-th call after an optional delay"""
+    
+    def __init__(self, delay: float = 0.0, error: Exception = None):
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+    
+    async def __call__(self):
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return f"value-{call}"
+
+def test_concurrent_misses_share_one_load():
+    cache = SingleFlightCache(max_size=10, ttl_seconds=60)
+    loader = CountingLoader(delay=0.02)
+    
+    async def scenario():
+        results = await asyncio.gather(*(cache.get_or_load("key", loader) for _ in range(5)))
+        return results, await cache.get_or_load("key", loader)
+    
+    results, cached = asyncio.run(scenario())
+    
+    assert results == ["value-1"] * 5
+    assert cached == "value-1"
+    assert loader.calls == 1
+    stats = cache.get_stats()
+    assert (stats['misses'], stats['coalesced'], stats['hits']) == (1, 4, 1)
+    assert stats['in_flight'] == 0
+
+def test_stale_value_is_served_while_one_refresh_runs():
+    cache = SingleFlightCache(max_size=10, ttl_seconds=0.2, stale_seconds=5)
+    loader = CountingLoader(delay=0.05)
+    
+    async def scenario():
+        await cache.get_or_load("key", loader)
+        await asyncio.sleep(0.25)
+        
+        start = time.monotonic()
+        stale = await asyncio.gather(*(cache.get_or_load("key", loader) for _ in range(3)))
+        stale_elapsed = time.monotonic() - start
+        
+        await asyncio.sleep(0.1)
+        return stale, stale_elapsed, await cache.get_or_load("key", loader)
+    
+    stale, stale_elapsed, refreshed = asyncio.run(scenario())
+    
+    assert stale == ["value-1"] * 3
+    assert stale_elapsed < 0.03
+    assert refreshed == "value-2"
+    assert loader.calls == 2
+    stats = cache.get_stats()
+    assert (stats['stale_hits'], stats['refreshes']) == (3, 1)
+
+def test_value_past_the_stale_window_is_loaded_again():
+    cache = SingleFlightCache(max_size=10, ttl_seconds=0.02, stale_seconds=0.02)
+    loader = CountingLoader()
+    
+    async def scenario():
+        await cache.get_or_load("key", loader)
+        await asyncio.sleep(0.06)
+        return await cache.get_or_load("key", loader)
+    
+    assert asyncio.run(scenario()) == "value-2"
+    assert cache.get_stats()['misses'] == 2
+
+def test_cancelled_caller_does_not_cancel_the_shared_load():
+    cache = SingleFlightCache(max_size=10, ttl_seconds=60)
+    loader = CountingLoader(delay=0.1)
+    
+    async def scenario():
+        impatient = asyncio.create_task(asyncio.wait_for(cache.get_or_load("key", loader), 0.02))
+        await asyncio.sleep(0)
+        patient = asyncio.create_task(cache.get_or_load("key", loader))
+        
+        with pytest.raises(asyncio.TimeoutError):
+            await impatient
+        return await patient
+    
+    assert asyncio.run(scenario()) == "value-1"
+    assert loader.calls == 1
+    assert len(cache) == 1
+
+def test_failed_load_is_raised_to_every_caller_and_not_cached():
+    cache = SingleFlightCache(max_size=10, ttl_seconds=60)
+    failing = CountingLoader(delay=0.02, error=RuntimeError("backend down"))
+    
+    async def scenario():
+        results = await asyncio.gather(*(cache.get_or_load("key", failing) for _ in range(3)),
+                                       return_exceptions=True)
+        return results, await cache.get_or_load("key", CountingLoader())
+    
+    results, recovered = asyncio.run(scenario())
+    
+    assert [str(result) for result in results] == ["backend down"] * 3
+    assert failing.calls == 1
+    assert recovered == "value-1"
+    assert cache.get_stats()['load_errors'] == 1
+
+def test_failed_refresh_keeps_the_stale_value():
+    cache = SingleFlightCache(max_size=10, ttl_seconds=0.02, stale_seconds=5)
+    
+    async def scenario():
+        await cache.get_or_load("key", CountingLoader())
+        await asyncio.sleep(0.04)
+        stale = await cache.get_or_load("key", CountingLoader(error=RuntimeError("backend down")))
+        await asyncio.sleep(0.01)
+        return stale, await cache.get_or_load("key", CountingLoader(delay=5))
+    
+    assert asyncio.run(scenario()) == ("value-1", "value-1")
+
+def test_rejected_values_are_not_stored():
+    cache = SingleFlightCache(max_size=10, ttl_seconds=60)
+    loader = CountingLoader()
+    
+    async def scenario():
+        first = await cache.get_or_load("key", loader, cacheable=lambda value: False)
+        return first, await cache.get_or_load("key", loader, cacheable=lambda value: False)
+    
+    assert asyncio.run(scenario()) == ("value-1", "value-2")
+    assert len(cache) == 0
@@ -0,0 +1,114 @@
+"""
+ContextBuilder token budget and the token-count fallback
+"""
+import pytest
+
+pytest.importorskip("langchain.schema")
+
+import context_builder
+from context_builder import MESSAGE_OVERHEAD_TOKENS, ContextBuilder, build_token_counter
+from models import ConversationHistory
+
+PATIENT_CONTEXT = "Problem: Cracked molar\nPain Level: 7/10\nLocation: 75201"
+
+def estimate(text: str) -> int:
+    return (len(text) + 3) // 4
+
+@pytest.fixture
+def no_tiktoken(monkeypatch):
+    monkeypatch.setattr(context_builder, "tiktoken", None)
+
+def prompt_tokens(builder: ContextBuilder, built, user_message: str) -> int:
+    """Tokens of everything sent for the turn, counted from the built messages"""
+    return (
+        builder.system_prompt_tokens
+        + builder.count_tokens(built.system_context) + MESSAGE_OVERHEAD_TOKENS
+        + sum(builder.count_tokens(message.content) + MESSAGE_OVERHEAD_TOKENS for message in built.messages)
+        + builder.count_tokens(user_message) + MESSAGE_OVERHEAD_TOKENS
+    )
+
+def patient_message(index: int) -> str:
+    # Lengths vary so turns fold at different points
+    return f"Turn {index}: the tooth still hurts when I chew. " + "It throbs at night. " * (index % 5)
+
+@pytest.mark.parametrize("budget_margin", [150, 300, 600])
+def test_prompt_stays_within_the_token_budget(no_tiktoken, budget_margin):
+    probe = ContextBuilder()
+    builder = ContextBuilder(max_tokens=probe.system_prompt_tokens + budget_margin,
+                             summary_max_tokens=40, max_recent_turns=10)
+    conversation = ConversationHistory(session_id="s1")
+    
+    for index in range(40):
+        message = patient_message(index)
+        conversation.add_turn("user", message)
+        built = builder.build(conversation, message, PATIENT_CONTEXT)
+        
+        assert prompt_tokens(builder, built, message) <= builder.max_tokens
+        assert built.input_tokens == prompt_tokens(builder, built, message)
+        assert built.recent_turns <= builder.max_recent_turns
+        assert built.summarized_turns + built.recent_turns == len(conversation.turns) - 1
+        
+        conversation.add_turn("assistant", f"Thanks. Question {index}: how long has it hurt?")
+    
+    # Old turns were folded into the summary, newest details kept
+    assert built.summarized_turns > 0
+    assert "Earlier in this conversation the patient said:" in built.system_context
+    assert "Turn 0:" not in built.system_context
+
+def test_recent_turns_are_the_newest_in_order(no_tiktoken):
+    builder = ContextBuilder(max_tokens=5000, max_recent_turns=4)
+    conversation = ConversationHistory(session_id="s1")
+    for index in range(10):
+        conversation.add_turn("user" if index % 2 == 0 else "assistant", f"message {index}")
+    conversation.add_turn("user", "latest")
+    
+    built = builder.build(conversation, "latest", PATIENT_CONTEXT)
+    
+    assert [message.content for message in built.messages] == [f"message {index}" for index in range(6, 10)]
+    assert [message.type for message in built.messages] == ["human", "ai", "human", "ai"]
+
+def test_state_is_rebuilt_when_the_history_is_shorter(no_tiktoken):
+    builder = ContextBuilder(max_tokens=5000, max_recent_turns=4)
+    long_conversation = ConversationHistory(session_id="s1")
+    for index in range(10):
+        long_conversation.add_turn("user", f"message {index}")
+    builder.build(long_conversation, "next", PATIENT_CONTEXT)
+    
+    # Same session ID, fewer turns (e.g. restarted elsewhere)
+    short_conversation = ConversationHistory(session_id="s1")
+    short_conversation.add_turn("user", "only one")
+    built = builder.build(short_conversation, "next", PATIENT_CONTEXT)
+    
+    assert [message.content for message in built.messages] == ["only one"]
+    assert built.summarized_turns == 0
+
+def test_counter_estimates_without_tiktoken(no_tiktoken):
+    count_tokens = build_token_counter("gpt-4")
+    
+    assert count_tokens("") == 0
+    assert count_tokens("abcd") == 1
+    assert count_tokens("abcde") == 2
+    assert count_tokens("x" * 400) == 100
+
+def test_counter_estimates_when_the_encoding_cannot_be_loaded(monkeypatch):
+    class OfflineTiktoken:
+        @staticmethod
+        def encoding_for_model(model):
+            raise OSError("encoding files unavailable")
+    
+    monkeypatch.setattr(context_builder, "tiktoken", OfflineTiktoken)
+    
+    count_tokens = build_token_counter("gpt-4")
+    
+    assert count_tokens("x" * 10) == estimate("x" * 10)
+
+def test_builder_works_without_tiktoken(no_tiktoken):
+    builder = ContextBuilder(max_tokens=2000)
+    conversation = ConversationHistory(session_id="s1")
+    conversation.add_turn("user", "My tooth hurts")
+    
+    built = builder.build(conversation, "My tooth hurts", PATIENT_CONTEXT)
+    
+    assert builder.count_tokens("x" * 40) == 10
+    assert built.messages == []
+    assert built.input_tokens == prompt_tokens(builder, built, "My tooth hurts")
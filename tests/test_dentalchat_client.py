@@ -0,0 +1,164 @@
+"""
+DentalChatAPI retries, circuit breaker and connection pool against the local stub server
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+import uvicorn
+
+from benchmarks.stub_dentalchat import StubSettings, create_stub_app
+from dentalchat_api import CircuitBreaker, DentalChatAPI
+
+@pytest.fixture(scope="module")
+def stub():
+    """Stub DentalChat server on a free port, running in a background thread"""
+    app = create_stub_app(StubSettings())
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            pytest.fail("stub server did not start")
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    app.state.base_url = f"http://127.0.0.1:{port}"
+    
+    yield app
+    
+    server.should_exit = True
+    thread.join(timeout=10)
+
+@pytest.fixture
+def api(stub):
+    """Client pointed at the stub with fast retries and a small breaker"""
+    stub.state.settings = StubSettings()
+    stub.state.request_count = 0
+    
+    client = DentalChatAPI()
+    client.base_url = stub.state.base_url
+    client.max_retries = 2
+    client.backoff_base = 0.001
+    client.backoff_max = 0.005
+    client.circuit_breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.2)
+    return client
+
+def run(api: DentalChatAPI, coro):
+    """Run one call on a fresh loop and close that loop's connection pool"""
+    async def call():
+        try:
+            return await coro
+        finally:
+            await api.aclose()
+    return asyncio.run(call())
+
+def test_5xx_is_retried(api, stub):
+    stub.state.settings.fail_next = 1
+    
+    response = run(api, api.aget_post_status("abc"))
+    
+    assert response.success
+    assert stub.state.request_count == 2
+    assert api.circuit_breaker.state == CircuitBreaker.CLOSED
+
+def test_retries_stop_at_max_retries(api, stub):
+    stub.state.settings.fail_next = 10
+    
+    response = run(api, api.aget_post_status("abc"))
+    
+    assert not response.success
+    assert stub.state.request_count == api.max_retries + 1
+
+def test_post_creation_without_idempotency_key_is_not_retried(api, stub):
+    from models import PatientInfo
+    patient = PatientInfo(
+        problem_description="Sharp pain in a lower molar", location="75201",
+        patient_name="Test Patient", phone="555-123-4567"
+    )
+    stub.state.settings.fail_next = 1
+    
+    response = run(api, api.acreate_patient_post(patient))
+    
+    assert not response.success
+    assert stub.state.request_count == 1
+
+def test_breaker_opens_after_repeated_failures_and_recovers(api, stub):
+    api.max_retries = 0
+    stub.state.settings.down = True
+    
+    for _ in range(3):
+        assert not run(api, api.aget_post_status("abc")).success
+    assert api.circuit_breaker.state == CircuitBreaker.OPEN
+    
+    # While open, calls fail fast without reaching the server
+    sent = stub.state.request_count
+    response = run(api, api.aget_post_status("abc"))
+    assert response.error == "CIRCUIT_OPEN"
+    assert stub.state.request_count == sent
+    
+    # After the reset timeout a trial call goes through and closes the circuit
+    stub.state.settings.down = False
+    time.sleep(0.25)
+    assert api.circuit_breaker.state == CircuitBreaker.HALF_OPEN
+    assert run(api, api.aget_post_status("abc")).success
+    assert api.circuit_breaker.state == CircuitBreaker.CLOSED
+
+def test_failed_trial_call_reopens_the_breaker(api, stub):
+    api.max_retries = 0
+    stub.state.settings.down = True
+    for _ in range(3):
+        run(api, api.aget_post_status("abc"))
+    
+    time.sleep(0.25)
+    assert not run(api, api.aget_post_status("abc")).success
+    assert api.circuit_breaker.state == CircuitBreaker.OPEN
+
+def test_pooled_client_is_reused_and_closed(api):
+    async def calls():
+        await api.aget_post_status("a")
+        client = api._clients[asyncio.get_running_loop()]
+        await api.aget_post_status("b")
+        assert api._clients[asyncio.get_running_loop()] is client
+        
+        await api.aclose()
+        return client
+    
+    client = asyncio.run(calls())
+    
+    assert client.is_closed
+    assert not api._clients
+
+def test_cancelled_trial_call_releases_the_half_open_breaker(api, stub):
+    api.max_retries = 0
+    stub.state.settings.down = True
+    for _ in range(3):
+        run(api, api.aget_post_status("abc"))
+    
+    # The trial call is still waiting on the slow server when it is cancelled
+    stub.state.settings.down = False
+    stub.state.settings.latency = 0.5
+    time.sleep(0.25)
+    with pytest.raises(asyncio.TimeoutError):
+        run(api, asyncio.wait_for(api.aget_post_status("abc"), timeout=0.05))
+    assert api.circuit_breaker.allow_request()
+    api.circuit_breaker.release_trial()
+    
+    stub.state.settings.latency = 0.0
+    assert run(api, api.aget_post_status("abc")).success
+    assert api.circuit_breaker.state == CircuitBreaker.CLOSED
+
+def test_clients_of_closed_loops_are_dropped(api):
+    # Without aclose() the client stays registered for its loop
+    asyncio.run(api.aget_post_status("a"))
+    asyncio.run(api.aget_post_status("b"))
+    
+    async def current_clients():
+        await api.aget_post_status("c")
+        loops = list(api._clients)
+        await api.aclose()
+        return loops
+    
+    assert len(asyncio.run(current_clients())) == 1
@@ -0,0 +1,115 @@
+"""
+DentistDirectory grid search against brute-force haversine, and the .npy round trip
+"""
+import json
+import os
+
+import numpy as np
+import pytest
+
+from dentist_directory import (
+    SYNTHETIC_METROS, DentistDirectory, generate_synthetic_directory, haversine_miles
+)
+
+# Dentists this close to the radius may land on either side of it through rounding
+BOUNDARY_MILES = 0.01
+
+QUERIES = [
+    (32.78, -96.80),      # Dallas center
+    (40.60, -74.20),      # off-center in New York
+    (47.50, -122.25),     # near a cell edge in Seattle
+    (25.76, -80.19),
+    (37.00, -100.00)      # nowhere near a metro
+]
+
+@pytest.fixture(scope="module", params=[0.25, 0.05], ids=["default-cells", "small-cells"])
+def directory(request):
+    return generate_synthetic_directory(3000, zips_per_metro=40, seed=3, cell_degrees=request.param)
+
+def brute_force(directory: DentistDirectory, lat: float, lon: float, radius_miles: float,
+                emergency_only: bool = False):
+    """Every dentist within the radius by haversine over the whole roster, with its distance"""
+    distances = haversine_miles(lat, lon, directory.dentists["lat"], directory.dentists["lon"])
+    mask = distances <= radius_miles
+    if emergency_only:
+        mask &= directory.dentists["emergency"]
+    indices = np.flatnonzero(mask)
+    return indices, distances[indices], distances
+
+@pytest.mark.parametrize("lat, lon", QUERIES)
+@pytest.mark.parametrize("radius_miles", [1, 5, 25, 60])
+@pytest.mark.parametrize("emergency_only", [False, True])
+def test_grid_search_finds_what_brute_force_finds(directory, lat, lon, radius_miles, emergency_only):
+    expected, _, all_distances = brute_force(directory, lat, lon, radius_miles, emergency_only)
+    
+    found, distances = directory.search_near(lat, lon, radius_miles, emergency_only, limit=len(directory))
+    
+    near_boundary = np.flatnonzero(np.abs(all_distances - radius_miles) < BOUNDARY_MILES)
+    assert set(found) - set(near_boundary) == set(expected) - set(near_boundary)
+    np.testing.assert_allclose(distances, all_distances[found], atol=1e-3)
+    assert np.all(np.diff(distances) >= 0)
+
+@pytest.mark.parametrize("lat, lon", QUERIES[:3])
+def test_nearest_results_match_brute_force(directory, lat, lon):
+    expected, expected_distances, _ = brute_force(directory, lat, lon, 25)
+    nearest = expected[np.argsort(expected_distances, kind="stable")][:10]
+    
+    found, distances = directory.search_near(lat, lon, 25, limit=10)
+    
+    assert len(found) == min(10, len(expected))
+    np.testing.assert_allclose(distances, np.sort(expected_distances)[:10], atol=1e-3)
+    assert list(found) == list(nearest)
+
+@pytest.mark.parametrize("lat, lon", QUERIES[:3])
+def test_rating_order_matches_brute_force(directory, lat, lon):
+    expected, expected_distances, _ = brute_force(directory, lat, lon, 25)
+    ratings = directory.dentists["rating"][expected]
+    best = expected[np.lexsort((expected_distances, -ratings))][:10]
+    
+    found, _ = directory.search_near(lat, lon, 25, limit=10, order_by="rating")
+    
+    assert list(found) == list(best)
+
+def test_search_by_zip_uses_its_centroid(directory):
+    prefix, lat, lon = SYNTHETIC_METROS[0]
+    
+    results = directory.search(f"{prefix}01", radius_miles=10, limit=5)
+    
+    found, distances = directory.search_near(lat, lon, 10, limit=5)
+    assert [result["distance"] for result in results] == [f"{distance:.1f} miles" for distance in distances]
+    assert directory.search("00000") is None
+    assert directory.search("not a zip") is None
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_and_load_round_trip(directory, tmp_path, mmap):
+    path = str(tmp_path / "directory")
+    directory.save(path)
+    
+    loaded = DentistDirectory.load(path, mmap=mmap)
+    
+    assert len(loaded) == len(directory)
+    assert loaded.cell_degrees == directory.cell_degrees
+    for name in ("zip_codes", "zip_lat", "zip_lon", "cell_ids", "cell_offsets"):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(directory, name))
+    for name in DentistDirectory.DENTIST_COLUMNS:
+        np.testing.assert_array_equal(loaded.dentists[name], directory.dentists[name])
+        assert loaded.dentists[name].dtype == directory.dentists[name].dtype
+    if mmap:
+        assert isinstance(loaded.dentists["lat"], np.memmap)
+    
+    prefix = SYNTHETIC_METROS[2][0]
+    assert loaded.search(f"{prefix}01", 25) == directory.search(f"{prefix}01", 25)
+    assert loaded.search(f"{prefix}01", 25, order_by="rating") == directory.search(f"{prefix}01", 25, order_by="rating")
+
+def test_load_rejects_other_format_versions(directory, tmp_path):
+    path = str(tmp_path / "directory")
+    directory.save(path)
+    meta_path = os.path.join(path, "meta.json")
+    with open(meta_path) as handle:
+        meta = json.load(handle)
+    meta["version"] += 1
+    with open(meta_path, "w") as handle:
+        json.dump(meta, handle)
+    
+    with pytest.raises(ValueError):
+        DentistDirectory.load(path)
@@ -0,0 +1,153 @@
+"""
+PostOutbox and OutboxWorker on a temporary SQLite file with a poster that fails a set number of times
+"""
+import asyncio
+import time
+
+import pytest
+
+import outbox as outbox_module
+from models import APIResponse, PatientInfo
+from outbox import DEAD, DELIVERED, IN_PROGRESS, PENDING, OutboxWorker, PostOutbox
+
+PATIENT = PatientInfo(
+    problem_description="Broken front tooth", location="75201",
+    patient_name="Test Patient", phone="555-123-4567"
+)
+
+class FlakyPoster:
+    """Fails the first `failures` posts with a 503, then creates them"""
+    
+    def __init__(self, failures: int = 0, status_code: int = 503):
+        self.failures = failures
+        self.status_code = status_code
+        self.keys = []
+    
+    async def acreate_patient_post(self, patient_info: PatientInfo, idempotency_key=None) -> APIResponse:
+        self.keys.append(idempotency_key)
+        if len(self.keys) <= self.failures:
+            return APIResponse(success=False, message="Failed to create post", error=f"HTTP {self.status_code}",
+                               data={"status_code": self.status_code})
+        return APIResponse(success=True, message="Post created", data={"post_id": idempotency_key[:8]})
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "outbox.db")
+
+def make_outbox(db_path: str, **overrides) -> PostOutbox:
+    settings = {"max_attempts": 3, "lease_seconds": 30, "backoff_base": 0.001, "backoff_max": 0.005}
+    settings.update(overrides)
+    return PostOutbox(db_path, **settings)
+
+def deliver(outbox: PostOutbox, poster: FlakyPoster, session_id: str = "s1", timeout: float = 5):
+    """Enqueue one post, run a worker until it is delivered or dead-lettered, and return the entry"""
+    async def run():
+        worker = OutboxWorker(outbox, poster, concurrency=1, poll_interval=0.02)
+        worker.start()
+        try:
+            entry = outbox.enqueue(session_id, PATIENT)
+            outcome = worker.watch(entry.idempotency_key)
+            worker.wake()
+            return await asyncio.wait_for(worker.wait_for(entry, outcome), timeout)
+        finally:
+            await worker.stop()
+    return asyncio.run(run())
+
+def test_claimed_entry_is_leased_to_one_worker(db_path):
+    worker_a, worker_b = make_outbox(db_path), make_outbox(db_path)
+    entry = worker_a.enqueue("s1", PATIENT)
+    
+    claimed = worker_a.claim()
+    
+    assert [claimed_entry.entry_id for claimed_entry in claimed] == [entry.entry_id]
+    assert claimed[0].status == IN_PROGRESS
+    assert claimed[0].attempts == 1
+    assert worker_b.claim() == []
+    assert worker_a.claim() == []
+
+def test_expired_lease_is_reclaimed(db_path):
+    worker_a = make_outbox(db_path, lease_seconds=0.05)
+    worker_b = make_outbox(db_path, lease_seconds=0.05)
+    entry = worker_a.enqueue("s1", PATIENT)
+    worker_a.claim()
+    
+    # Worker A dies without marking the entry
+    assert worker_b.claim() == []
+    time.sleep(0.1)
+    
+    reclaimed = worker_b.claim()
+    assert [claimed_entry.entry_id for claimed_entry in reclaimed] == [entry.entry_id]
+    assert reclaimed[0].attempts == 2
+
+def test_same_session_is_enqueued_once(db_path):
+    outbox = make_outbox(db_path)
+    
+    first = outbox.enqueue("s1", PATIENT)
+    second = outbox.enqueue("s1", PATIENT)
+    
+    assert second.entry_id == first.entry_id
+    assert second.idempotency_key == first.idempotency_key
+    assert outbox.get_metrics()['depth'] == 1
+    assert outbox.enqueue("s2", PATIENT).idempotency_key != first.idempotency_key
+
+def test_retries_send_the_same_idempotency_key(db_path):
+    outbox = make_outbox(db_path)
+    poster = FlakyPoster(failures=2)
+    
+    entry = deliver(outbox, poster)
+    
+    assert entry.status == DELIVERED
+    assert entry.attempts == 3
+    assert len(poster.keys) == 3
+    assert set(poster.keys) == {entry.idempotency_key}
+    assert outbox.get(entry.idempotency_key).post_id == entry.idempotency_key[:8]
+
+def test_failed_attempt_backs_off_exponentially(db_path, monkeypatch):
+    # Always take the top of the jitter range
+    monkeypatch.setattr(outbox_module.random, "uniform", lambda low, high: high)
+    outbox = make_outbox(db_path, backoff_base=10, backoff_max=25)
+    outbox.enqueue("s1", PATIENT)
+    
+    delays = []
+    for _ in range(3):
+        entry = outbox.claim()[0]
+        outbox.mark_failed(entry, "HTTP 503")
+        assert entry.status == (PENDING if entry.attempts < outbox.max_attempts else DEAD)
+        delays.append(outbox.next_due_in())
+        assert outbox.claim() == []
+        # Skip the wait
+        outbox._connection().execute("UPDATE post_outbox SET next_attempt_at = 0 WHERE status = ?", (PENDING,))
+    
+    assert delays[0] == pytest.approx(10, abs=1)
+    assert delays[1] == pytest.approx(20, abs=1)
+    # The third failure uses up max_attempts, so nothing is left waiting
+    assert delays[2] is None
+
+def test_entry_is_dead_lettered_after_max_attempts(db_path):
+    outbox = make_outbox(db_path)
+    poster = FlakyPoster(failures=10)
+    
+    entry = deliver(outbox, poster)
+    
+    assert entry.status == DEAD
+    assert len(poster.keys) == outbox.max_attempts
+    assert entry.last_error == "HTTP 503"
+    metrics = outbox.get_metrics()
+    assert metrics['dead_lettered'] == 1
+    assert metrics['depth'] == 0
+    
+    # Requeued after the outage, the entry is delivered with the same key
+    assert outbox.requeue_dead() == 1
+    poster.failures = 0
+    poster.keys = []
+    assert deliver(outbox, poster).status == DELIVERED
+    assert poster.keys == [entry.idempotency_key]
+
+def test_client_error_is_dead_lettered_without_retrying(db_path):
+    outbox = make_outbox(db_path)
+    poster = FlakyPoster(failures=1, status_code=422)
+    
+    entry = deliver(outbox, poster)
+    
+    assert entry.status == DEAD
+    assert len(poster.keys) == 1
@@ -0,0 +1,122 @@
+"""
+SQLiteSessionStore with two store instances on one database file, standing in for two workers
+"""
+import time
+
+import pytest
+
+from models import ConversationHistory, PatientInfo
+from session_store import SQLiteSessionStore
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "sessions.db")
+
+@pytest.fixture
+def stores(db_path):
+    """Two workers sharing the same database"""
+    return SQLiteSessionStore(db_path), SQLiteSessionStore(db_path)
+
+def new_conversation(session_id: str, turns: int = 0) -> ConversationHistory:
+    conversation = ConversationHistory(session_id=session_id)
+    for index in range(turns):
+        conversation.add_turn("user" if index % 2 == 0 else "assistant", f"message {index}")
+    return conversation
+
+def turn_rows(store: SQLiteSessionStore, session_id: str):
+    return store._connection().execute(
+        "SELECT rowid, seq, message FROM turns WHERE session_id = ? ORDER BY seq", (session_id,)
+    ).fetchall()
+
+def test_turns_are_appended_not_rewritten(stores):
+    worker_a, _ = stores
+    conversation = new_conversation("s1", turns=2)
+    worker_a.save(conversation)
+    first_rows = turn_rows(worker_a, "s1")
+    
+    conversation.add_turn("user", "message 2")
+    worker_a.save(conversation)
+    
+    rows = turn_rows(worker_a, "s1")
+    assert rows[:2] == first_rows
+    assert [(seq, message) for _, seq, message in rows] == [(0, "message 0"), (1, "message 1"), (2, "message 2")]
+    assert conversation._persisted_turns == 3
+    
+    # A save without new turns writes no turn rows
+    worker_a.save(conversation)
+    assert turn_rows(worker_a, "s1") == rows
+
+def test_other_worker_loads_only_the_new_turns(stores):
+    worker_a, worker_b = stores
+    worker_a.save(new_conversation("s1", turns=2))
+    
+    seen_by_b = worker_b.get("s1")
+    assert worker_b.get_metrics()['full_loads'] == 1
+    
+    seen_by_a = worker_a.get("s1")
+    seen_by_a.add_turn("user", "from a")
+    worker_a.save(seen_by_a)
+    
+    reloaded = worker_b.get("s1")
+    assert reloaded is seen_by_b
+    assert [turn.message for turn in reloaded.turns] == ["message 0", "message 1", "from a"]
+    assert reloaded.get_conversation_text() == seen_by_a.get_conversation_text()
+    assert worker_b.get_metrics()['tail_loads'] == 1
+    
+    # Worker B's next save appends after A's turn instead of overwriting it
+    reloaded.add_turn("assistant", "from b")
+    worker_b.save(reloaded)
+    assert [message for _, _, message in turn_rows(worker_a, "s1")][-2:] == ["from a", "from b"]
+
+def test_cached_copy_is_refreshed_when_the_version_changes(stores):
+    worker_a, worker_b = stores
+    worker_a.save(new_conversation("s1", turns=1))
+    
+    worker_b.get("s1")
+    worker_b.get("s1")
+    assert worker_b.get_metrics()['hits'] == 1
+    
+    # A change without new turns still bumps the version
+    conversation = worker_a.get("s1")
+    conversation.patient_info = PatientInfo(problem_description="Cracked tooth")
+    conversation.is_complete = True
+    worker_a.save(conversation)
+    
+    refreshed = worker_b.get("s1")
+    assert refreshed.patient_info.problem_description == "Cracked tooth"
+    assert refreshed.is_complete
+    assert len(refreshed.turns) == 1
+    assert worker_b.get_metrics()['hits'] == 1
+
+def test_least_recently_used_session_is_evicted(db_path):
+    worker_a = SQLiteSessionStore(db_path, max_sessions=2)
+    worker_b = SQLiteSessionStore(db_path, max_sessions=2)
+    
+    worker_a.save(new_conversation("s1", turns=1))
+    time.sleep(0.01)
+    worker_b.save(new_conversation("s2", turns=1))
+    time.sleep(0.01)
+    assert worker_b.get("s1") is not None
+    time.sleep(0.01)
+    worker_a.save(new_conversation("s3", turns=1))
+    
+    assert sorted(worker_b.keys()) == ["s1", "s3"]
+    assert worker_b.get("s2") is None
+    assert turn_rows(worker_b, "s2") == []
+    assert worker_a.get_metrics()['evicted'] == 1
+
+def test_idle_sessions_expire(db_path):
+    worker_a = SQLiteSessionStore(db_path, ttl_seconds=0.05)
+    worker_b = SQLiteSessionStore(db_path, ttl_seconds=0.05)
+    worker_a.save(new_conversation("s1", turns=2))
+    worker_a.save(new_conversation("s2", turns=1))
+    assert worker_b.get("s1") is not None
+    
+    time.sleep(0.1)
+    
+    assert worker_b.get("s1") is None
+    assert turn_rows(worker_a, "s1") == []
+    assert worker_b.get_metrics()['expired'] == 1
+    
+    assert worker_a.cleanup_expired() == 1
+    assert len(worker_b) == 0
@@ -0,0 +1,61 @@
+"""
+TextScanner parity with the previous per-pattern regexes on a representative corpus
+"""
+import random
+
+import pytest
+
+from benchmarks.bench_text_scanner import (
+    TYPICAL_MESSAGES, legacy_scan, pathological_messages, scanner_scan
+)
+
+EDGE_CASES = [
+    "",
+    "Pain level 12, no wait, it's a 7",
+    "Scale of 1 to 10? I'd say 100",
+    "Pain\n8 out of 10",
+    "8 out of 10\npain since last night",
+    "3 out of ten, level 6",
+    "On a scale from 0 to 10 it's a 0",
+    "The pain started 2 weeks ago, before that a mild ache for 3 days",
+    "Since this morning, for 1 month, 4 years ago",
+    "for2days it has hurt, level:9",
+    "My tooth was knocked out!! Can't eat, can't sleep.",
+    "Swelling is spreading and my jaw is swollen",
+    "EXCRUCIATING. Unbearable. 10/10",
+    "Horrible, awful, terrible, moderate, slight",
+    "I painted my house 5 years ago and now there's pain",
+    "Thanks, that's it. Ready to proceed, create the post",
+    "thats all\nnothing else\nall set",
+    "Call 415-555-0123 about the 94105 office, pain 4",
+    "level\n5, scale\n6, pain\n7",
+    "123456 pain",
+    "Today it is worse than yesterday"
+]
+
+FRAGMENTS = [
+    "pain", "level", "scale", "out of", "10", "of", "7", "15", "0", "3",
+    "day", "weeks", "ago", "for", "since", "started", "yesterday", "last night",
+    "this morning", "severe", "mild", "bleeding", "broken", "thanks", "that's all",
+    "tooth", "my", "is", "\n", ",", ".", "!", "about"
+]
+
+def random_messages(count: int, seed: int = 7):
+    """Messages stitched together from keyword and filler fragments"""
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        words = rng.choices(FRAGMENTS, k=rng.randint(1, 14))
+        separators = rng.choices([" ", "", "  "], weights=[8, 1, 1], k=len(words))
+        messages.append("".join(word + separator for word, separator in zip(words, separators)))
+    return messages
+
+CORPUS = TYPICAL_MESSAGES + EDGE_CASES + [text for _, text in pathological_messages(120)]
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_scanner_matches_the_previous_regexes(text):
+    assert scanner_scan(text) == legacy_scan(text)
+
+def test_scanner_matches_the_previous_regexes_on_generated_messages():
+    mismatches = [text for text in random_messages(3000) if scanner_scan(text) != legacy_scan(text)]
+    assert mismatches == []
@@ -0,0 +1,103 @@
+"""
+ConversationHistory's incremental transcript against a full rebuild from the turns
+"""
+import pytest
+
+from models import ConversationHistory, ConversationTurn
+from session_store import SQLiteSessionStore
+
+WINDOWS = [(None, None), (0, None), (1, None), (17, None), (40, None), (10000, None),
+           (None, 0), (None, 1), (None, 3), (25, 2), (500, 4)]
+
+def rebuild(conversation: ConversationHistory, max_chars=None, max_turns=None) -> str:
+    """Transcript tail built from scratch, the way it was before the incremental rendering"""
+    turns = conversation.turns
+    if max_turns is not None:
+        turns = turns[max(len(turns) - max_turns, 0):]
+    text = "".join(f"{turn.role.title()}: {turn.message}\n" for turn in turns)
+    if max_chars is None:
+        return text
+    return text[-max_chars:] if max_chars > 0 else ""
+
+def assert_matches_rebuild(conversation: ConversationHistory):
+    assert conversation.get_conversation_text() == rebuild(conversation)
+    turn_count = len(conversation.turns)
+    assert conversation._line_ends == [
+        len(rebuild(conversation)) - len(rebuild(conversation, max_turns=turn_count - index - 1))
+        for index in range(turn_count)
+    ]
+    for max_chars, max_turns in WINDOWS:
+        assert conversation.get_transcript_tail(max_chars, max_turns) == rebuild(conversation, max_chars, max_turns)
+
+def conversation_with(turns: int, session_id: str = "s1") -> ConversationHistory:
+    conversation = ConversationHistory(session_id=session_id)
+    for index in range(turns):
+        conversation.add_turn("user" if index % 2 == 0 else "assistant", f"message number {index} " + "x" * index)
+    return conversation
+
+def test_tail_matches_rebuild_after_each_append():
+    conversation = ConversationHistory(session_id="s1")
+    assert_matches_rebuild(conversation)
+    
+    for index in range(12):
+        conversation.add_turn("user" if index % 2 == 0 else "assistant", f"line {index}\nwith a break")
+        assert_matches_rebuild(conversation)
+    
+    # Earlier lines are kept, not rendered again
+    first_line = conversation._lines[0]
+    conversation.add_turn("user", "last")
+    assert_matches_rebuild(conversation)
+    assert conversation._lines[0] is first_line
+
+def test_turns_appended_to_the_list_directly_are_rendered():
+    conversation = conversation_with(3)
+    assert_matches_rebuild(conversation)
+    
+    conversation.turns.extend([ConversationTurn(role="user", message="added by the store")] * 2)
+    assert_matches_rebuild(conversation)
+
+@pytest.mark.parametrize("keep", [0, 1, 4])
+def test_tail_matches_rebuild_after_truncation(keep):
+    conversation = conversation_with(8)
+    assert_matches_rebuild(conversation)
+    
+    del conversation.turns[keep:]
+    assert_matches_rebuild(conversation)
+    
+    conversation.add_turn("user", "after truncation")
+    assert_matches_rebuild(conversation)
+
+def test_tail_matches_rebuild_after_the_turn_list_is_replaced():
+    conversation = conversation_with(6)
+    assert_matches_rebuild(conversation)
+    
+    # Same length, different turns
+    conversation.turns = [ConversationTurn(role="assistant", message=f"replaced {index}") for index in range(6)]
+    assert_matches_rebuild(conversation)
+
+def test_tail_matches_rebuild_after_reload_from_the_session_store(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    writer, reader = SQLiteSessionStore(db_path), SQLiteSessionStore(db_path)
+    conversation = conversation_with(5)
+    writer.save(conversation)
+    
+    loaded = reader.get("s1")
+    assert loaded.get_conversation_text() == conversation.get_conversation_text()
+    assert_matches_rebuild(loaded)
+    
+    # Turns added by the other worker arrive as a tail load onto the rendered copy
+    conversation.add_turn("user", "one more")
+    writer.save(conversation)
+    reloaded = reader.get("s1")
+    assert reloaded is loaded
+    assert_matches_rebuild(reloaded)
+    assert reloaded.get_transcript_tail(30) == conversation.get_transcript_tail(30)
+
+def test_tail_matches_rebuild_after_serialization_round_trip():
+    conversation = conversation_with(5)
+    conversation.get_conversation_text()
+    
+    restored = ConversationHistory.parse_raw(conversation.json())
+    
+    assert_matches_rebuild(restored)
+    assert restored.get_conversation_text() == conversation.get_conversation_text()
@@ -0,0 +1,268 @@
+"""
+Single-pass keyword and pattern scanner for patient messages
+"""
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Descriptive pain words, checked in order
+PAIN_DESCRIPTIONS = {
+    'mild': 2,
+    'slight': 2,
+    'moderate': 5,
+    'severe': 8,
+    'extreme': 9,
+    'excruciating': 10,
+    'unbearable': 10,
+    'terrible': 8,
+    'awful': 7,
+    'horrible': 8
+}
+
+EMERGENCY_KEYWORDS = [
+    'emergency', 'urgent', 'severe', 'excruciating', 'unbearable',
+    'swollen', 'swelling', 'infection', 'abscess', 'bleeding',
+    'knocked out', 'broken', 'fractured', 'trauma', 'accident',
+    'can\'t eat', 'can\'t sleep', 'getting worse', 'spreading'
+]
+
+TIME_KEYWORDS = ['yesterday', 'today', 'this morning', 'last night']
+
+COMPLETION_SIGNALS = [
+    "that's all", "thats all", "that's it", "thank you",
+    "thanks", "nothing else", "no more questions",
+    "all set", "ready to proceed", "create the post"
+]
+
+# Words used by the numeric pain patterns and the "for 3 days" time pattern
+CONTEXT_WORDS = ['pain', 'level', 'scale', 'out', 'of', 'for']
+
+class ScanResult(NamedTuple):
+    """Everything the scanner found in one message"""
+    pain_level: Optional[int]
+    is_emergency: bool
+    time_frame: Optional[str]
+    has_completion_signal: bool
+
+class _Line:
+    """Keyword and digit-run positions within one line of text"""
+    __slots__ = ('keywords', 'digit_runs')
+    
+    def __init__(self):
+        self.keywords: Dict[str, List[int]] = {}
+        self.digit_runs: List[Tuple[int, int]] = []
+
+class TextScanner:
+    """
+    Find pain levels, emergency keywords, time frames and completion signals
+    in a single pass over the text
+    
+    All keywords are compiled into one alternation inside a lookahead, so a
+    single finditer reports every (possibly overlapping) keyword plus every
+    digit run and line break. The work per position is bounded by the keyword
+    set, and the follow-up checks only look at what that pass reported, so the
+    cost is linear in the length of the text. That holds even on inputs where
+    the lazy ".*?" patterns in the old implementation backtrack heavily.
+    
+    Results match the previous DataValidator regexes, including their quirks:
+    numeric pain patterns do not cross line breaks, and a pattern whose first
+    match is out of range falls through to the next pattern.
+    """
+    
+    TIME_UNIT = r'(?:day|week|month|year)'
+    
+    def __init__(self):
+        keywords = set(PAIN_DESCRIPTIONS) | set(EMERGENCY_KEYWORDS) | set(TIME_KEYWORDS)
+        keywords |= set(COMPLETION_SIGNALS) | set(CONTEXT_WORDS)
+        
+        # At one position the alternation reports only the longest keyword, so
+        # remember which shorter keywords it starts with
+        self._matched_words = {
+            keyword: (keyword,) + tuple(
+                other for other in keywords if other != keyword and keyword.startswith(other)
+            )
+            for keyword in keywords
+        }
+        
+        alternation = self._trie_pattern(keywords)
+        self._pattern = re.compile(rf'(?=(?P<kw>{alternation}))|(?<!\d)(?P<num>\d+)|(?P<nl>\n)')
+        
+        self._ago_pattern = re.compile(rf'\d+\s*{self.TIME_UNIT}s?\s*ago')
+        self._for_pattern = re.compile(rf'for\s+\d+\s*{self.TIME_UNIT}s?')
+    
+    @staticmethod
+    def _trie_pattern(keywords) -> str:
+        """
+        Build a regex alternation shaped like a trie of the keywords
+        
+        Each position then costs at most one character comparison per trie
+        level instead of one per keyword, and longer keywords win because every
+        continuation is tried before the keyword that ends at its node.
+        """
+        trie: Dict = {}
+        for keyword in keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[''] = {}
+        
+        def build(node: Dict) -> str:
+            branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+            if not branches:
+                return ''
+            body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+            if '' in node:
+                return '(?:' + body + ')?'
+            return body
+        
+        return build(trie)
+    
+    def scan(self, text: str) -> ScanResult:
+        """
+        Scan a message
+        
+        Args:
+            text: Raw message text
+        
+        Returns:
+            ScanResult with the pain level, emergency flag, time frame and completion flag
+        """
+        text_lower = text.lower()
+        
+        lines = [_Line()]
+        found = set()
+        first_seen: Dict[str, int] = {}
+        all_digit_runs: List[Tuple[int, int]] = []
+        
+        for match in self._pattern.finditer(text_lower):
+            keyword = match.group('kw')
+            if keyword is not None:
+                position = match.start()
+                for word in self._matched_words[keyword]:
+                    found.add(word)
+                    first_seen.setdefault(word, position)
+                    lines[-1].keywords.setdefault(word, []).append(position)
+            elif match.group('num') is not None:
+                run = match.span('num')
+                lines[-1].digit_runs.append(run)
+                all_digit_runs.append(run)
+            else:
+                lines.append(_Line())
+        
+        return ScanResult(
+            pain_level=self._pain_level(text_lower, lines, found),
+            is_emergency=any(keyword in found for keyword in EMERGENCY_KEYWORDS),
+            time_frame=self._time_frame(text_lower, all_digit_runs, first_seen, lines),
+            has_completion_signal=any(signal in found for signal in COMPLETION_SIGNALS)
+        )
+    
+    @staticmethod
+    def _capture(text: str, run: Tuple[int, int], start: int) -> int:
+        """Emulate the greedy (\\d{1,2}) capture starting at `start` inside a digit run"""
+        end = min(start + 2, run[1])
+        return int(text[start:end])
+    
+    def _first_digit_after(self, text: str, line: _Line, word: str) -> Optional[int]:
+        """word.*?(\\d{1,2}) within one line"""
+        positions = line.keywords.get(word)
+        if not positions:
+            return None
+        
+        after = positions[0] + len(word)
+        for run in line.digit_runs:
+            if run[0] >= after:
+                return self._capture(text, run, run[0])
+        return None
+    
+    def _first_digit_before(self, text: str, line: _Line, before: Optional[int]) -> Optional[int]:
+        """(\\d{1,2}).*?X within one line, where X can start no earlier than `before`"""
+        if before is None or not line.digit_runs:
+            return None
+        
+        run = line.digit_runs[0]
+        if run[0] < before:
+            return self._capture(text, run, run[0])
+        return None
+    
+    def _last_ten(self, text: str, line: _Line) -> Optional[int]:
+        """Start of the last "10" in a line"""
+        for run in reversed(line.digit_runs):
+            offset = text.rfind("10", run[0], run[1])
+            if offset != -1:
+                return offset
+        return None
+    
+    @staticmethod
+    def _last_before(positions: Optional[List[int]], length: int, limit: Optional[int]) -> Optional[int]:
+        """Start of the last occurrence that ends at or before `limit`"""
+        if not positions or limit is None:
+            return None
+        for position in reversed(positions):
+            if position + length <= limit:
+                return position
+        return None
+    
+    def _pain_level(self, text: str, lines: List[_Line], found: set) -> Optional[int]:
+        """Equivalent of the numeric pain patterns followed by the descriptive words"""
+        numeric_patterns = [
+            # pain.*?(\d{1,2})
+            lambda line: self._first_digit_after(text, line, 'pain'),
+            # (\d{1,2}).*?pain
+            lambda line: self._first_digit_before(
+                text, line, line.keywords['pain'][-1] if 'pain' in line.keywords else None
+            ),
+            # (\d{1,2}).*?out.*?of.*?10
+            lambda line: self._first_digit_before(
+                text, line,
+                self._last_before(
+                    line.keywords.get('out'), 3,
+                    self._last_before(line.keywords.get('of'), 2, self._last_ten(text, line))
+                )
+            ),
+            # level.*?(\d{1,2})
+            lambda line: self._first_digit_after(text, line, 'level'),
+            # scale.*?(\d{1,2})
+            lambda line: self._first_digit_after(text, line, 'scale')
+        ]
+        
+        # Every numeric pattern needs a digit
+        if any(line.digit_runs for line in lines):
+            for pattern in numeric_patterns:
+                for line in lines:
+                    level = pattern(line)
+                    if level is not None:
+                        if 1 <= level <= 10:
+                            return level
+                        break
+        
+        for description, level in PAIN_DESCRIPTIONS.items():
+            if description in found:
+                return level
+        
+        return None
+    
+    def _time_frame(self, text: str, digit_runs: List[Tuple[int, int]],
+                    first_seen: Dict[str, int], lines: List[_Line]) -> Optional[str]:
+        """Equivalent of DataValidator's time patterns, in the same priority order"""
+        # (\d+)\s*(day|week|month|year)s?\s*ago
+        for run in digit_runs:
+            match = self._ago_pattern.match(text, run[0])
+            if match:
+                return match.group(0)
+        
+        # (yesterday|today|this morning|last night); "since ..." and "started ... ago"
+        # can only match where one of the patterns before them already has
+        seen = [(first_seen[keyword], keyword) for keyword in TIME_KEYWORDS if keyword in first_seen]
+        if seen:
+            return min(seen)[1]
+        
+        # for\s+(\d+)\s*(day|week|month|year)s?
+        for line in lines:
+            for position in line.keywords.get('for', []):
+                match = self._for_pattern.match(text, position)
+                if match:
+                    return match.group(0)
+        
+        return None
+
+# Global instance
+text_scanner = TextScanner()
@@ -0,0 +1,468 @@
+"""
+Lightweight request tracing for DentalChat AI Automation
+
+A span is one timed stage of a turn (extraction, an LLM call, a DentalChat
+request...) with attributes such as the session ID, model, token counts and
+HTTP status. The current span is kept in a context variable, so spans
+opened in nested calls and in tasks they create become its children.
+
+Sampling is decided once per trace at the root span: an unsampled trace
+costs a context variable lookup per span and nothing is exported. Finished
+spans are queued and exported in batches by a background thread, to a JSONL
+file or to an OTLP/HTTP collector.
+
+Print the slowest traces in a JSONL file as span trees:
+    python -m tracing traces.jsonl --slowest 5
+"""
+import argparse
+import atexit
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import httpx
+
+from config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("dentalchat_current_span", default=None)
+
+class Span:
+    """A recorded stage; use as a context manager to make it current while it runs"""
+    
+    __slots__ = ('tracer', 'name', 'trace_id', 'span_id', 'parent_id', 'start_ns', 'end_ns',
+                 'attributes', 'status', '_previous')
+    
+    sampled = True
+    
+    def __init__(self, tracer: "Tracer", name: str, trace_id: str, parent_id: Optional[str],
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.status = "ok"
+        self._previous = None
+        if attributes:
+            self.set_attributes(attributes)
+    
+    def set_attribute(self, key: str, value: Any):
+        """Set an attribute; None values are skipped"""
+        if value is not None:
+            self.attributes[key] = value
+    
+    def set_attributes(self, attributes: Dict[str, Any]):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+    
+    def record_usage(self, message: Any):
+        """Copy token counts from a model response's usage_metadata"""
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            self.attributes["llm.prompt_tokens"] = usage.get("input_tokens", 0)
+            self.attributes["llm.completion_tokens"] = usage.get("output_tokens", 0)
+    
+    def record_error(self, error: BaseException):
+        # Only the type: exception messages can echo patient details
+        self.status = "error"
+        self.attributes["error.type"] = type(error).__name__
+    
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.tracer._export(self)
+    
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attributes": self.attributes
+        }
+    
+    def __enter__(self) -> "Span":
+        self._previous = _current_span.get()
+        _current_span.set(self)
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        # Restore the parent rather than reset a token: a span held open across
+        # the steps of an async generator can end in a different context
+        _current_span.set(self._previous)
+        if exc is not None and not isinstance(exc, (GeneratorExit, asyncio.CancelledError)):
+            self.record_error(exc)
+        self.end()
+        return False
+
+class _NonRecordingSpan:
+    """Stands in for an unsampled root so its children know to skip recording"""
+    
+    sampled = False
+    
+    def __init__(self):
+        self._previous = None
+    
+    def set_attribute(self, key: str, value: Any):
+        pass
+    
+    def set_attributes(self, attributes: Dict[str, Any]):
+        pass
+    
+    def record_usage(self, message: Any):
+        pass
+    
+    def record_error(self, error: BaseException):
+        pass
+    
+    def end(self):
+        pass
+    
+    def __enter__(self) -> "_NonRecordingSpan":
+        self._previous = _current_span.get()
+        _current_span.set(self)
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        _current_span.set(self._previous)
+        return False
+
+class _NoopSpan(_NonRecordingSpan):
+    """Shared span for disabled tracing and children of unsampled traces"""
+    
+    def __enter__(self) -> "_NoopSpan":
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+NOOP_SPAN = _NoopSpan()
+
+class JSONLSpanExporter:
+    """Append finished spans to a file, one JSON object per line"""
+    
+    def __init__(self, path: str, service_name: str):
+        self.path = path
+        self.service_name = service_name
+    
+    def export(self, spans: List[Span]):
+        lines = []
+        for span in spans:
+            record = span.to_dict()
+            record["service"] = self.service_name
+            lines.append(json.dumps(record, default=str))
+        with open(self.path, "a") as handle:
+            handle.write("\n".join(lines) + "\n")
+    
+    def close(self):
+        pass
+
+class OTLPSpanExporter:
+    """
+    Send finished spans to an OpenTelemetry collector over OTLP/HTTP JSON
+    
+    endpoint is the collector's traces URL, usually
+    http://<collector>:4318/v1/traces.
+    """
+    
+    def __init__(self, endpoint: str, service_name: str, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.client = httpx.Client(timeout=timeout)
+    
+    def export(self, spans: List[Span]):
+        response = self.client.post(self.endpoint, json=self._payload(spans))
+        response.raise_for_status()
+    
+    def close(self):
+        self.client.close()
+    
+    def _payload(self, spans: List[Span]) -> Dict[str, Any]:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{
+                "scope": {"name": "dentalchat.tracing"},
+                "spans": [self._otlp_span(span) for span in spans]
+            }]
+        }]}
+    
+    @staticmethod
+    def _otlp_span(span: Span) -> Dict[str, Any]:
+        otlp = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            # SERVER for the turn itself, INTERNAL for the stages inside it
+            "kind": 2 if span.parent_id is None else 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in span.attributes.items()],
+            "status": {"code": 2 if span.status == "error" else 1}
+        }
+        if span.parent_id:
+            otlp["parentSpanId"] = span.parent_id
+        return otlp
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+class Tracer:
+    """
+    Creates spans and exports the sampled ones from a background thread
+    
+    Without an exporter every span is NOOP_SPAN. Finished spans wait in a
+    bounded queue; when the exporter falls behind, new spans are dropped
+    and counted rather than slowing requests down.
+    """
+    
+    def __init__(self, exporter: Optional[Any] = None, sample_rate: float = 1.0,
+                 max_queue_size: int = 4096, batch_size: int = 256, flush_interval: float = 1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(max_queue_size)
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._stats = {'exported': 0, 'dropped': 0, 'export_errors': 0}
+        
+        if exporter is not None:
+            atexit.register(self.shutdown)
+            if hasattr(os, "register_at_fork"):
+                os.register_at_fork(after_in_child=self._after_fork)
+    
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+    
+    def span(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        """
+        Start a span as a child of the current one, or a new trace
+            
+            with tracer.span("llm.reply", {"llm.model": model}) as span:
+                response = await chain.ainvoke(...)
+                span.record_usage(response)
+        """
+        if self.exporter is None:
+            return NOOP_SPAN
+        
+        parent = _current_span.get()
+        if parent is None:
+            if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+                return _NonRecordingSpan()
+            return Span(self, name, f"{random.getrandbits(128):032x}", None, attributes)
+        
+        if not parent.sampled:
+            return NOOP_SPAN
+        return Span(self, name, parent.trace_id, parent.span_id, attributes)
+    
+    def traced(self, name: str, attributes: Optional[Dict[str, Any]] = None) -> Callable:
+        """Decorator that runs each call of a plain or async function in a span"""
+        def decorator(func: Callable) -> Callable:
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def traced_async(*args, **kwargs):
+                    with self.span(name, attributes):
+                        return await func(*args, **kwargs)
+                return traced_async
+            
+            @functools.wraps(func)
+            def traced_sync(*args, **kwargs):
+                with self.span(name, attributes):
+                    return func(*args, **kwargs)
+            return traced_sync
+        return decorator
+    
+    @staticmethod
+    def current_span():
+        """The span running now, or NOOP_SPAN, for adding attributes from nested code"""
+        return _current_span.get() or NOOP_SPAN
+    
+    @staticmethod
+    @contextmanager
+    def activate(span) -> Iterator[Any]:
+        """
+        Make an already started span current without ending it
+        
+        For async generators, whose steps may run in different tasks: wrap
+        each step so spans opened inside it attach to the right parent.
+        """
+        previous = _current_span.get()
+        _current_span.set(span)
+        try:
+            yield span
+        finally:
+            _current_span.set(previous)
+    
+    def _export(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self._count('dropped')
+            return
+        if self._worker is None:
+            self._start_worker()
+    
+    def _count(self, stat_name: str, amount: int = 1):
+        # Request threads count drops while the exporter thread counts exports
+        with self._lock:
+            self._stats[stat_name] += amount
+    
+    def _start_worker(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._worker.start()
+    
+    def _run(self):
+        while True:
+            batch: List[Span] = []
+            stopping = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    span = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if span is None:
+                    stopping = True
+                    break
+                batch.append(span)
+            
+            if batch:
+                try:
+                    self.exporter.export(batch)
+                    self._count('exported', len(batch))
+                except Exception as e:
+                    self._count('export_errors')
+                    logger.warning(f"Dropped {len(batch)} spans, export failed: {e}")
+            if stopping:
+                return
+    
+    def shutdown(self, timeout: float = 5.0):
+        """Export what is queued, then stop the exporter thread"""
+        worker = self._worker
+        if worker is not None and worker.is_alive():
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+            worker.join(timeout)
+        self._worker = None
+        if self.exporter is not None:
+            self.exporter.close()
+    
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        return stats
+    
+    def _after_fork(self):
+        # The exporter thread did not survive the fork; queued spans belong to the parent
+        self._queue = queue.Queue(self._queue.maxsize)
+        self._lock = threading.Lock()
+        self._worker = None
+
+def llm_attributes(llm: Any) -> Dict[str, Any]:
+    """Span attributes describing a chat model"""
+    return {"llm.model": getattr(llm, "model_name", None) or getattr(llm, "model", None)}
+
+def build_configured_tracer() -> Tracer:
+    """Tracer for the TRACE_* settings; tracing is off unless TRACE_EXPORTER is set"""
+    exporter_name = Config.TRACE_EXPORTER.lower()
+    if exporter_name == "jsonl":
+        exporter = JSONLSpanExporter(Config.TRACE_JSONL_PATH, Config.TRACE_SERVICE_NAME)
+    elif exporter_name == "otlp":
+        exporter = OTLPSpanExporter(Config.TRACE_OTLP_ENDPOINT, Config.TRACE_SERVICE_NAME)
+    else:
+        if exporter_name not in ("", "none"):
+            logger.warning(f"Unknown TRACE_EXPORTER {Config.TRACE_EXPORTER!r}, tracing disabled")
+        exporter = None
+    return Tracer(exporter, sample_rate=Config.TRACE_SAMPLE_RATE)
+
+def load_traces(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Spans from a JSONL export, grouped by trace ID"""
+    traces: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    with open(path) as handle:
+        for line in handle:
+            if line.strip():
+                span = json.loads(line)
+                traces[span["trace_id"]].append(span)
+    return traces
+
+def format_trace(spans: List[Dict[str, Any]]) -> str:
+    """Render one trace as an indented tree with durations and attributes"""
+    children: Dict[Optional[str], List[Dict[str, Any]]] = defaultdict(list)
+    span_ids = {span["span_id"] for span in spans}
+    for span in spans:
+        # Spans whose parent was not exported are shown at the top level
+        parent = span["parent_id"] if span["parent_id"] in span_ids else None
+        children[parent].append(span)
+    
+    lines = []
+    
+    def walk(parent_id: Optional[str], depth: int):
+        for span in sorted(children[parent_id], key=lambda item: item["start_ns"]):
+            attributes = " ".join(f"{key}={value}" for key, value in span["attributes"].items())
+            marker = " ERROR" if span["status"] == "error" else ""
+            lines.append(f"{'  ' * depth}{span['name']:<{40 - 2 * depth}} {span['duration_ms']:>9.1f} ms{marker}  {attributes}")
+            walk(span["span_id"], depth + 1)
+    
+    walk(None, 0)
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the slowest traces in a JSONL span export")
+    parser.add_argument("path", nargs="?", default=Config.TRACE_JSONL_PATH)
+    parser.add_argument("--slowest", type=int, default=5, help="number of traces to show")
+    args = parser.parse_args()
+    
+    traces = load_traces(args.path)
+    
+    def trace_duration(spans: List[Dict[str, Any]]) -> float:
+        return (max(span["end_ns"] for span in spans) - min(span["start_ns"] for span in spans)) / 1e6
+    
+    ranked = sorted(traces.values(), key=trace_duration, reverse=True)
+    print(f"{len(traces)} traces in {args.path}")
+    for spans in ranked[:args.slowest]:
+        print(f"\ntrace {spans[0]['trace_id']} ({trace_duration(spans):.1f} ms)")
+        print(format_trace(spans))
+
+# Global instance
+tracer = build_configured_tracer()
+
+if __name__ == "__main__":
+    main()
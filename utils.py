@@ -3,13 +3,22 @@ Utility functions for DentalChat AI Automation
 """
 import re
 import json
+import time
 import uuid
-from datetime import datetime, timezone
-from typing import Dict, Any, List, Optional, Union
+import asyncio
+import functools
+import threading
+from typing import Dict, Any, Callable, List, Optional, Sequence, Tuple, Union, Awaitable, AsyncIterator, Iterator, TypeVar
 import logging
 
+from config import Config
+from metrics import LatencyHistogram, ShardedMetrics
+from structured_logging import log_pipeline
+
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 class TextProcessor:
     """Text processing utilities"""
     
@@ -61,48 +70,6 @@ class TextProcessor:
         match = re.search(zip_pattern, text)
         return match.group(0) if match else None
 
-class SessionManager:
-    """Manage conversation sessions"""
-    
-    def __init__(self):
-        self.sessions: Dict[str, Dict[str, Any]] = {}
-    
-    def create_session(self, user_id: Optional[str] = None) -> str:
-        """Create a new session"""
-        session_id = str(uuid.uuid4())
-        
-        self.sessions[session_id] = {
-            'created_at': datetime.now(timezone.utc),
-            'user_id': user_id,
-            'last_activity': datetime.now(timezone.utc),
-            'metadata': {}
-        }
-        
-        return session_id
-    
-    def update_session_activity(self, session_id: str):
-        """Update last activity timestamp"""
-        if session_id in self.sessions:
-            self.sessions[session_id]['last_activity'] = datetime.now(timezone.utc)
-    
-    def get_session_info(self, session_id: str) -> Optional[Dict[str, Any]]:
-        """Get session information"""
-        return self.sessions.get(session_id)
-    
-    def cleanup_expired_sessions(self, max_age_hours: int = 24):
-        """Remove expired sessions"""
-        cutoff_time = datetime.now(timezone.utc).timestamp() - (max_age_hours * 3600)
-        
-        expired_sessions = [
-            session_id for session_id, session_data in self.sessions.items()
-            if session_data['last_activity'].timestamp() < cutoff_time
-        ]
-        
-        for session_id in expired_sessions:
-            del self.sessions[session_id]
-        
-        logger.info(f"Cleaned up {len(expired_sessions)} expired sessions")
-
 class ResponseFormatter:
     """Format responses for different output types"""
     
@@ -212,57 +179,329 @@ class LoggingUtils:
     """Logging utilities"""
     
     @staticmethod
-    def setup_logging(level: str = "INFO", log_file: Optional[str] = None):
-        """Setup logging configuration"""
-        log_level = getattr(logging, level.upper(), logging.INFO)
+    def setup_logging(level: str = Config.LOG_LEVEL, log_file: Optional[str] = Config.LOG_FILE or None):
+        """
+        Setup logging configuration
         
-        handlers = [logging.StreamHandler()]
-        if log_file:
-            handlers.append(logging.FileHandler(log_file))
-        
-        logging.basicConfig(
-            level=log_level,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=handlers
+        Records go through the queue, sampling and redaction of
+        structured_logging.log_pipeline; dropped records are counted in
+        the log_records_dropped metric.
+        """
+        log_pipeline.setup(
+            level,
+            log_file,
+            on_drop=lambda: performance_monitor.increment_metric('log_records_dropped')
         )
     
     @staticmethod
     def log_conversation_turn(session_id: str, role: str, message: str):
-        """Log conversation turn for monitoring"""
-        logger.info(f"Session {session_id[:8]} - {role}: {message[:100]}...")
+        """Log conversation turn for monitoring (the message text is redacted)"""
+        log_pipeline.event(logger, "conversation.turn", session=session_id[:8], role=role, message=message[:100])
     
     @staticmethod
     def log_api_call(endpoint: str, success: bool, response_time: float):
         """Log API call metrics"""
-        status = "SUCCESS" if success else "FAILED"
-        logger.info(f"API {endpoint} - {status} - {response_time:.2f}s")
+        log_pipeline.event(
+            logger, "api.call", level=logging.INFO if success else logging.WARNING,
+            endpoint=endpoint, success=success, seconds=round(response_time, 3)
+        )
+
+class StageTimer:
+    """
+    Time a block or a function into a PerformanceMonitor latency histogram
+    
+    Works as a context manager (with or async with) and as a decorator for
+    plain and async functions. The duration is recorded even if the block
+    raises.
+    """
+    
+    def __init__(self, monitor: "PerformanceMonitor", stage: str):
+        self.monitor = monitor
+        self.stage = stage
+        self.elapsed: Optional[float] = None
+        self._start = 0.0
+    
+    def __enter__(self) -> "StageTimer":
+        self._start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.elapsed = time.perf_counter() - self._start
+        self.monitor.observe_latency(self.stage, self.elapsed)
+        return False
+    
+    async def __aenter__(self) -> "StageTimer":
+        return self.__enter__()
+    
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        return self.__exit__(exc_type, exc, tb)
+    
+    def __call__(self, func: Callable) -> Callable:
+        # A fresh timer per call, so concurrent calls don't share a start time
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def timed_async(*args, **kwargs):
+                with StageTimer(self.monitor, self.stage):
+                    return await func(*args, **kwargs)
+            return timed_async
+        
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            with StageTimer(self.monitor, self.stage):
+                return func(*args, **kwargs)
+        return timed
 
 class PerformanceMonitor:
-    """Monitor application performance"""
+    """
+    Monitor application performance
     
-    def __init__(self):
-        self.metrics = {
-            'conversations_started': 0,
-            'conversations_completed': 0,
-            'posts_created': 0,
-            'api_calls': 0,
-            'errors': 0
-        }
+    Values are recorded into per-thread shards without locking and merged
+    when read (see metrics.ShardedMetrics). With shared_dir set, reads
+    cover every worker process that publishes to that directory.
+    """
+    
+    # Upper bounds in seconds, from a rule-based extraction to a slow API call
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
     
-    def increment_metric(self, metric_name: str):
+    METRIC_NAMES = (
+        'conversations_started',
+        'conversations_completed',
+        'posts_created',
+        'api_calls',
+        'errors',
+        'extraction_llm_calls',
+        'extraction_llm_skipped',
+        'extraction_cache_hits',
+        'extraction_cache_misses',
+        'log_records_dropped'
+    )
+    
+    def __init__(self, latency_buckets: Optional[Sequence[float]] = None,
+                 shared_dir: Optional[str] = None, publish_interval: float = 1.0):
+        self.latency_buckets = tuple(sorted(latency_buckets or self.LATENCY_BUCKETS))
+        self._metric_names = frozenset(self.METRIC_NAMES)
+        self._core = ShardedMetrics(self.latency_buckets, shared_dir, publish_interval)
+    
+    def increment_metric(self, metric_name: str, amount: int = 1):
         """Increment a performance metric"""
-        if metric_name in self.metrics:
-            self.metrics[metric_name] += 1
+        if metric_name in self._metric_names:
+            counters = self._core.shard().counters
+            counters[metric_name] = counters.get(metric_name, 0) + amount
+    
+    def observe(self, name: str, value: float):
+        """Record a measured value such as a latency in seconds"""
+        observations = self._core.shard().observations
+        stats = observations.get(name)
+        if stats is None:
+            stats = observations[name] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += value
+        if value > stats[2]:
+            stats[2] = value
+    
+    def observe_latency(self, stage: str, seconds: float):
+        """Record how long one run of a stage took, into that stage's histogram"""
+        histograms = self._core.shard().histograms
+        histogram = histograms.get(stage)
+        if histogram is None:
+            histogram = histograms[stage] = LatencyHistogram(self.latency_buckets)
+        histogram.observe(seconds)
+    
+    def timer(self, stage: str) -> StageTimer:
+        """
+        Time a stage, as a context manager or decorator
+            
+            with performance_monitor.timer("reply"):
+                ...
+            
+            @performance_monitor.timer("extraction")
+            async def aextract_turn(...):
+                ...
+        """
+        return StageTimer(self, stage)
+    
+    def record_tokens(self, call_site: str, prompt_tokens: int, completion_tokens: int):
+        """Count the tokens one LLM call used"""
+        tokens = self._core.shard().tokens
+        counts = tokens.get(call_site)
+        if counts is None:
+            counts = tokens[call_site] = [0, 0, 0]
+        counts[0] += 1
+        counts[1] += prompt_tokens
+        counts[2] += completion_tokens
+    
+    def record_usage(self, call_site: str, message: Any):
+        """Count tokens from a model response's usage_metadata, if it reports any"""
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            self.record_tokens(call_site, usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+    
+    def get_mean(self, name: str) -> Optional[float]:
+        """Get the mean of an observed value, or None if never observed"""
+        stats = self._core.read_all()['observations'].get(name)
+        if not stats or not stats[0]:
+            return None
+        return stats[1] / stats[0]
+    
+    def get_percentile(self, stage: str, pct: float) -> Optional[float]:
+        """Estimated latency percentile for a stage, or None if never timed"""
+        data = self._core.read_all()['histograms'].get(stage)
+        if data is None:
+            return None
+        return LatencyHistogram.from_snapshot(self.latency_buckets, data).percentile(pct)
     
     def get_metrics(self) -> Dict[str, int]:
         """Get current metrics"""
-        return self.metrics.copy()
+        counters = self._core.read_all()['counters']
+        return {name: counters.get(name, 0) for name in self.METRIC_NAMES}
+    
+    def get_observations(self) -> Dict[str, Dict[str, float]]:
+        """Get a copy of all observed value summaries"""
+        return {
+            name: {'count': count, 'total': total, 'max': maximum}
+            for name, (count, total, maximum) in self._core.read_all()['observations'].items()
+        }
+    
+    def get_latency_summary(self) -> Dict[str, Dict[str, float]]:
+        """Count, total, max and estimated p50/p95/p99 per stage"""
+        return {
+            stage: LatencyHistogram.from_snapshot(self.latency_buckets, data).summary()
+            for stage, data in self._core.read_all()['histograms'].items()
+        }
+    
+    def get_token_counts(self) -> Dict[str, Dict[str, int]]:
+        """Calls and prompt/completion tokens per LLM call site"""
+        return {
+            call_site: {'calls': calls, 'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens}
+            for call_site, (calls, prompt_tokens, completion_tokens) in self._core.read_all()['tokens'].items()
+        }
+    
+    def render_prometheus(self, namespace: str = "dentalchat") -> str:
+        """
+        Render everything in the Prometheus text exposition format
+        
+        Counters become <namespace>_<name>_total, observe() values become
+        untyped _count/_sum/_max series, stage latencies one histogram
+        labelled by stage, and token usage one counter labelled by call
+        site and kind.
+        """
+        snapshot = self._core.read_all()
+        
+        lines = []
+        for name in self.METRIC_NAMES:
+            metric = f"{namespace}_{_metric_name(name)}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {snapshot['counters'].get(name, 0)}"]
+        
+        for name, (count, total, maximum) in sorted(snapshot['observations'].items()):
+            metric = f"{namespace}_{_metric_name(name)}"
+            lines += [
+                f"# TYPE {metric} untyped",
+                f"{metric}_count {count}",
+                f"{metric}_sum {_format_value(total)}",
+                f"{metric}_max {_format_value(maximum)}"
+            ]
+        
+        if snapshot['histograms']:
+            metric = f"{namespace}_stage_latency_seconds"
+            lines += [f"# HELP {metric} Time spent per request stage", f"# TYPE {metric} histogram"]
+            for stage, data in sorted(snapshot['histograms'].items()):
+                histogram = LatencyHistogram.from_snapshot(self.latency_buckets, data)
+                label = _label_value(stage)
+                for bound, cumulative in histogram.cumulative_counts():
+                    lines.append(f'{metric}_bucket{{stage="{label}",le="{_format_value(bound)}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{stage="{label}"}} {_format_value(histogram.total)}')
+                lines.append(f'{metric}_count{{stage="{label}"}} {histogram.count}')
+        
+        if snapshot['tokens']:
+            metric = f"{namespace}_llm_tokens_total"
+            calls_metric = f"{namespace}_llm_calls_total"
+            lines += [f"# HELP {metric} Tokens used per LLM call site", f"# TYPE {metric} counter"]
+            for call_site, (_, prompt_tokens, completion_tokens) in sorted(snapshot['tokens'].items()):
+                label = _label_value(call_site)
+                lines.append(f'{metric}{{call_site="{label}",kind="prompt"}} {prompt_tokens}')
+                lines.append(f'{metric}{{call_site="{label}",kind="completion"}} {completion_tokens}')
+            lines.append(f"# TYPE {calls_metric} counter")
+            for call_site, (calls, _, _) in sorted(snapshot['tokens'].items()):
+                lines.append(f'{calls_metric}{{call_site="{_label_value(call_site)}"}} {calls}')
+        
+        return "\n".join(lines) + "\n"
+    
+    def publish(self):
+        """Write this process's metrics to the shared directory now"""
+        self._core.publish()
     
     def reset_metrics(self):
-        """Reset all metrics"""
-        for key in self.metrics:
-            self.metrics[key] = 0
+        """Reset all metrics recorded by this process"""
+        self._core.reset()
+
+def _metric_name(name: str) -> str:
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+def _label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+class AsyncRunner:
+    """Run coroutines from synchronous code on one long-lived event loop"""
+    
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+    
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the background loop thread on first use"""
+        with self._lock:
+            if self._loop is None or not self._thread.is_alive():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name="async-runner",
+                    daemon=True
+                )
+                self._thread.start()
+            return self._loop
+    
+    def run(self, coro: Awaitable[T]) -> T:
+        """
+        Block until the coroutine finishes on the background loop.
+        
+        Keeping a single loop alive (instead of asyncio.run per call) lets
+        async HTTP clients reuse their pooled connections across calls.
+        """
+        loop = self._ensure_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            raise RuntimeError("AsyncRunner.run() cannot be called from its own event loop; await the coroutine instead")
+        
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+    
+    def iterate(self, agen: AsyncIterator[T]) -> Iterator[T]:
+        """
+        Consume an async generator from synchronous code, one item at a time
+        
+        If the consumer stops early (closes this generator or drops it), the
+        async generator is closed on the loop so its cleanup still runs.
+        """
+        try:
+            while True:
+                try:
+                    yield self.run(agen.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            self.run(agen.aclose())
 
 # Global instances
-session_manager = SessionManager()
-performance_monitor = PerformanceMonitor()
\ No newline at end of file
+async_runner = AsyncRunner()
+performance_monitor = PerformanceMonitor(
+    shared_dir=Config.METRICS_SHARED_DIR,
+    publish_interval=Config.METRICS_PUBLISH_SECONDS
+)
\ No newline at end of file
@@ -6,6 +6,7 @@ import phonenumbers
 from email_validator import validate_email, EmailNotValidError
 from typing import Tuple, Optional
 from config import Config
+from text_scanner import text_scanner
 
 class ValidationError(Exception):
     """Custom validation error"""
@@ -132,76 +133,18 @@ class DataValidator:
         """
         Extract pain level from natural language text
         """
-        text_lower = text.lower()
-        
-        # Look for explicit numbers with pain context
-        pain_patterns = [
-            r'pain.*?(\d{1,2})',
-            r'(\d{1,2}).*?pain',
-            r'(\d{1,2}).*?out.*?of.*?10',
-            r'level.*?(\d{1,2})',
-            r'scale.*?(\d{1,2})'
-        ]
-        
-        for pattern in pain_patterns:
-            match = re.search(pattern, text_lower)
-            if match:
-                level = int(match.group(1))
-                if 1 <= level <= 10:
-                    return level
-        
-        # Look for descriptive pain levels
-        pain_descriptions = {
-            'mild': 2,
-            'slight': 2,
-            'moderate': 5,
-            'severe': 8,
-            'extreme': 9,
-            'excruciating': 10,
-            'unbearable': 10,
-            'terrible': 8,
-            'awful': 7,
-            'horrible': 8
-        }
-        
-        for description, level in pain_descriptions.items():
-            if description in text_lower:
-                return level
-        
-        return None
+        return text_scanner.scan(text).pain_level
     
     @staticmethod
     def detect_emergency_keywords(text: str) -> bool:
         """
         Detect emergency keywords in text
         """
-        emergency_keywords = [
-            'emergency', 'urgent', 'severe', 'excruciating', 'unbearable',
-            'swollen', 'swelling', 'infection', 'abscess', 'bleeding',
-            'knocked out', 'broken', 'fractured', 'trauma', 'accident',
-            'can\'t eat', 'can\'t sleep', 'getting worse', 'spreading'
-        ]
-        
-        text_lower = text.lower()
-        return any(keyword in text_lower for keyword in emergency_keywords)
+        return text_scanner.scan(text).is_emergency
     
     @staticmethod
     def extract_time_frame(text: str) -> Optional[str]:
         """
         Extract when symptoms started from text
         """
-        time_patterns = [
-            r'(\d+)\s*(day|week|month|year)s?\s*ago',
-            r'(yesterday|today|this morning|last night)',
-            r'since\s+(yesterday|today|this morning|last night)',
-            r'for\s+(\d+)\s*(day|week|month|year)s?',
-            r'started\s+(\d+)\s*(day|week|month|year)s?\s*ago'
-        ]
-        
-        text_lower = text.lower()
-        for pattern in time_patterns:
-            match = re.search(pattern, text_lower)
-            if match:
-                return match.group(0)
-        
-        return None
\ No newline at end of file
+        return text_scanner.scan(text).time_frame
\ No newline at end of file